@@ -1,13 +1,15 @@
 """
 Adaptador para convertir modelos del backend a formato del frontend
 """
-from typing import List, Dict
+from typing import List, Dict, Optional
 import random
 from app.models import (
     Cliente, PerfilSocial, Segmento, Campaña, ResultadoCampaña,
     PerfilSocialFrontend, SegmentoFrontend, CampañaFrontend,
-    AgentResult, LogEntry, EstadoAgente
+    AgentResult, EstadoAgente, Estado
 )
+from app.eventos import Plantilla
+from app.reglas import ReglasCompiladas, gestor_reglas
 
 
 def perfil_to_frontend(perfil: PerfilSocial) -> PerfilSocialFrontend:
@@ -41,41 +43,23 @@ def perfil_to_frontend(perfil: PerfilSocial) -> PerfilSocialFrontend:
     )
 
 
-def segmento_to_frontend(segmento: Segmento, cliente: Cliente, perfil: PerfilSocial) -> SegmentoFrontend:
+def segmento_to_frontend(
+    segmento: Segmento,
+    cliente: Cliente,
+    perfil: PerfilSocial,
+    reglas: Optional[ReglasCompiladas] = None
+) -> SegmentoFrontend:
     """Convierte Segmento del backend al formato del frontend"""
-    # Calcular score basado en múltiples factores
-    score = 50  # Base
-    
-    # Factores de gasto
-    if cliente.gasto_promedio > 500:
-        score += 25
-    elif cliente.gasto_promedio > 200:
-        score += 15
-    else:
-        score += 5
-    
-    # Factores de riesgo
+    reglas = reglas or gestor_reglas.actual
     riesgo_lower = cliente.riesgo.lower()
-    if riesgo_lower == "bajo":
-        score += 15
-    elif riesgo_lower == "medio":
-        score += 5
-    else:
-        score -= 10
     
-    # Factores de actividad social
-    if perfil.señales.actividad == "alta":
-        score += 10
-    elif perfil.señales.actividad == "media":
-        score += 5
-    
-    # Engagement
-    if perfil.señales.engagement_promedio > 0.08:
-        score += 10
-    elif perfil.señales.engagement_promedio > 0.04:
-        score += 5
-    
-    score = max(0, min(100, score))
+    # Score según los factores de gasto, riesgo, actividad y engagement del archivo de reglas
+    score = reglas.puntuar(
+        cliente.gasto_promedio,
+        riesgo_lower,
+        perfil.señales.actividad,
+        perfil.señales.engagement_promedio
+    )
     
     # Generar rationale
     rationales = {
@@ -90,7 +74,8 @@ def segmento_to_frontend(segmento: Segmento, cliente: Cliente, perfil: PerfilSoc
     return SegmentoFrontend(
         tipo=segmento.value,
         score=score,
-        rationale=rationale
+        rationale=rationale,
+        reglas_version=reglas.version
     )
 
 
@@ -127,42 +112,29 @@ def estado_to_agent_result(
     perfil_frontend = perfil_to_frontend(estado.perfil_social)
     
     # Convertir segmento
-    segmento_frontend = segmento_to_frontend(estado.segmento, estado.cliente, estado.perfil_social)
+    segmento_frontend = segmento_to_frontend(
+        estado.segmento,
+        estado.cliente,
+        estado.perfil_social,
+        gestor_reglas.obtener(estado.reglas_version)
+    )
     
     # Convertir campaña
     campaña_frontend = campaña_to_frontend(estado.campaña, mensaje_base)
     
-    # Convertir logs
-    logs_frontend = [
-        LogEntry(
-            state=log.get("estado", "UNKNOWN"),
-            timestamp=log.get("timestamp", ""),
-            message=log.get("mensaje", ""),
-            data=log.get("data")
-        )
-        for log in estado.logs
-    ]
-    
-    # Agregar log FIN si no existe
-    if not any(log.state == "FIN" for log in logs_frontend):
-        from datetime import datetime
-        logs_frontend.append(
-            LogEntry(
-                state="FIN",
-                timestamp=datetime.now().isoformat(),
-                message=f"Proceso completado exitosamente para {estado.cliente.nombre}",
-                data=None
-            )
-        )
+    # Los logs viajan como bitácora y se formatean al serializar la respuesta
+    logs = estado.logs.copia()
+    if not logs.contiene(Estado.FIN):
+        logs.registrar(Estado.FIN, Plantilla.PROCESO_COMPLETADO, estado.cliente.nombre)
     
     return AgentResult(
         cliente=estado.cliente,
         perfil=perfil_frontend,
         segmento=segmento_frontend,
         campaña=campaña_frontend,
-        logs=logs_frontend,
+        logs=logs,
         htmlOutput=estado.resultado.mensaje_html,
         sessionId=session_id,
-        timestamp=logs_frontend[-1].timestamp if logs_frontend else None
+        timestamp=logs.timestamp()
     )
 
@@ -0,0 +1,107 @@
+"""
+Caché de respuestas del LLM
+El prompt de segmentación solo depende de las características del cliente
+(sector, gasto, riesgo, red social, intereses, actividad y engagement), así
+que la respuesta se guarda con una clave derivada de esas características
+normalizadas, el modelo y la versión del prompt, en la misma caché LRU con
+TTL y capa SQLite opcional que los perfiles (ver app/cache_ttl.py).
+"""
+import hashlib
+import json
+import os
+import time
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+from app.cache_ttl import CacheTTL, CapaSQLite
+from app.models import Cliente, PerfilSocial
+
+# Cambiarla cuando cambie el texto del prompt: invalida las respuestas anteriores
+VERSION_PROMPT_SEGMENTO = "segmento-v1"
+
+
+def clave_llm(cliente: Cliente, perfil: PerfilSocial, modelo: str, version_prompt: str = VERSION_PROMPT_SEGMENTO) -> str:
+    """
+    Clave de caché de la consulta de segmento de un cliente
+
+    El nombre y el id no entran: dos clientes con las mismas características
+    reciben la misma respuesta. Textos en minúsculas, intereses ordenados y
+    números redondeados para que diferencias irrelevantes no fallen la caché.
+
+    Args:
+        cliente: Datos del cliente
+        perfil: Perfil social del cliente
+        modelo: Nombre del modelo que responde
+        version_prompt: Versión del texto del prompt
+
+    Returns:
+        Hash hexadecimal de la consulta normalizada
+    """
+    señales = perfil.señales
+    caracteristicas = [
+        modelo,
+        version_prompt,
+        cliente.sector.strip().lower(),
+        round(float(cliente.gasto_promedio), 2),
+        cliente.riesgo.strip().lower(),
+        cliente.red_social.strip().lower(),
+        sorted(i.strip().lower() for i in señales.intereses),
+        señales.actividad.strip().lower(),
+        round(float(señales.engagement_promedio), 4)
+    ]
+    datos = json.dumps(caracteristicas, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.blake2b(datos.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class CacheRespuestasLLM(CacheTTL):
+    """LRU con TTL de respuestas del LLM, con capa SQLite opcional"""
+
+    def __init__(
+        self,
+        ttl_segundos: float = 86_400,
+        max_entradas: int = 10_000,
+        ruta_sqlite: Optional[str] = None,
+        reloj: Callable[[], float] = time.time
+    ):
+        """
+        Args:
+            ttl_segundos: Vigencia de cada respuesta; 0 desactiva la caché
+            max_entradas: Máximo de respuestas en memoria (se descarta la menos usada)
+            ruta_sqlite: Archivo SQLite para la capa en disco (None = solo memoria)
+            reloj: Fuente de tiempo en segundos (inyectable para pruebas)
+        """
+        # La respuesta ya es texto: se guarda tal cual
+        crear_disco = (lambda: CapaSQLite(ruta_sqlite, "respuestas_llm", ("clave",), str, str)) if ruta_sqlite else None
+        super().__init__(ttl_segundos, max_entradas, reloj, crear_disco)
+
+    @classmethod
+    def desde_entorno(cls) -> "CacheRespuestasLLM":
+        """Crea la caché con LLM_CACHE_TTL, LLM_CACHE_MAX y LLM_CACHE_SQLITE"""
+        return cls(
+            ttl_segundos=float(os.getenv("LLM_CACHE_TTL", "86400")),
+            max_entradas=int(os.getenv("LLM_CACHE_MAX", "10000")),
+            ruta_sqlite=os.getenv("LLM_CACHE_SQLITE") or None
+        )
+
+    def obtener(self, clave: str) -> Optional[str]:
+        """
+        Busca una respuesta vigente en memoria y luego en disco
+
+        Args:
+            clave: Ver clave_llm
+
+        Returns:
+            La respuesta o None si no está o expiró
+        """
+        return super().obtener(clave)
+
+    def guardar(self, respuestas: Sequence[Tuple[str, str]]):
+        """Guarda pares (clave, respuesta) en memoria y en disco"""
+        self._guardar_pares(respuestas)
+
+    def estadisticas(self) -> Dict:
+        """Contadores de uso de la caché (cada hit es una llamada al LLM evitada)"""
+        return super().estadisticas()
+
+
+# Instancia global, compartida por todos los orquestadores del proceso
+cache_llm = CacheRespuestasLLM.desde_entorno()
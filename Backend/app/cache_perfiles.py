@@ -0,0 +1,186 @@
+"""
+Caché de perfiles sociales
+Guarda el perfil de cada cliente por (id_cliente, red_social, huella de los
+datos que usa el perfilador) con TTL, en un LRU acotado en memoria y,
+opcionalmente, en una segunda capa SQLite en disco (ver app/cache_ttl.py).
+Si el CSV cambia el sector, el gasto o el riesgo de un cliente, su perfil
+anterior deja de servirse.
+"""
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.cache_ttl import CacheTTL, CapaSQLite
+from app.models import Cliente, PerfilSocial
+from app.perfilador_social import VERSION_GENERADOR
+
+ClavePerfil = Tuple[str, str, str]
+
+# Campos del cliente, además del id y la red social, de los que depende su perfil
+CAMPOS_PERFIL = ("sector", "gasto_promedio", "riesgo")
+
+
+def origen_perfiles(seed: Optional[int] = None) -> str:
+    """Semilla (por defecto PERFILES_SEED) y versión del generador que produjeron los perfiles"""
+    seed = int(seed if seed is not None else os.getenv("PERFILES_SEED", "42"))
+    return f"seed={seed};gen={VERSION_GENERADOR}"
+
+
+def clave_perfil(cliente: Cliente, origen: str = "") -> ClavePerfil:
+    """
+    Clave de caché de un cliente: (id_cliente, red_social en minúsculas, huella)
+
+    La huella combina el origen (ver origen_perfiles) con CAMPOS_PERFIL: un
+    cambio de semilla o de generador no sirve perfiles generados con otros.
+    """
+    huella = "|".join([origen, *(repr(getattr(cliente, campo)) for campo in CAMPOS_PERFIL)])
+    return cliente.id_cliente, cliente.red_social.lower(), huella
+
+
+def _capa_perfiles(ruta: str) -> CapaSQLite:
+    """Una fila por (id_cliente, red_social): la de un cliente cuyos datos cambiaron se reemplaza"""
+    return CapaSQLite(
+        ruta, "perfiles", ("id_cliente", "red_social", "huella"),
+        serializar=PerfilSocial.model_dump_json,
+        deserializar=PerfilSocial.model_validate_json,
+        primaria=2
+    )
+
+
+class CachePerfiles(CacheTTL):
+    """LRU con TTL de perfiles sociales, con capa SQLite opcional"""
+
+    def __init__(
+        self,
+        ttl_segundos: float = 300,
+        max_entradas: int = 10_000,
+        ruta_sqlite: Optional[str] = None,
+        reloj: Callable[[], float] = time.time,
+        origen: Optional[str] = None
+    ):
+        """
+        Args:
+            ttl_segundos: Vigencia de cada perfil; 0 desactiva la caché
+            max_entradas: Máximo de perfiles en memoria (se descarta el menos usado)
+            ruta_sqlite: Archivo SQLite para la capa en disco (None = solo memoria)
+            reloj: Fuente de tiempo en segundos (inyectable para pruebas)
+            origen: Semilla y generador de los perfiles (por defecto origen_perfiles())
+        """
+        self.origen = origen if origen is not None else origen_perfiles()
+        crear_disco = (lambda: _capa_perfiles(ruta_sqlite)) if ruta_sqlite else None
+        super().__init__(ttl_segundos, max_entradas, reloj, crear_disco)
+
+    @classmethod
+    def desde_entorno(cls) -> "CachePerfiles":
+        """Crea la caché con PERFILES_CACHE_TTL, PERFILES_CACHE_MAX y PERFILES_CACHE_SQLITE"""
+        return cls(
+            ttl_segundos=float(os.getenv("PERFILES_CACHE_TTL", "300")),
+            max_entradas=int(os.getenv("PERFILES_CACHE_MAX", "10000")),
+            ruta_sqlite=os.getenv("PERFILES_CACHE_SQLITE") or None
+        )
+
+    def obtener(self, clave: ClavePerfil) -> Optional[PerfilSocial]:
+        """
+        Busca un perfil vigente en memoria y luego en disco
+
+        Args:
+            clave: (id_cliente, red_social, huella), ver clave_perfil
+
+        Returns:
+            El perfil o None si no está o expiró
+        """
+        return super().obtener(clave)
+
+    def guardar(self, clientes: Sequence[Cliente], perfiles: Sequence[PerfilSocial]):
+        """
+        Guarda perfiles recién generados en memoria y en disco
+
+        Args:
+            clientes: Clientes perfilados (dan la clave de cada perfil)
+            perfiles: Perfil de cada cliente, en el mismo orden
+        """
+        if not self.activa:
+            return
+        self._guardar_pares([(clave_perfil(c, self.origen), p) for c, p in zip(clientes, perfiles)])
+
+    def _buscar_lote(self, clientes: Sequence[Cliente]) -> List[Optional[PerfilSocial]]:
+        """Perfil vigente de cada cliente o None, en el mismo orden"""
+        return [self.obtener(clave_perfil(c, self.origen)) for c in clientes]
+
+    def obtener_lote(
+        self,
+        clientes: Sequence[Cliente],
+        generar_lote: Callable[[Sequence[Cliente]], List[PerfilSocial]]
+    ) -> List[PerfilSocial]:
+        """
+        Perfiles de un lote: los que faltan se generan juntos en una sola llamada
+
+        Args:
+            clientes: Clientes a perfilar
+            generar_lote: Función que genera perfiles para una lista de clientes
+
+        Returns:
+            Perfil de cada cliente, en el mismo orden
+        """
+        perfiles = self._buscar_lote(clientes)
+        faltantes = [i for i, p in enumerate(perfiles) if p is None]
+        if faltantes:
+            pedidos = [clientes[i] for i in faltantes]
+            generados = generar_lote(pedidos)
+            self.guardar(pedidos, generados)
+            for i, perfil in zip(faltantes, generados):
+                perfiles[i] = perfil
+        return perfiles
+
+    async def obtener_lote_async(
+        self,
+        clientes: Sequence[Cliente],
+        generar_lote: Callable[[Sequence[Cliente]], Awaitable[List[PerfilSocial]]]
+    ) -> List[PerfilSocial]:
+        """
+        Igual que obtener_lote, con un generador asíncrono (ver app/proveedores_perfil.py)
+
+        Las búsquedas y el guardado (con la capa SQLite, una consulta por
+        cliente) corren en un hilo, cada uno en una sola llamada por lote.
+        """
+        if not self.activa:
+            return await generar_lote(clientes)
+        perfiles = await asyncio.to_thread(self._buscar_lote, clientes)
+        faltantes = [i for i, p in enumerate(perfiles) if p is None]
+        if faltantes:
+            pedidos = [clientes[i] for i in faltantes]
+            generados = await generar_lote(pedidos)
+            await asyncio.to_thread(self.guardar, pedidos, generados)
+            for i, perfil in zip(faltantes, generados):
+                perfiles[i] = perfil
+        return perfiles
+
+    def estadisticas(self) -> Dict:
+        """Contadores de uso de la caché"""
+        return {**super().estadisticas(), "origen": self.origen}
+
+
+class PerfiladorCacheado:
+    """Perfilador con la misma interfaz que PerfiladorSocialMock, servido desde la caché"""
+
+    def __init__(self, perfilador, cache: CachePerfiles):
+        """
+        Args:
+            perfilador: Fuente de señales (generar_señales / generar_lote)
+            cache: Caché de perfiles a consultar primero
+        """
+        self.perfilador = perfilador
+        self.cache = cache
+
+    def generar_señales(self, cliente: Cliente) -> PerfilSocial:
+        """Perfil de un cliente, desde la caché si está vigente"""
+        return self.generar_lote([cliente])[0]
+
+    def generar_lote(self, clientes: Sequence[Cliente]) -> List[PerfilSocial]:
+        """Perfiles de un lote; solo se generan los que no están en caché"""
+        return self.cache.obtener_lote(clientes, self.perfilador.generar_lote)
+
+
+# Instancia global, compartida por todos los orquestadores del proceso
+cache_perfiles = CachePerfiles.desde_entorno()
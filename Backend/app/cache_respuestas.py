@@ -0,0 +1,153 @@
+"""
+Caché de respuestas pre-serializadas
+Guarda el JSON ya codificado (y opcionalmente comprimido con gzip) por forma
+de consulta, con un ETag fuerte por representación (la comprimida lleva el
+sufijo -gz). Se invalida completo cuando cambia la
+versión de los datos de origen.
+"""
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+# Por debajo de este tamaño no compensa comprimir
+GZIP_MIN_BYTES = 1024
+
+
+def acepta_gzip(accept_encoding: Optional[str]) -> bool:
+    """
+    Indica si la cabecera Accept-Encoding admite gzip
+
+    Respeta los valores q (RFC 9110): "gzip;q=0" lo rechaza y, si gzip no
+    aparece, decide el comodín "*".
+    """
+    calidades: Dict[str, float] = {}
+    for parte in (accept_encoding or "").split(","):
+        codificacion, *parametros = parte.split(";")
+        codificacion = codificacion.strip().lower()
+        if not codificacion:
+            continue
+        calidad = 1.0
+        for parametro in parametros:
+            nombre, _, valor = parametro.partition("=")
+            if nombre.strip().lower() == "q":
+                try:
+                    calidad = float(valor)
+                except ValueError:
+                    calidad = 0.0
+        calidades[codificacion] = calidad
+    if "gzip" in calidades:
+        return calidades["gzip"] > 0
+    return calidades.get("*", 0.0) > 0
+
+
+class RespuestaSerializada:
+    """Cuerpo JSON codificado, su versión gzip y el ETag de cada una"""
+
+    __slots__ = ("cuerpo", "cuerpo_gzip", "etag", "etag_gzip")
+
+    def __init__(self, contenido: Any, comprimir: bool = True):
+        self.cuerpo = json.dumps(contenido, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.cuerpo_gzip = (
+            gzip.compress(self.cuerpo, compresslevel=6)
+            if comprimir and len(self.cuerpo) >= GZIP_MIN_BYTES
+            else None
+        )
+        huella = hashlib.blake2b(self.cuerpo, digest_size=16).hexdigest()
+        self.etag = f'"{huella}"'
+        # Un ETag fuerte identifica bytes exactos: el cuerpo comprimido necesita el suyo
+        self.etag_gzip = f'"{huella}-gz"' if self.cuerpo_gzip is not None else None
+
+    def variante(self, accept_encoding: Optional[str]) -> Tuple[bytes, str, bool]:
+        """
+        Elige la representación según la cabecera Accept-Encoding del cliente
+
+        Returns:
+            (cuerpo, ETag, True si el cuerpo va comprimido con gzip)
+        """
+        if self.cuerpo_gzip is not None and acepta_gzip(accept_encoding):
+            return self.cuerpo_gzip, self.etag_gzip, True
+        return self.cuerpo, self.etag, False
+
+    def coincide(self, if_none_match: Optional[str], etag: Optional[str] = None) -> bool:
+        """
+        Indica si el ETag del cliente (cabecera If-None-Match) sigue vigente
+
+        Args:
+            if_none_match: Cabecera del cliente
+            etag: ETag de la representación elegida (por defecto, la sin comprimir)
+        """
+        if not if_none_match:
+            return False
+        etag = etag or self.etag
+        etiquetas = [e.strip() for e in if_none_match.split(",")]
+        # Comparación débil, como exige RFC 9110 para If-None-Match
+        return "*" in etiquetas or any(e.removeprefix("W/") == etag for e in etiquetas)
+
+
+class CacheRespuestas:
+    """LRU acotado de respuestas serializadas, ligado a una versión de datos"""
+
+    def __init__(self, max_entradas: int = 256, comprimir: bool = True):
+        self.max_entradas = max_entradas
+        self.comprimir = comprimir
+        self.hits = 0
+        self.misses = 0
+        self._version: Optional[int] = None
+        self._entradas: "OrderedDict[Hashable, RespuestaSerializada]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obtener(
+        self,
+        clave: Hashable,
+        version: int,
+        generar: Callable[[], Any]
+    ) -> RespuestaSerializada:
+        """
+        Retorna la respuesta cacheada para la clave o la genera y la guarda
+
+        Args:
+            clave: Forma normalizada de la consulta
+            version: Versión actual de los datos; si cambió se vacía la caché
+            generar: Función que produce el contenido JSON si no está en caché
+
+        Returns:
+            Respuesta serializada
+        """
+        with self._lock:
+            if version != self._version:
+                self._entradas.clear()
+                self._version = version
+            respuesta = self._entradas.get(clave)
+            if respuesta is not None:
+                self._entradas.move_to_end(clave)
+                self.hits += 1
+                return respuesta
+            self.misses += 1
+
+        respuesta = RespuestaSerializada(generar(), self.comprimir)
+
+        with self._lock:
+            if version == self._version:
+                self._entradas[clave] = respuesta
+                while len(self._entradas) > self.max_entradas:
+                    self._entradas.popitem(last=False)
+        return respuesta
+
+    def invalidar(self):
+        """Vacía la caché"""
+        with self._lock:
+            self._entradas.clear()
+            self._version = None
+
+    def estadisticas(self) -> Dict:
+        """Contadores de uso de la caché"""
+        with self._lock:
+            return {
+                "entradas": len(self._entradas),
+                "hits": self.hits,
+                "misses": self.misses,
+                "bytes": sum(len(r.cuerpo) + len(r.cuerpo_gzip or b"") for r in self._entradas.values())
+            }
@@ -0,0 +1,216 @@
+"""
+Caché LRU con TTL y capa SQLite opcional
+Base común de la caché de perfiles (app/cache_perfiles.py) y de la de
+respuestas del LLM (app/cache_llm.py): un OrderedDict acotado en memoria y,
+opcionalmente, una tabla SQLite en disco que sobrevive a reinicios y se
+comparte entre procesos. Cada módulo define su clave, su tabla y cómo se
+serializa el valor.
+"""
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Sequence, Tuple
+
+
+class CapaSQLite:
+    """Capa en disco: una fila por clave con la expiración y el valor serializado"""
+
+    def __init__(
+        self,
+        ruta: str,
+        tabla: str,
+        columnas: Sequence[str],
+        serializar: Callable[[Any], str],
+        deserializar: Callable[[str], Any],
+        primaria: Optional[int] = None
+    ):
+        """
+        Args:
+            ruta: Archivo SQLite
+            tabla: Nombre de la tabla
+            columnas: Columnas TEXT en las que se guarda cada componente de la clave
+            serializar: Valor -> texto
+            deserializar: Texto -> valor
+            primaria: Cuántas de las primeras columnas forman la clave primaria
+                (por defecto todas); el resto debe coincidir al leer y una
+                escritura con otros valores reemplaza la fila
+        """
+        self.ruta = ruta
+        self.tabla = tabla
+        self.columnas = tuple(columnas)
+        self.serializar = serializar
+        self.deserializar = deserializar
+        self._conexion = sqlite3.connect(ruta, check_same_thread=False, isolation_level=None)
+        self._conexion.execute("PRAGMA journal_mode=WAL")
+        existentes = {fila[1] for fila in self._conexion.execute(f"PRAGMA table_info({tabla})")}
+        if existentes and not existentes >= {*self.columnas, "expira", "datos"}:
+            # Archivo de una versión con otro esquema: es una caché, se descarta
+            self._conexion.execute(f"DROP TABLE {tabla}")
+        definicion = ", ".join(f"{c} TEXT NOT NULL" for c in self.columnas)
+        clave_primaria = ", ".join(self.columnas[:primaria])
+        self._conexion.execute(
+            f"CREATE TABLE IF NOT EXISTS {tabla} ("
+            f" {definicion}, expira REAL NOT NULL, datos TEXT NOT NULL,"
+            f" PRIMARY KEY ({clave_primaria}))"
+        )
+        condicion = " AND ".join(f"{c} = ?" for c in self.columnas)
+        self._sql_leer = f"SELECT expira, datos FROM {tabla} WHERE {condicion} AND expira > ?"
+        self._sql_escribir = (
+            f"INSERT OR REPLACE INTO {tabla} ({', '.join(self.columnas)}, expira, datos)"
+            f" VALUES ({', '.join('?' * (len(self.columnas) + 2))})"
+        )
+
+    def _valores(self, clave: Hashable) -> Tuple:
+        """Componentes de la clave en el orden de las columnas"""
+        return tuple(clave) if len(self.columnas) > 1 else (clave,)
+
+    def leer(self, clave: Hashable, ahora: float) -> Optional[Tuple[float, Any]]:
+        fila = self._conexion.execute(self._sql_leer, (*self._valores(clave), ahora)).fetchone()
+        if fila is None:
+            return None
+        return fila[0], self.deserializar(fila[1])
+
+    def escribir(self, entradas: Sequence[Tuple[Hashable, float, Any]]):
+        self._conexion.executemany(
+            self._sql_escribir,
+            [(*self._valores(clave), expira, self.serializar(valor)) for clave, expira, valor in entradas]
+        )
+
+    def purgar(self, ahora: Optional[float] = None):
+        """Borra las filas expiradas (o todas si ahora es None)"""
+        if ahora is None:
+            self._conexion.execute(f"DELETE FROM {self.tabla}")
+        else:
+            self._conexion.execute(f"DELETE FROM {self.tabla} WHERE expira <= ?", (ahora,))
+
+    def cerrar(self):
+        self._conexion.close()
+
+
+class CacheTTL:
+    """LRU con TTL en memoria, con capa SQLite opcional"""
+
+    def __init__(
+        self,
+        ttl_segundos: float,
+        max_entradas: int,
+        reloj: Callable[[], float] = time.time,
+        crear_disco: Optional[Callable[[], CapaSQLite]] = None
+    ):
+        """
+        Args:
+            ttl_segundos: Vigencia de cada entrada; 0 desactiva la caché
+            max_entradas: Máximo de entradas en memoria (se descarta la menos usada)
+            reloj: Fuente de tiempo en segundos (inyectable para pruebas)
+            crear_disco: Crea la capa en disco (None = solo memoria); no se
+                llama si la caché está desactivada
+        """
+        self.ttl_segundos = ttl_segundos
+        self.max_entradas = max_entradas
+        self.reloj = reloj
+        self.hits = 0
+        self.hits_disco = 0
+        self.misses = 0
+        self.expirados = 0
+        self.descartados = 0
+        self._entradas: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disco = crear_disco() if crear_disco is not None and ttl_segundos > 0 else None
+
+    @property
+    def activa(self) -> bool:
+        return self.ttl_segundos > 0
+
+    def _guardar_memoria(self, clave: Hashable, expira: float, valor: Any):
+        """Inserta en el LRU (con el lock tomado)"""
+        self._entradas[clave] = (expira, valor)
+        self._entradas.move_to_end(clave)
+        while len(self._entradas) > self.max_entradas:
+            self._entradas.popitem(last=False)
+            self.descartados += 1
+
+    def obtener(self, clave: Hashable) -> Optional[Any]:
+        """
+        Busca un valor vigente en memoria y luego en disco
+
+        Args:
+            clave: Clave de la entrada
+
+        Returns:
+            El valor o None si no está o expiró
+        """
+        if not self.activa:
+            return None
+        ahora = self.reloj()
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None:
+                if entrada[0] > ahora:
+                    self._entradas.move_to_end(clave)
+                    self.hits += 1
+                    return entrada[1]
+                del self._entradas[clave]
+                self.expirados += 1
+
+            if self._disco is not None:
+                entrada = self._disco.leer(clave, ahora)
+                if entrada is not None:
+                    # Se promueve a memoria conservando la expiración original
+                    self._guardar_memoria(clave, *entrada)
+                    self.hits_disco += 1
+                    return entrada[1]
+
+            self.misses += 1
+            return None
+
+    def _guardar_pares(self, pares: Sequence[Tuple[Hashable, Any]]):
+        """Guarda pares (clave, valor) en memoria y en disco con la misma expiración"""
+        if not self.activa or not pares:
+            return
+        expira = self.reloj() + self.ttl_segundos
+        with self._lock:
+            for clave, valor in pares:
+                self._guardar_memoria(clave, expira, valor)
+            if self._disco is not None:
+                self._disco.escribir([(clave, expira, valor) for clave, valor in pares])
+
+    def invalidar(self):
+        """Vacía la caché en memoria y en disco"""
+        with self._lock:
+            self._entradas.clear()
+            if self._disco is not None:
+                self._disco.purgar()
+
+    def purgar_expirados(self):
+        """Elimina las entradas vencidas de ambas capas"""
+        ahora = self.reloj()
+        with self._lock:
+            for clave in [c for c, (expira, _) in self._entradas.items() if expira <= ahora]:
+                del self._entradas[clave]
+                self.expirados += 1
+            if self._disco is not None:
+                self._disco.purgar(ahora)
+
+    def cerrar(self):
+        """Cierra la conexión de la capa en disco"""
+        with self._lock:
+            if self._disco is not None:
+                self._disco.cerrar()
+                self._disco = None
+
+    def estadisticas(self) -> Dict:
+        """Contadores de uso de la caché"""
+        with self._lock:
+            consultas = self.hits + self.hits_disco + self.misses
+            return {
+                "activa": self.activa,
+                "entradas": len(self._entradas),
+                "hits": self.hits,
+                "hits_disco": self.hits_disco,
+                "misses": self.misses,
+                "expirados": self.expirados,
+                "descartados": self.descartados,
+                "tasa_hits": round((self.hits + self.hits_disco) / consultas, 4) if consultas else 0.0,
+                "sqlite": self._disco.ruta if self._disco is not None else None
+            }
@@ -0,0 +1,240 @@
+"""
+Checkpoints de sesiones del agente
+Guarda en SQLite los ids de clientes pedidos por cada sesión y, a medida que
+terminan, el resultado de cada uno. Si el proceso se reinicia a mitad de una
+sesión, /api/agente/reanudar/{session_id} la retoma procesando solo los
+clientes que faltan.
+
+Las escrituras se acumulan en memoria y se vuelcan en una sola transacción
+cada SESIONES_CHECKPOINT_LOTE clientes o SESIONES_CHECKPOINT_SEGUNDOS, para
+no frenar el procesamiento; ante una caída se pierde a lo sumo ese tramo,
+que se vuelve a procesar al reanudar.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.models import AgentResult
+
+
+class AlmacenCheckpoints:
+    """Progreso de las sesiones en SQLite con escrituras por lotes"""
+
+    def __init__(
+        self,
+        ruta_sqlite: Optional[str] = None,
+        lote_escritura: int = 1_000,
+        intervalo_segundos: float = 5.0,
+        reloj: Callable[[], float] = time.monotonic
+    ):
+        """
+        Args:
+            ruta_sqlite: Archivo SQLite (None = checkpoints desactivados)
+            lote_escritura: Clientes terminados que se acumulan antes de escribir
+            intervalo_segundos: Tiempo máximo entre escrituras mientras haya pendientes
+            reloj: Fuente de tiempo en segundos (inyectable para pruebas)
+        """
+        self.ruta = ruta_sqlite
+        self.lote_escritura = lote_escritura
+        self.intervalo_segundos = intervalo_segundos
+        self.reloj = reloj
+        self.escrituras = 0
+        self.filas_escritas = 0
+        self._pendientes: List[Tuple[str, str, Optional[AgentResult]]] = []
+        self._ultima_escritura = reloj()
+        # _lock protege solo el buffer y los contadores; _escritura, la conexión SQLite.
+        # Así registrar() no espera a que se serialicen y escriban los resultados.
+        self._lock = threading.Lock()
+        self._escritura = threading.Lock()
+        self._conexion: Optional[sqlite3.Connection] = None
+        if ruta_sqlite:
+            self._conexion = sqlite3.connect(ruta_sqlite, check_same_thread=False, isolation_level=None)
+            self._conexion.execute("PRAGMA journal_mode=WAL")
+            # Con WAL, NORMAL no corrompe la base ante una caída: a lo sumo pierde la última transacción
+            self._conexion.execute("PRAGMA synchronous=NORMAL")
+            self._conexion.execute(
+                "CREATE TABLE IF NOT EXISTS sesiones ("
+                " session_id TEXT PRIMARY KEY,"
+                " client_ids TEXT NOT NULL,"
+                " status TEXT NOT NULL,"
+                " created_at TEXT NOT NULL,"
+                " completed_at TEXT)"
+            )
+            self._conexion.execute(
+                "CREATE TABLE IF NOT EXISTS clientes_terminados ("
+                " session_id TEXT NOT NULL,"
+                " client_id TEXT NOT NULL,"
+                " resultado TEXT,"
+                " PRIMARY KEY (session_id, client_id)) WITHOUT ROWID"
+            )
+
+    @classmethod
+    def desde_entorno(cls) -> "AlmacenCheckpoints":
+        """Crea el almacén con SESIONES_SQLITE, SESIONES_CHECKPOINT_LOTE y SESIONES_CHECKPOINT_SEGUNDOS"""
+        return cls(
+            ruta_sqlite=os.getenv("SESIONES_SQLITE") or None,
+            lote_escritura=int(os.getenv("SESIONES_CHECKPOINT_LOTE", "1000")),
+            intervalo_segundos=float(os.getenv("SESIONES_CHECKPOINT_SEGUNDOS", "5"))
+        )
+
+    @property
+    def activo(self) -> bool:
+        return self._conexion is not None
+
+    def crear_sesion(self, session_id: str, client_ids: Sequence[str], created_at: Optional[str] = None):
+        """Registra una sesión nueva con los clientes que debe procesar"""
+        if not self.activo:
+            return
+        with self._escritura:
+            self._conexion.execute(
+                "INSERT OR REPLACE INTO sesiones (session_id, client_ids, status, created_at) VALUES (?, ?, 'running', ?)",
+                (session_id, json.dumps(list(client_ids)), created_at or datetime.now().isoformat())
+            )
+
+    def registrar(self, session_id: str, client_id: str, resultado: Optional[AgentResult]):
+        """
+        Marca un cliente como terminado (solo en memoria hasta el próximo vaciar)
+
+        Args:
+            session_id: Sesión a la que pertenece
+            client_id: Cliente terminado
+            resultado: Su resultado, o None si no existe o terminó en error
+        """
+        if not self.activo:
+            return
+        with self._lock:
+            self._pendientes.append((session_id, client_id, resultado))
+
+    def debe_vaciar(self) -> bool:
+        """Indica si se alcanzó el lote o el intervalo de escritura"""
+        with self._lock:
+            return bool(self._pendientes) and (
+                len(self._pendientes) >= self.lote_escritura
+                or self.reloj() - self._ultima_escritura >= self.intervalo_segundos
+            )
+
+    def vaciar(self):
+        """Escribe los clientes terminados pendientes en una sola transacción"""
+        with self._escritura:
+            with self._lock:
+                self._ultima_escritura = self.reloj()
+                if not self._pendientes or not self.activo:
+                    return
+                pendientes, self._pendientes = self._pendientes, []
+            filas = [
+                (session_id, client_id, resultado.model_dump_json() if resultado is not None else None)
+                for session_id, client_id, resultado in pendientes
+            ]
+            self._conexion.execute("BEGIN")
+            try:
+                self._conexion.executemany(
+                    "INSERT OR REPLACE INTO clientes_terminados (session_id, client_id, resultado) VALUES (?, ?, ?)",
+                    filas
+                )
+                self._conexion.execute("COMMIT")
+            except Exception:
+                self._conexion.execute("ROLLBACK")
+                with self._lock:
+                    self._pendientes = pendientes + self._pendientes
+                raise
+            with self._lock:
+                self.escrituras += 1
+                self.filas_escritas += len(filas)
+
+    def completar(self, session_id: str):
+        """Vuelca lo pendiente y marca la sesión como completada"""
+        if not self.activo:
+            return
+        self.vaciar()
+        with self._escritura:
+            self._conexion.execute(
+                "UPDATE sesiones SET status = 'completed', completed_at = ? WHERE session_id = ?",
+                (datetime.now().isoformat(), session_id)
+            )
+
+    def reabrir(self, session_id: str):
+        """Vuelve a marcar una sesión como en ejecución (al reanudarla)"""
+        if not self.activo:
+            return
+        with self._escritura:
+            self._conexion.execute(
+                "UPDATE sesiones SET status = 'running', completed_at = NULL WHERE session_id = ?",
+                (session_id,)
+            )
+
+    def cargar(self, session_id: str) -> Optional[Dict]:
+        """
+        Lee el progreso guardado de una sesión
+
+        Returns:
+            Dict con client_ids, status, created_at, completed_at, los resultados
+            de los clientes terminados y los ids pendientes (en el orden pedido);
+            None si la sesión no tiene checkpoint
+        """
+        if not self.activo:
+            return None
+        self.vaciar()
+        with self._escritura:
+            fila = self._conexion.execute(
+                "SELECT client_ids, status, created_at, completed_at FROM sesiones WHERE session_id = ?",
+                (session_id,)
+            ).fetchone()
+            if fila is None:
+                return None
+            terminados = self._conexion.execute(
+                "SELECT client_id, resultado FROM clientes_terminados WHERE session_id = ?",
+                (session_id,)
+            ).fetchall()
+
+        client_ids = json.loads(fila[0])
+        resultados = dict(terminados)
+        return {
+            "session_id": session_id,
+            "client_ids": client_ids,
+            "status": fila[1],
+            "created_at": fila[2],
+            "completed_at": fila[3],
+            # En el orden en que se pidieron los clientes
+            "resultados": [
+                AgentResult.model_validate_json(resultados[client_id])
+                for client_id in client_ids if resultados.get(client_id)
+            ],
+            "terminados": len(resultados),
+            "pendientes": [client_id for client_id in client_ids if client_id not in resultados]
+        }
+
+    def sesiones_incompletas(self) -> List[str]:
+        """Ids de las sesiones que quedaron sin terminar"""
+        if not self.activo:
+            return []
+        with self._escritura:
+            return [fila[0] for fila in self._conexion.execute(
+                "SELECT session_id FROM sesiones WHERE status = 'running' ORDER BY created_at"
+            )]
+
+    def cerrar(self):
+        """Vuelca lo pendiente y cierra la conexión"""
+        if not self.activo:
+            return
+        self.vaciar()
+        with self._escritura, self._lock:
+            self._conexion.close()
+            self._conexion = None
+
+    def estadisticas(self) -> Dict:
+        with self._lock:
+            return {
+                "activo": self.activo,
+                "sqlite": self.ruta if self.activo else None,
+                "escrituras": self.escrituras,
+                "filas_escritas": self.filas_escritas,
+                "pendientes": len(self._pendientes)
+            }
+
+
+# Instancia global, compartida por todas las sesiones del proceso
+almacen_checkpoints = AlmacenCheckpoints.desde_entorno()
@@ -0,0 +1,525 @@
+"""
+Almacén indexado de clientes
+Reemplaza la lista plana de clientes con búsqueda O(1) por id_cliente e
+índices secundarios por sector, riesgo y red social
+
+Los datos se guardan por columnas (struct-of-arrays): los campos categóricos
+como códigos enteros pequeños con un diccionario compartido y los nombres
+en un único buffer UTF-8 con offsets. Los objetos Cliente de pydantic solo se materializan en el
+borde de la API.
+"""
+import sys
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from app.models import Cliente
+from app.utils import COLUMNAS_CLIENTE
+
+# Campos con índice secundario (comparación sin distinguir mayúsculas)
+CAMPOS_INDEXADOS = ("sector", "riesgo", "red_social")
+
+
+class _Categoria:
+    """Columna categórica: códigos + diccionario compartido + índice invertido"""
+
+    __slots__ = ("codigos", "valores", "orden", "limites")
+
+    def __init__(self, valores: np.ndarray):
+        codigos, categorias = pd.factorize(valores)
+        # El entero sin signo más chico que representa todos los códigos (0..n-1)
+        self.codigos = codigos.astype(np.min_scalar_type(max(len(categorias) - 1, 0)))
+        # Diccionario compartido: todas las filas apuntan al mismo str
+        self.valores = np.array([sys.intern(str(v)) for v in categorias], dtype=object)
+        # Índice invertido: posiciones ordenadas por código (estable = orden del CSV)
+        self.orden = np.argsort(self.codigos, kind="stable").astype(np.int32)
+        self.limites = np.searchsorted(self.codigos[self.orden], np.arange(len(categorias) + 1))
+
+    def posiciones(self, valor: str) -> np.ndarray:
+        """Posiciones (ordenadas) de las filas con ese valor"""
+        valor = valor.lower()
+        partes = [
+            self.orden[self.limites[c]:self.limites[c + 1]]
+            for c, v in enumerate(self.valores)
+            if v.lower() == valor
+        ]
+        if len(partes) == 1:
+            return partes[0]
+        return np.sort(np.concatenate(partes)) if partes else np.empty(0, dtype=np.int32)
+
+    def __getitem__(self, posiciones) -> np.ndarray:
+        return self.valores[self.codigos[posiciones]]
+
+
+class _Textos:
+    """
+    Columna de textos: un buffer UTF-8 contiguo + offsets de inicio/fin
+
+    A diferencia de un array |S, cada fila ocupa solo sus bytes (no se
+    rellena hasta el texto más largo).
+    """
+
+    __slots__ = ("buffer", "offsets")
+
+    def __init__(self, textos: Sequence[str]):
+        codificados = [t.encode("utf-8") for t in textos]
+        self.offsets = np.zeros(len(codificados) + 1, dtype=np.int64)
+        np.cumsum(np.fromiter(map(len, codificados), dtype=np.int64, count=len(codificados)), out=self.offsets[1:])
+        self.buffer = b"".join(codificados)
+
+    @classmethod
+    def desde_buffer(cls, buffer: bytes, offsets: np.ndarray) -> "_Textos":
+        """Columna a partir de un buffer y offsets ya armados (p.ej. leídos del snapshot)"""
+        textos = cls.__new__(cls)
+        textos.buffer = buffer
+        textos.offsets = offsets
+        return textos
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, pos: int) -> str:
+        return self.buffer[self.offsets[pos]:self.offsets[pos + 1]].decode("utf-8")
+
+    def tomar(self, posiciones) -> List[str]:
+        """Textos de las posiciones dadas (array de enteros o slice)"""
+        inicios = self.offsets[:-1][posiciones].tolist()
+        fines = self.offsets[1:][posiciones].tolist()
+        buffer = self.buffer
+        return [buffer[i:f].decode("utf-8") for i, f in zip(inicios, fines)]
+
+    def objetos(self, posiciones=slice(None)) -> np.ndarray:
+        """Textos de las posiciones como array de objetos (para comparar u ordenar)"""
+        return np.array(self.tomar(posiciones), dtype=object)
+
+    def __eq__(self, otro: object) -> bool:
+        return (
+            isinstance(otro, _Textos)
+            and np.array_equal(self.offsets, otro.offsets)
+            and self.buffer == otro.buffer
+        )
+
+    __hash__ = None
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.buffer) + self.offsets.nbytes
+
+
+def _preparar_columnas(columnas: Dict[str, np.ndarray]) -> Tuple[pd.Index, Dict[str, np.ndarray]]:
+    """
+    Normaliza las columnas de entrada al formato interno del almacén
+
+    Returns:
+        (índice hash de ids, columnas: nombre como _Textos, gasto float64,
+        categóricas como arrays de objetos)
+    """
+    ids = pd.Index(np.asarray(columnas["id_cliente"], dtype=object), dtype=object)
+    # Si hay ids repetidos se conserva el primero (como la antigua búsqueda lineal)
+    unicos = ~ids.duplicated(keep="first")
+    if not unicos.all():
+        columnas = {c: np.asarray(v)[unicos] for c, v in columnas.items()}
+        ids = ids[unicos]
+
+    preparadas = {
+        "nombre": _Textos(np.asarray(columnas["nombre"]).tolist()),
+        "gasto_promedio": np.asarray(columnas["gasto_promedio"], dtype=np.float64),
+    }
+    for campo in CAMPOS_INDEXADOS:
+        preparadas[campo] = np.asarray(columnas[campo], dtype=object)
+    return ids, preparadas
+
+
+class _Datos:
+    """Contenido inmutable del almacén; se reemplaza completo en cada recarga"""
+
+    __slots__ = ("ids", "nombres", "gasto", "categorias", "indice_id", "orden_gasto", "_rangos")
+
+    def __init__(self, ids: pd.Index, columnas: Dict[str, np.ndarray], base: Optional["_Datos"] = None):
+        """
+        Args:
+            ids: Índice de ids sin duplicados
+            columnas: Columnas preparadas (ver _preparar_columnas)
+            base: Datos anteriores; si las filas siguen en el mismo orden se
+                reutilizan el índice hash y las columnas/índices que no cambiaron
+        """
+        mismo_orden = base is not None and base.indice_id.equals(ids)
+        self._rangos: Dict[str, np.ndarray] = {}
+
+        if mismo_orden:
+            self.ids, self.indice_id = base.ids, base.indice_id
+            if "id_cliente" in base._rangos:
+                self._rangos["id_cliente"] = base._rangos["id_cliente"]
+        else:
+            self.ids = ids.to_numpy(dtype=object)
+            self.indice_id = ids
+
+        if mismo_orden and base.nombres == columnas["nombre"]:
+            self.nombres = base.nombres
+            if "nombre" in base._rangos:
+                self._rangos["nombre"] = base._rangos["nombre"]
+        else:
+            self.nombres = columnas["nombre"]
+
+        if mismo_orden and np.array_equal(base.gasto, columnas["gasto_promedio"]):
+            self.gasto, self.orden_gasto = base.gasto, base.orden_gasto
+            if "gasto_promedio" in base._rangos:
+                self._rangos["gasto_promedio"] = base._rangos["gasto_promedio"]
+        else:
+            self.gasto = columnas["gasto_promedio"]
+            # Índice ordenado por gasto para filtros por rango
+            self.orden_gasto = np.argsort(self.gasto, kind="stable").astype(np.int32)
+
+        self.categorias = {}
+        for campo in CAMPOS_INDEXADOS:
+            if mismo_orden and (base.categorias[campo][:] == columnas[campo]).all():
+                self.categorias[campo] = base.categorias[campo]
+                if campo in base._rangos:
+                    self._rangos[campo] = base._rangos[campo]
+            else:
+                self.categorias[campo] = _Categoria(columnas[campo])
+
+    def rango(self, campo: str) -> np.ndarray:
+        """
+        Rango de cada fila al ordenar por un campo (se calcula una vez y se guarda)
+
+        rango[pos] es la posición de la fila pos en el orden ascendente del campo,
+        de modo que ordenar cualquier subconjunto es un argsort de enteros.
+        """
+        if campo not in self._rangos:
+            if campo == "gasto_promedio":
+                orden = self.orden_gasto
+            elif campo in self.categorias:
+                categoria = self.categorias[campo]
+                rango_codigo = np.argsort(np.argsort(categoria.valores.astype(str), kind="stable"))
+                orden = np.argsort(rango_codigo[categoria.codigos], kind="stable")
+            elif campo == "id_cliente":
+                orden = np.argsort(self.ids.astype(str), kind="stable")
+            elif campo == "nombre":
+                orden = np.argsort(self.nombres.objetos(), kind="stable")
+            else:
+                raise ValueError(f"Campo no ordenable: {campo}")
+            rango = np.empty(len(orden), dtype=np.int32)
+            rango[orden] = np.arange(len(orden), dtype=np.int32)
+            self._rangos[campo] = rango
+        return self._rangos[campo]
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+
+class ClienteVista:
+    """Vista ligera de una fila del almacén (sin copiar datos)"""
+
+    __slots__ = ("_datos", "_pos")
+
+    def __init__(self, datos: _Datos, pos: int):
+        self._datos = datos
+        self._pos = pos
+
+    @property
+    def id_cliente(self) -> str:
+        return self._datos.ids[self._pos]
+
+    @property
+    def nombre(self) -> str:
+        return self._datos.nombres[self._pos]
+
+    @property
+    def sector(self) -> str:
+        return self._datos.categorias["sector"][self._pos]
+
+    @property
+    def gasto_promedio(self) -> float:
+        return float(self._datos.gasto[self._pos])
+
+    @property
+    def riesgo(self) -> str:
+        return self._datos.categorias["riesgo"][self._pos]
+
+    @property
+    def red_social(self) -> str:
+        return self._datos.categorias["red_social"][self._pos]
+
+    def a_cliente(self) -> Cliente:
+        """Materializa la fila como Cliente de pydantic"""
+        return Cliente.model_construct(**{campo: getattr(self, campo) for campo in COLUMNAS_CLIENTE})
+
+    def __repr__(self) -> str:
+        return f"ClienteVista(id_cliente={self.id_cliente!r})"
+
+
+def _columnas_desde_clientes(clientes: Iterable[Cliente]) -> Dict[str, np.ndarray]:
+    """Convierte una secuencia de clientes al formato columnar"""
+    clientes = list(clientes)
+    return {
+        campo: np.array([getattr(c, campo) for c in clientes], dtype=np.float64 if tipo is float else object)
+        for campo, tipo in COLUMNAS_CLIENTE.items()
+    }
+
+
+class ClienteStore:
+    """Base de clientes en memoria, columnar y con índices hash"""
+
+    def __init__(self, clientes: Iterable[Cliente] = ()):
+        self._datos = _Datos(*_preparar_columnas(_columnas_desde_clientes(clientes)))
+        # Se incrementa con cada cambio de datos; invalida cursores y cachés derivados
+        self.version = 0
+        self._lock = threading.Lock()
+
+    def reemplazar(self, clientes: Iterable[Cliente]):
+        """
+        Reemplaza el contenido completo del almacén
+
+        Args:
+            clientes: Nuevos clientes (si hay ids repetidos se conserva el primero)
+        """
+        self.reemplazar_columnas(_columnas_desde_clientes(clientes))
+
+    def reemplazar_columnas(self, columnas: Dict[str, np.ndarray]):
+        """
+        Reemplaza el contenido a partir de columnas (CSV o snapshot) sin crear Clientes
+
+        Los índices nuevos se construyen aparte y se publican con una sola
+        asignación, así las lecturas concurrentes ven siempre un estado consistente.
+
+        Args:
+            columnas: Diccionario columna -> array (ver utils.validar_columnas)
+        """
+        datos = _Datos(*_preparar_columnas(columnas))
+        with self._lock:
+            self._datos = datos
+            self.version += 1
+
+    def recargar(self, columnas: Dict[str, np.ndarray]) -> Dict:
+        """
+        Aplica una nueva versión de la base comparándola por id_cliente
+
+        Solo si hay inserciones, actualizaciones o eliminaciones se publica una
+        versión nueva; las columnas e índices que no cambiaron (y el índice hash
+        de ids si el orden de filas se mantiene) se reutilizan tal cual. Si no
+        hay cambios, la versión no aumenta y las cachés derivadas siguen válidas.
+
+        Args:
+            columnas: Diccionario columna -> array (ver utils.validar_columnas)
+
+        Returns:
+            Resumen con insertados, actualizados, eliminados, total, version y segundos
+        """
+        inicio = time.perf_counter()
+        ids, preparadas = _preparar_columnas(columnas)
+
+        with self._lock:
+            base = self._datos
+            pos_base = base.indice_id.get_indexer(ids)
+            comunes = pos_base >= 0
+            pos_nuevas, pos_base = np.flatnonzero(comunes), pos_base[comunes]
+
+            cambiados = preparadas["nombre"].objetos(pos_nuevas) != base.nombres.objetos(pos_base)
+            cambiados |= preparadas["gasto_promedio"][pos_nuevas] != base.gasto[pos_base]
+            for campo in CAMPOS_INDEXADOS:
+                cambiados |= preparadas[campo][pos_nuevas] != base.categorias[campo][pos_base]
+
+            insertados = len(ids) - len(pos_nuevas)
+            eliminados = len(base) - len(pos_nuevas)
+            actualizados = int(cambiados.sum())
+
+            if insertados or eliminados or actualizados or not base.indice_id.equals(ids):
+                self._datos = _Datos(ids, preparadas, base)
+                self.version += 1
+
+            return {
+                "insertados": insertados,
+                "actualizados": actualizados,
+                "eliminados": eliminados,
+                "total": len(self._datos),
+                "version": self.version,
+                "segundos": round(time.perf_counter() - inicio, 4)
+            }
+
+    def columnas(self) -> Dict[str, np.ndarray]:
+        """Contenido actual en formato columnar (el que recibe reemplazar_columnas)"""
+        datos = self._datos
+        columnas = {
+            "id_cliente": datos.ids,
+            "nombre": datos.nombres.objetos(),
+            "gasto_promedio": datos.gasto,
+        }
+        for campo in CAMPOS_INDEXADOS:
+            columnas[campo] = datos.categorias[campo][:]
+        return columnas
+
+    def vista(self, id_cliente: str) -> Optional[ClienteVista]:
+        """Busca un cliente por id en O(1) sin materializarlo"""
+        datos = self._datos
+        try:
+            pos = datos.indice_id.get_loc(id_cliente)
+        except KeyError:
+            return None
+        return ClienteVista(datos, pos)
+
+    def obtener(self, id_cliente: str) -> Optional[Cliente]:
+        """Busca un cliente por id en O(1)"""
+        vista = self.vista(id_cliente)
+        return vista.a_cliente() if vista else None
+
+    def posiciones(self, **filtros: Optional[str]) -> np.ndarray:
+        """
+        Posiciones de las filas que cumplen los filtros por igualdad
+
+        Args:
+            **filtros: sector, riesgo y/o red_social; los valores None se ignoran
+
+        Returns:
+            Array ordenado de posiciones (orden del CSV)
+        """
+        datos = self._datos
+        resultado = None
+        for campo, valor in filtros.items():
+            if valor is None:
+                continue
+            if campo not in datos.categorias:
+                raise ValueError(f"Campo no indexado: {campo}")
+            encontrados = datos.categorias[campo].posiciones(valor)
+            resultado = encontrados if resultado is None else np.intersect1d(resultado, encontrados, assume_unique=True)
+
+        if resultado is None:
+            return np.arange(len(datos), dtype=np.int32)
+        return resultado
+
+    def consultar(
+        self,
+        sector: Optional[str] = None,
+        riesgo: Optional[str] = None,
+        red_social: Optional[str] = None,
+        gasto_min: Optional[float] = None,
+        gasto_max: Optional[float] = None,
+        orden: Optional[str] = None,
+        offset: int = 0,
+        limit: Optional[int] = None
+    ) -> Tuple[np.ndarray, int]:
+        """
+        Resuelve una consulta paginada usando solo los índices
+
+        Args:
+            sector, riesgo, red_social: Filtros por igualdad (índices invertidos)
+            gasto_min, gasto_max: Rango inclusivo de gasto (índice ordenado)
+            orden: Campo de orden; prefijo "-" para descendente
+            offset: Filas a saltar
+            limit: Máximo de filas (None = todas)
+
+        Returns:
+            (posiciones de la página, total de filas que cumplen los filtros)
+        """
+        datos = self._datos
+        hay_categorias = any(v is not None for v in (sector, riesgo, red_social))
+        posiciones = self.posiciones(sector=sector, riesgo=riesgo, red_social=red_social)
+
+        if gasto_min is not None or gasto_max is not None:
+            if hay_categorias:
+                gasto = datos.gasto[posiciones]
+                mascara = np.ones(len(posiciones), dtype=bool)
+                if gasto_min is not None:
+                    mascara &= gasto >= gasto_min
+                if gasto_max is not None:
+                    mascara &= gasto <= gasto_max
+                posiciones = posiciones[mascara]
+            else:
+                ordenado = datos.gasto[datos.orden_gasto]
+                inicio = 0 if gasto_min is None else np.searchsorted(ordenado, gasto_min, side="left")
+                fin = len(ordenado) if gasto_max is None else np.searchsorted(ordenado, gasto_max, side="right")
+                posiciones = np.sort(datos.orden_gasto[inicio:fin])
+
+        if orden:
+            descendente = orden.startswith("-")
+            rango = datos.rango(orden.lstrip("-"))
+            posiciones = posiciones[np.argsort(rango[posiciones], kind="stable")]
+            if descendente:
+                posiciones = posiciones[::-1]
+
+        total = len(posiciones)
+        fin = None if limit is None else offset + limit
+        return posiciones[offset:fin], total
+
+    def filas(self, posiciones: np.ndarray, campos: Optional[Sequence[str]] = None) -> List[Dict]:
+        """
+        Extrae filas como diccionarios, solo con los campos pedidos (proyección)
+
+        Args:
+            posiciones: Posiciones a extraer
+            campos: Campos a incluir (None = todos, en el orden de Cliente)
+
+        Returns:
+            Lista de diccionarios listos para serializar
+        """
+        datos = self._datos
+        campos = list(campos or COLUMNAS_CLIENTE)
+        valores = []
+        for campo in campos:
+            if campo == "id_cliente":
+                valores.append(datos.ids[posiciones].tolist())
+            elif campo == "nombre":
+                valores.append(datos.nombres.tomar(posiciones))
+            elif campo == "gasto_promedio":
+                valores.append(datos.gasto[posiciones].tolist())
+            elif campo in datos.categorias:
+                valores.append(datos.categorias[campo][posiciones].tolist())
+            else:
+                raise ValueError(f"Campo desconocido: {campo}")
+        return [dict(zip(campos, fila)) for fila in zip(*valores)]
+
+    def materializar(self, posiciones: np.ndarray) -> List[Cliente]:
+        """Construye en bloque los Clientes de las posiciones dadas"""
+        datos = self._datos
+        columnas = zip(
+            datos.ids[posiciones].tolist(),
+            datos.nombres.tomar(posiciones),
+            datos.categorias["sector"][posiciones].tolist(),
+            datos.gasto[posiciones].tolist(),
+            datos.categorias["riesgo"][posiciones].tolist(),
+            datos.categorias["red_social"][posiciones].tolist(),
+        )
+        return [
+            Cliente.model_construct(
+                id_cliente=id_cliente,
+                nombre=nombre,
+                sector=sector,
+                gasto_promedio=gasto,
+                riesgo=riesgo,
+                red_social=red_social
+            )
+            for id_cliente, nombre, sector, gasto, riesgo, red_social in columnas
+        ]
+
+    def todos(self) -> List[Cliente]:
+        """Retorna todos los clientes en el orden del CSV"""
+        return self.materializar(slice(None))
+
+    def filtrar(self, **filtros: Optional[str]) -> List[Cliente]:
+        """
+        Filtra clientes por igualdad en los campos indexados
+
+        Args:
+            **filtros: sector, riesgo y/o red_social; los valores None se ignoran
+
+        Returns:
+            Clientes que cumplen todos los filtros, en el orden del CSV
+        """
+        return self.materializar(self.posiciones(**filtros))
+
+    def valores(self, campo: str) -> List[str]:
+        """Valores distintos de un campo indexado"""
+        return sorted(self._datos.categorias[campo].valores.tolist())
+
+    def __len__(self) -> int:
+        return len(self._datos)
+
+    def __iter__(self) -> Iterator[ClienteVista]:
+        datos = self._datos
+        return (ClienteVista(datos, pos) for pos in range(len(datos)))
+
+    def __contains__(self, id_cliente: object) -> bool:
+        return id_cliente in self._datos.indice_id
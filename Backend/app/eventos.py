@@ -0,0 +1,214 @@
+"""
+Bitácora compacta de eventos del agente
+Cada nodo del FSM registra eventos como tuplas (reloj monotónico, estado,
+plantilla, argumentos) en un buffer preasignado por cliente, en lugar de
+armar un dict con el mensaje ya formateado y un timestamp ISO por paso.
+El texto y la fecha se arman solo cuando alguien lee el evento: el stream
+SSE, la API de resultados o model_dump().
+
+Al iterar la bitácora se obtienen los mismos dicts que antes
+({"estado", "mensaje", "timestamp"}), así que el código que leía
+state.logs como lista sigue funcionando.
+"""
+import time
+from datetime import datetime
+from enum import IntEnum
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+from pydantic_core import core_schema
+
+
+class Plantilla(IntEnum):
+    """Mensajes de la bitácora (el texto está en TEXTOS)"""
+
+    LIBRE = 0
+    PROCESANDO_CLIENTE = 1
+    GENERANDO_PERFIL = 2
+    PERFIL_GENERADO = 3
+    APLICANDO_SEGMENTACION = 4
+    SEGMENTO_ASIGNADO = 5
+    GENAI_OMITIDO = 6
+    GENAI_OMITIDO_MARGEN = 7
+    GENAI_SUGIRIO = 8
+    GENAI_SIN_RESPUESTA = 9
+    GENAI_ERROR = 10
+    SELECCIONANDO_CAMPAÑA = 11
+    CAMPAÑA_SELECCIONADA = 12
+    COMPONIENDO_RESULTADO = 13
+    RESULTADO_GENERADO = 14
+    ERROR = 15
+    PROCESO_COMPLETADO = 16
+
+
+TEXTOS: Dict[Plantilla, str] = {
+    Plantilla.LIBRE: "{0}",
+    Plantilla.PROCESANDO_CLIENTE: "Procesando cliente: {0}",
+    Plantilla.GENERANDO_PERFIL: "Generando perfil social...",
+    Plantilla.PERFIL_GENERADO: "Perfil generado: {0} actividad, {1} tono",
+    Plantilla.APLICANDO_SEGMENTACION: "Aplicando segmentación usando {0}...",
+    Plantilla.SEGMENTO_ASIGNADO: "Segmento asignado: {0}",
+    Plantilla.GENAI_OMITIDO: "Reglas sin umbral cercano, se omite GenAI",
+    Plantilla.GENAI_OMITIDO_MARGEN: "Reglas a {0:.0%} del umbral más cercano, se omite GenAI",
+    Plantilla.GENAI_SUGIRIO: "GenAI sugirió: {0}",
+    Plantilla.GENAI_SIN_RESPUESTA: "GenAI no pudo determinar, usando reglas: {0}",
+    Plantilla.GENAI_ERROR: "Error en GenAI ({0}: {1}), usando reglas determinísticas",
+    Plantilla.SELECCIONANDO_CAMPAÑA: "Seleccionando campaña...",
+    Plantilla.CAMPAÑA_SELECCIONADA: "Campaña seleccionada: {0}",
+    Plantilla.COMPONIENDO_RESULTADO: "Componiendo resultado final...",
+    Plantilla.RESULTADO_GENERADO: "Resultado generado exitosamente",
+    Plantilla.ERROR: "Error: {0}",
+    Plantilla.PROCESO_COMPLETADO: "Proceso completado exitosamente para {0}",
+}
+
+# Evento: (segundos monotónicos, estado, plantilla, argumentos)
+Evento = Tuple[float, Any, Plantilla, tuple]
+
+# Eventos que registra un cliente en el camino feliz (~12); el buffer se duplica si no alcanza
+CAPACIDAD_INICIAL = 16
+
+
+def _desfase_reloj() -> float:
+    """Diferencia entre el reloj de pared y el monotónico de este proceso"""
+    return time.time() - time.monotonic()
+
+
+class BitacoraEventos:
+    """Buffer preasignado de eventos de un cliente con formateo diferido"""
+
+    __slots__ = ("_eventos", "_cantidad", "desfase")
+
+    def __init__(self, capacidad: int = CAPACIDAD_INICIAL):
+        self._eventos: List[Optional[Evento]] = [None] * capacidad
+        self._cantidad = 0
+        # Se guarda con la bitácora: el reloj monotónico de un worker no es el del proceso principal
+        self.desfase = _desfase_reloj()
+
+    def registrar(self, estado: Any, plantilla: Plantilla, *args: Any):
+        """
+        Agrega un evento sin formatear nada
+
+        Args:
+            estado: Estado del FSM (Estado o texto)
+            plantilla: Mensaje del evento
+            *args: Valores que completan la plantilla
+        """
+        if self._cantidad == len(self._eventos):
+            self._eventos.extend([None] * max(len(self._eventos), 1))
+        self._eventos[self._cantidad] = (time.monotonic(), estado, plantilla, args)
+        self._cantidad += 1
+
+    def append(self, log: Dict):
+        """Compatibilidad con state.logs.append({...}): guarda el dict (o un LogEntry) como evento LIBRE"""
+        self.registrar(
+            log.get("estado", log.get("state", "UNKNOWN")), Plantilla.LIBRE,
+            log.get("mensaje", log.get("message", "")), log.get("data"), log.get("timestamp")
+        )
+
+    def eventos(self) -> Iterator[Evento]:
+        """Eventos crudos, sin formatear"""
+        for i in range(self._cantidad):
+            yield self._eventos[i]
+
+    def contiene(self, estado: Any) -> bool:
+        """Indica si hay algún evento del estado dado (sin formatear)"""
+        return any(evento[1] == estado for evento in self.eventos())
+
+    def copia(self) -> "BitacoraEventos":
+        copia = BitacoraEventos(len(self._eventos))
+        copia._eventos[:self._cantidad] = self._eventos[:self._cantidad]
+        copia._cantidad = self._cantidad
+        copia.desfase = self.desfase
+        return copia
+
+    def _formatear(self, evento: Evento) -> Tuple[str, str, str, Optional[Dict]]:
+        """(estado, mensaje, timestamp ISO, data) de un evento"""
+        t, estado, plantilla, args = evento
+        estado = getattr(estado, "value", estado)
+        if plantilla is Plantilla.LIBRE:
+            mensaje, data, timestamp = args
+            if timestamp:
+                return estado, mensaje, timestamp, data
+            return estado, mensaje, datetime.fromtimestamp(t + self.desfase).isoformat(), data
+        mensaje = TEXTOS[plantilla].format(*args)
+        return estado, mensaje, datetime.fromtimestamp(t + self.desfase).isoformat(), None
+
+    def timestamp(self, indice: int = -1) -> Optional[str]:
+        """Timestamp ISO de un evento (por defecto el último); None si está vacía"""
+        if not self._cantidad:
+            return None
+        return self._formatear(self._evento(indice))[2]
+
+    def _evento(self, indice: int) -> Evento:
+        if indice < 0:
+            indice += self._cantidad
+        if not 0 <= indice < self._cantidad:
+            raise IndexError("índice fuera de la bitácora")
+        return self._eventos[indice]
+
+    def _como_log(self, evento: Evento) -> Dict:
+        estado, mensaje, timestamp, data = self._formatear(evento)
+        log = {"estado": estado, "mensaje": mensaje, "timestamp": timestamp}
+        if data is not None:
+            log["data"] = data
+        return log
+
+    def como_logs(self) -> List[Dict]:
+        """Eventos formateados como los dicts que usa el orquestador"""
+        return [self._como_log(evento) for evento in self.eventos()]
+
+    def como_log_entries(self) -> List[Dict]:
+        """Eventos formateados con la forma de LogEntry (state, timestamp, message, data)"""
+        entradas = []
+        for evento in self.eventos():
+            estado, mensaje, timestamp, data = self._formatear(evento)
+            entradas.append({"state": estado, "timestamp": timestamp, "message": mensaje, "data": data})
+        return entradas
+
+    def __len__(self) -> int:
+        return self._cantidad
+
+    def __iter__(self) -> Iterator[Dict]:
+        for evento in self.eventos():
+            yield self._como_log(evento)
+
+    def __getitem__(self, indice: Union[int, slice]) -> Union[Dict, List[Dict]]:
+        if isinstance(indice, slice):
+            return [self._como_log(self._eventos[i]) for i in range(*indice.indices(self._cantidad))]
+        return self._como_log(self._evento(indice))
+
+    def __add__(self, otra) -> List[Dict]:
+        """Concatenar como si fueran listas de logs (p.ej. bitacora + otra_bitacora)"""
+        return self.como_logs() + list(otra)
+
+    def __radd__(self, otra) -> List[Dict]:
+        return list(otra) + self.como_logs()
+
+    def __repr__(self) -> str:
+        return f"BitacoraEventos({self._cantidad} eventos)"
+
+    # Integración con pydantic: acepta una bitácora o una lista de dicts y se serializa como lista de dicts
+
+    @classmethod
+    def validar(cls, valor: Any) -> "BitacoraEventos":
+        if isinstance(valor, BitacoraEventos):
+            return valor
+        if isinstance(valor, (list, tuple)):
+            bitacora = cls(max(CAPACIDAD_INICIAL, len(valor)))
+            for log in valor:
+                bitacora.append(log.model_dump() if hasattr(log, "model_dump") else log)
+            return bitacora
+        raise ValueError("se esperaba una BitacoraEventos o una lista de logs")
+
+    @classmethod
+    def __get_pydantic_core_schema__(cls, origen: Any, handler: Any) -> core_schema.CoreSchema:
+        return core_schema.no_info_plain_validator_function(
+            cls.validar,
+            serialization=core_schema.plain_serializer_function_ser_schema(lambda b: b.como_logs())
+        )
+
+    @classmethod
+    def __get_pydantic_json_schema__(cls, esquema: Any, handler: Any) -> Dict:
+        if esquema["type"] != "function-plain":
+            # Una anotación pidió el esquema de otro tipo (ver LogsFrontend en app/models.py)
+            return handler(esquema)
+        return {"type": "array", "items": {"type": "object"}}
@@ -1,8 +1,12 @@
 """
 Handler para AWS Lambda
 """
+import os
+
+# En Lambda solo /tmp es escribible: el snapshot del CSV se guarda ahí
+os.environ.setdefault("CLIENTES_SNAPSHOT_DIR", "/tmp")
+
 from mangum import Mangum
 from app.main import app
 
 handler = Mangum(app)
-
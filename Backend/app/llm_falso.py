@@ -0,0 +1,126 @@
+"""
+Modelo de chat falso
+Sustituto determinístico de ChatOpenAI para pruebas y benchmarks sin red:
+responde el segmento que darían las reglas vigentes (también en el prompt de
+varios clientes con respuesta JSON), tras una latencia configurable, e
+informa uso de tokens como el modelo real. Una fracción configurable de las
+llamadas falla con un 429 simulado.
+
+Se activa con LLM_PROVEEDOR=falso (ver env.example).
+"""
+import asyncio
+import json
+import os
+import random
+import re
+import threading
+import time
+from typing import Any, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import PrivateAttr
+
+from app.reglas import gestor_reglas
+
+_FICHA = re.compile(
+    r"Gasto promedio: \$(?P<gasto>[\d.]+)\nRiesgo: (?P<riesgo>.*)\n(?:.*\n){2}"
+    r"Actividad: (?P<actividad>.*)\nEngagement: (?P<engagement>[\d.]+)"
+)
+_ID_GRUPO = re.compile(r"\[\d+\] id: (\S+)\n")
+
+
+class ErrorLimiteFalso(Exception):
+    """Respuesta 429 simulada (mismo status_code que openai.RateLimitError)"""
+
+    status_code = 429
+
+
+class ChatFalso(BaseChatModel):
+    """Modelo de chat determinístico con latencia y tasa de error configurables"""
+
+    model_name: str = "falso"
+    latencia_segundos: float = 0.0
+    tasa_error: float = 0.0
+    semilla: int = 0
+
+    _rng: random.Random = PrivateAttr()
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+    _llamadas: int = PrivateAttr(default=0)
+
+    def model_post_init(self, contexto: Any):
+        super().model_post_init(contexto)
+        self._rng = random.Random(self.semilla)
+
+    @classmethod
+    def desde_entorno(cls) -> "ChatFalso":
+        """Crea el modelo con LLM_FALSO_LATENCIA_MS y LLM_FALSO_TASA_ERROR"""
+        return cls(
+            latencia_segundos=float(os.getenv("LLM_FALSO_LATENCIA_MS", "200")) / 1000,
+            tasa_error=float(os.getenv("LLM_FALSO_TASA_ERROR", "0"))
+        )
+
+    @property
+    def _llm_type(self) -> str:
+        return "falso"
+
+    @property
+    def llamadas(self) -> int:
+        return self._llamadas
+
+    @staticmethod
+    def _segmento(ficha: re.Match) -> str:
+        return gestor_reglas.actual.segmentar(
+            float(ficha["gasto"]), ficha["riesgo"].strip().lower(),
+            ficha["actividad"].strip(), float(ficha["engagement"])
+        ).value
+
+    def _contestar(self, mensajes: List[BaseMessage]) -> ChatResult:
+        """Decide si la llamada falla y arma la respuesta (sin la latencia)"""
+        with self._lock:
+            self._llamadas += 1
+            falla = self.tasa_error > 0 and self._rng.random() < self.tasa_error
+        if falla:
+            raise ErrorLimiteFalso("Rate limit simulado (429)")
+
+        prompt = "\n".join(str(m.content) for m in mensajes)
+        ids = _ID_GRUPO.findall(prompt)
+        fichas = list(_FICHA.finditer(prompt))
+        if ids:
+            contenido = json.dumps([
+                {"id": id_cliente, "segmento": self._segmento(ficha)} for id_cliente, ficha in zip(ids, fichas)
+            ])
+        else:
+            contenido = self._segmento(fichas[0]) if fichas else "no sé"
+
+        entrada, salida = len(prompt) // 4 + 1, len(contenido) // 4 + 1
+        mensaje = AIMessage(
+            content=contenido,
+            usage_metadata={"input_tokens": entrada, "output_tokens": salida, "total_tokens": entrada + salida}
+        )
+        return ChatResult(generations=[ChatGeneration(message=mensaje)])
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        resultado = self._contestar(messages)
+        if self.latencia_segundos:
+            time.sleep(self.latencia_segundos)
+        return resultado
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        resultado = self._contestar(messages)
+        if self.latencia_segundos:
+            await asyncio.sleep(self.latencia_segundos)
+        return resultado
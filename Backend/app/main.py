@@ -1,34 +1,51 @@
 """
 API FastAPI para el agente de campañas - Compatible con Frontend Next.js
 """
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Iterator, Optional, Set, Tuple
 from pathlib import Path
 import os
 import asyncio
+import base64
 import json
+import time
 from datetime import datetime
+import numpy as np
 
 from dotenv import load_dotenv
 load_dotenv()
 
 from app.models import (
     Cliente, EjecutarAgenteRequest, EjecutarAgenteResponse,
-    ClienteListResponse, AgentResult, LogEntry
+    ClienteListResponse, AgentResult, LogEntry, PerfilSocial, EstadoAgente,
+    ResultadoCampaña, Campaña as CampañaBackend
 )
 from app.orquestador import OrquestadorAgente
 from app.session_manager import session_manager
 from app.adapters import estado_to_agent_result
 from app.utils import (
-    cargar_clientes_csv,
-    exportar_resultados_json,
-    exportar_resultados_csv,
+    COLUMNAS_CLIENTE,
+    leer_columnas_csv,
+    iterar_clientes_csv,
+    iterar_en_lotes,
+    iterar_exportacion_json,
+    iterar_exportacion_csv,
     exportar_resultados_html
 )
 from app.decisor_campaña import DecisorCampaña
+from app.snapshot import cargar_columnas_con_snapshot
+from app.cliente_store import ClienteStore
+from app.cache_respuestas import CacheRespuestas
+from app.reglas import gestor_reglas
+from app.cache_perfiles import cache_perfiles
+from app.cache_llm import cache_llm
+from app.checkpoints import almacen_checkpoints
+from app.planificador_llm import planificador_llm, sesion_llm
+from app.proveedores_perfil import ErrorProveedor, ProveedorBase, crear_proveedor_desde_entorno
+from app.paralelo import OrquestadorParalelo, workers_desde_entorno
 
 app = FastAPI(
     title="Agente de Campañas - CRM Inteligente",
@@ -58,21 +75,240 @@ decisor = DecisorCampaña()
 
 # Cargar clientes
 CLIENTES_CSV_PATH = os.getenv("CLIENTES_CSV_PATH", "data/clientes.csv")
-clientes_cache = []
+# En modo streaming la base nunca se carga completa: se lee del CSV por lotes
+CLIENTES_STREAMING = os.getenv("CLIENTES_STREAMING", "false").lower() == "true"
+CLIENTES_LOTE_SIZE = int(os.getenv("CLIENTES_LOTE_SIZE", "10000"))
+# Snapshot binario del CSV para arranques rápidos (ver app/snapshot.py)
+CLIENTES_SNAPSHOT = os.getenv("CLIENTES_SNAPSHOT", "true").lower() == "true"
+CLIENTES_SNAPSHOT_DIR = os.getenv("CLIENTES_SNAPSHOT_DIR") or None
+# Intervalo de vigilancia del CSV para recarga automática (0 = desactivada)
+CLIENTES_RECARGA_SEGUNDOS = float(os.getenv("CLIENTES_RECARGA_SEGUNDOS", "0"))
+# Clientes por llamada a OrquestadorAgente.ejecutar_lote al procesar una sesión
+AGENTE_LOTE_SIZE = int(os.getenv("AGENTE_LOTE_SIZE", "100"))
+clientes_store = ClienteStore()
+# Respuestas de /api/clientes ya serializadas, por forma de consulta
+clientes_respuestas = CacheRespuestas(
+    max_entradas=int(os.getenv("CLIENTES_CACHE_MAX", "256")),
+    comprimir=os.getenv("CLIENTES_CACHE_GZIP", "true").lower() == "true"
+)
+# Proveedor asíncrono de perfiles sociales; se crea en el startup, dentro del event loop
+proveedor_perfiles: Optional[ProveedorBase] = None
+# Pool de procesos para ejecutar el agente en paralelo (AGENTE_WORKERS > 0)
+AGENTE_WORKERS = workers_desde_entorno()
+orquestador_paralelo: Optional[OrquestadorParalelo] = None
+# Tarea que vigila el CSV (CLIENTES_RECARGA_SEGUNDOS > 0); se cancela en el shutdown
+tarea_vigilancia: Optional[asyncio.Task] = None
+
+
+def cargar_base_clientes() -> Dict[str, np.ndarray]:
+    """Carga las columnas de la base de clientes, desde el snapshot si está habilitado"""
+    if CLIENTES_SNAPSHOT:
+        return cargar_columnas_con_snapshot(CLIENTES_CSV_PATH, CLIENTES_SNAPSHOT_DIR)
+    return leer_columnas_csv(CLIENTES_CSV_PATH)
 
 
 @app.on_event("startup")
 async def startup_event():
     """Carga clientes al iniciar"""
-    global clientes_cache
+    global proveedor_perfiles, orquestador_paralelo, tarea_vigilancia
+    proveedor_perfiles = crear_proveedor_desde_entorno()
+    print(f"👤 Proveedor de perfiles: {proveedor_perfiles.nombre} (concurrencia {proveedor_perfiles.max_concurrencia})")
+
+    if CLIENTES_STREAMING:
+        print(f"🌊 Modo streaming: {CLIENTES_CSV_PATH} se leerá en lotes de {CLIENTES_LOTE_SIZE}")
+        return
     try:
         if os.path.exists(CLIENTES_CSV_PATH):
-            clientes_cache = cargar_clientes_csv(CLIENTES_CSV_PATH)
-            print(f"✅ Cargados {len(clientes_cache)} clientes desde {CLIENTES_CSV_PATH}")
+            clientes_store.reemplazar_columnas(cargar_base_clientes())
+            print(f"✅ Cargados {len(clientes_store)} clientes desde {CLIENTES_CSV_PATH}")
         else:
             print(f"⚠️ Archivo CSV no encontrado: {CLIENTES_CSV_PATH}")
     except Exception as e:
         print(f"❌ Error cargando clientes: {e}")
+    
+    if AGENTE_WORKERS > 0:
+        orquestador_paralelo = OrquestadorParalelo(AGENTE_WORKERS, use_genai, AGENTE_LOTE_SIZE)
+        await asyncio.to_thread(orquestador_paralelo.iniciar, clientes_store)
+        print(f"⚡ Modo paralelo: {AGENTE_WORKERS} procesos con lotes de {AGENTE_LOTE_SIZE} clientes")
+    
+    if CLIENTES_RECARGA_SEGUNDOS > 0:
+        # Se guarda la referencia: el event loop solo conserva referencias débiles a las tareas
+        tarea_vigilancia = asyncio.create_task(vigilar_csv_clientes())
+    
+    incompletas = almacen_checkpoints.sesiones_incompletas()
+    if incompletas:
+        print(f"💾 {len(incompletas)} sesión(es) sin terminar; se retoman con POST /api/agente/reanudar/{{session_id}}")
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Detiene la vigilancia del CSV y cierra el proveedor de perfiles y los pools de procesos e hilos"""
+    if tarea_vigilancia is not None:
+        tarea_vigilancia.cancel()
+        try:
+            await tarea_vigilancia
+        except asyncio.CancelledError:
+            pass
+    if proveedor_perfiles is not None:
+        await proveedor_perfiles.cerrar()
+    if orquestador_paralelo is not None:
+        orquestador_paralelo.cerrar()
+    orquestador.cerrar()
+    almacen_checkpoints.cerrar()
+
+
+async def obtener_perfiles_async(clientes: List[Cliente]) -> Dict[str, PerfilSocial]:
+    """
+    Perfiles de un lote desde la caché o el proveedor asíncrono, sin bloquear el event loop
+
+    Returns:
+        Dict id_cliente -> perfil; vacío si el proveedor falla (el orquestador
+        genera entonces los perfiles en proceso)
+    """
+    if proveedor_perfiles is None or not clientes:
+        return {}
+    try:
+        perfiles = await cache_perfiles.obtener_lote_async(clientes, proveedor_perfiles.obtener_perfiles)
+    except ErrorProveedor as e:
+        print(f"⚠️ Proveedor de perfiles no disponible ({e}); se generan en proceso")
+        return {}
+    return {p.id_cliente: p for p in perfiles}
+
+
+async def lotes_con_perfiles(
+    lotes: Iterable[List],
+    clientes_de: Callable[[List], List[Cliente]]
+) -> AsyncIterator[Tuple[List, Dict[str, PerfilSocial]]]:
+    """
+    Entrega cada lote con sus perfiles, pedidos lote a lote
+
+    Los perfiles del lote siguiente se piden mientras se procesa el actual:
+    la latencia del proveedor queda oculta y nunca se retienen los de toda
+    la sesión.
+
+    Args:
+        lotes: Lotes a procesar
+        clientes_de: Clientes existentes de un lote
+    """
+    def pedir(lote: Optional[List]) -> Optional[asyncio.Task]:
+        return asyncio.create_task(obtener_perfiles_async(clientes_de(lote))) if lote is not None else None
+
+    lotes = iter(lotes)
+    lote = next(lotes, None)
+    pedido = pedir(lote)
+    try:
+        while lote is not None:
+            perfiles = await pedido
+            siguiente = next(lotes, None)
+            pedido = pedir(siguiente)
+            yield lote, perfiles
+            lote = siguiente
+    finally:
+        if pedido is not None:
+            pedido.cancel()
+
+
+def recargar_clientes() -> Dict:
+    """Recarga el CSV aplicando solo los cambios sobre el almacén"""
+    inicio = time.perf_counter()
+    resumen = clientes_store.recargar(cargar_base_clientes())
+    resumen["segundos_total"] = round(time.perf_counter() - inicio, 4)
+    print(
+        f"🔄 Recarga de clientes: +{resumen['insertados']} ~{resumen['actualizados']} "
+        f"-{resumen['eliminados']} en {resumen['segundos_total']}s (total {resumen['total']})"
+    )
+    return resumen
+
+
+async def vigilar_csv_clientes():
+    """Recarga el CSV cuando cambian su tamaño o fecha de modificación"""
+    def firma():
+        try:
+            stat = os.stat(CLIENTES_CSV_PATH)
+            return stat.st_size, stat.st_mtime_ns
+        except OSError:
+            return None
+    
+    ultima = firma()
+    while True:
+        await asyncio.sleep(CLIENTES_RECARGA_SEGUNDOS)
+        actual = firma()
+        if actual is None or actual == ultima:
+            continue
+        try:
+            await asyncio.to_thread(recargar_clientes)
+            ultima = actual
+        except Exception as e:
+            # Archivo a medio escribir o inválido: se reintenta en el próximo ciclo
+            print(f"❌ Error recargando clientes: {e}")
+
+
+@app.post("/api/clientes/recargar")
+async def recargar_clientes_endpoint():
+    """
+    Recarga el CSV de clientes sin reiniciar el proceso
+    
+    Compara el archivo con la base actual por id_cliente y aplica solo
+    inserciones, actualizaciones y eliminaciones.
+    """
+    if CLIENTES_STREAMING:
+        raise HTTPException(
+            status_code=400,
+            detail="La recarga no aplica en modo streaming (el CSV se lee en cada uso)"
+        )
+    if not os.path.exists(CLIENTES_CSV_PATH):
+        raise HTTPException(
+            status_code=404,
+            detail=f"Archivo CSV no encontrado: {CLIENTES_CSV_PATH}"
+        )
+    try:
+        return await asyncio.to_thread(recargar_clientes)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"CSV no válido: {e}")
+
+
+@app.get("/api/reglas")
+async def obtener_reglas():
+    """Reglas de segmentación vigentes y su id de versión"""
+    reglas = gestor_reglas.actual
+    return {"version": reglas.version, "ruta": str(gestor_reglas.ruta), "reglas": reglas.definicion}
+
+
+@app.post("/api/reglas/recargar")
+async def recargar_reglas():
+    """
+    Recompila el archivo de reglas y lo publica de forma atómica
+    
+    Los clientes en proceso terminan con la versión que tomaron; si el archivo
+    no es válido se mantienen las reglas vigentes.
+    """
+    try:
+        reglas = gestor_reglas.recargar()
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        raise HTTPException(status_code=400, detail=f"Reglas no válidas: {e!r}")
+    print(f"🔄 Reglas de segmentación recargadas: versión {reglas.version}")
+    return {"version": reglas.version}
+
+
+@app.get("/api/metricas/nodos")
+async def metricas_por_nodo():
+    """
+    Latencia por nodo del FSM (p50/p95/p99 en ms) desde el arranque o el último reinicio
+    SEGMENTO_LLM y SEGMENTO_FALLBACK desglosan la espera del LLM y el fallback a reglas;
+    "errores" cuenta los clientes que saltaron al nodo de error y los nodos que se evitaron
+    """
+    return {
+        "nodos": orquestador.metricas.resumen(),
+        "errores": orquestador.metricas.resumen_errores(),
+        "paralelo": orquestador_paralelo is not None
+    }
+
+
+@app.post("/api/metricas/nodos/reiniciar")
+async def reiniciar_metricas_por_nodo():
+    """Descarta las mediciones acumuladas (p. ej. antes de una prueba de carga)"""
+    orquestador.metricas.reiniciar()
+    return {"reiniciadas": True}
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -92,8 +328,14 @@ async def root():
             <h2>Endpoints disponibles:</h2>
             <ul>
                 <li><a href="/api/clientes">GET /api/clientes</a> - Lista de clientes</li>
+                <li>POST /api/clientes/recargar - Recargar el CSV de clientes</li>
+                <li><a href="/api/reglas">GET /api/reglas</a> - Reglas de segmentación vigentes</li>
+                <li>POST /api/reglas/recargar - Recargar las reglas de segmentación</li>
+                <li><a href="/api/metricas/nodos">GET /api/metricas/nodos</a> - Latencia p50/p95/p99 por nodo del agente</li>
                 <li>POST /api/agente/ejecutar - Ejecutar agente</li>
+                <li>POST /api/agente/reanudar/:sessionId - Reanudar una sesión interrumpida</li>
                 <li>GET /api/agente/logs/:sessionId - Logs en tiempo real (SSE)</li>
+                <li>GET /api/agente/uso/:sessionId - Uso del LLM de la sesión (tokens, 429)</li>
                 <li>GET /api/resultados/:sessionId - Obtener resultados</li>
                 <li>GET /api/export/:sessionId/:formato - Exportar (json/csv/html)</li>
             </ul>
@@ -105,23 +347,132 @@ async def root():
 
 
 @app.get("/api/clientes", response_model=ClienteListResponse)
-async def obtener_clientes():
-    """Obtiene la lista de clientes desde el CSV"""
-    global clientes_cache
+async def obtener_clientes(
+    request: Request,
+    sector: Optional[str] = None,
+    riesgo: Optional[str] = None,
+    red_social: Optional[str] = None,
+    gasto_min: Optional[float] = None,
+    gasto_max: Optional[float] = None,
+    orden: Optional[str] = Query(None, description="Campo de orden, prefijo '-' para descendente"),
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, description="Tamaño de página (sin límite si se omite)"),
+    cursor: Optional[str] = Query(None, description="siguiente_cursor de la página anterior"),
+    fields: Optional[str] = Query(None, description="Campos a incluir, separados por coma")
+):
+    """
+    Obtiene la lista de clientes desde el CSV
+    
+    Soporta paginación (offset/limit o cursor), filtros por sector, riesgo,
+    red social y rango de gasto, orden y proyección de campos. Sin parámetros
+    retorna la lista completa, como antes.
     
-    if not clientes_cache:
+    La respuesta se sirve pre-serializada desde caché con ETag fuerte (uno
+    para el JSON y otro para su versión gzip); un If-None-Match vigente
+    responde 304 sin cuerpo.
+    """
+    if CLIENTES_STREAMING:
+        if not os.path.exists(CLIENTES_CSV_PATH):
+            raise HTTPException(
+                status_code=404,
+                detail=f"No se encontraron clientes: {CLIENTES_CSV_PATH}"
+            )
+        if any(p is not None for p in (sector, riesgo, red_social, gasto_min, gasto_max, orden, limit, cursor, fields)) or offset:
+            raise HTTPException(
+                status_code=400,
+                detail="Filtros y paginación no disponibles en modo streaming"
+            )
+        return StreamingResponse(stream_clientes_json(), media_type="application/json")
+    
+    if not clientes_store:
         try:
-            clientes_cache = cargar_clientes_csv(CLIENTES_CSV_PATH)
+            clientes_store.reemplazar_columnas(cargar_base_clientes())
         except Exception as e:
             raise HTTPException(
                 status_code=404,
                 detail=f"No se encontraron clientes: {e}"
             )
     
-    return ClienteListResponse(
-        clientes=clientes_cache,
-        total=len(clientes_cache)
+    campos = [c.strip() for c in fields.split(",") if c.strip()] if fields else None
+    desconocidos = [c for c in campos or [] if c not in COLUMNAS_CLIENTE]
+    if desconocidos:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Campos no válidos: {', '.join(desconocidos)}. Use: {', '.join(COLUMNAS_CLIENTE)}"
+        )
+    if orden and orden.lstrip("-") not in COLUMNAS_CLIENTE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Orden no válido: {orden}. Use: {', '.join(COLUMNAS_CLIENTE)}"
+        )
+    if cursor:
+        offset = leer_cursor(cursor)
+    
+    filtros = dict(
+        sector=sector,
+        riesgo=riesgo,
+        red_social=red_social,
+        gasto_min=gasto_min,
+        gasto_max=gasto_max,
+        orden=orden,
+        offset=offset,
+        limit=limit
     )
+    
+    def generar():
+        posiciones, total = clientes_store.consultar(**filtros)
+        siguiente = offset + len(posiciones)
+        return {
+            "clientes": clientes_store.filas(posiciones, campos),
+            "total": total,
+            "offset": offset,
+            "limit": limit,
+            "siguiente_cursor": crear_cursor(siguiente) if limit and siguiente < total else None
+        }
+    
+    clave = (tuple(filtros.items()), tuple(campos or ()))
+    respuesta = clientes_respuestas.obtener(clave, clientes_store.version, generar)
+    
+    cuerpo, etag, comprimido = respuesta.variante(request.headers.get("accept-encoding"))
+    headers = {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if respuesta.coincide(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    if comprimido:
+        headers["Content-Encoding"] = "gzip"
+    return Response(content=cuerpo, media_type="application/json", headers=headers)
+
+
+def crear_cursor(offset: int) -> str:
+    """Cursor opaco de paginación: offset + versión del almacén"""
+    datos = json.dumps({"v": clientes_store.version, "o": offset}).encode()
+    return base64.urlsafe_b64encode(datos).decode()
+
+
+def leer_cursor(cursor: str) -> int:
+    """Retorna el offset de un cursor, validando que la base no haya cambiado"""
+    try:
+        datos = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        version, offset = int(datos["v"]), int(datos["o"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor no válido")
+    if version != clientes_store.version:
+        raise HTTPException(
+            status_code=409,
+            detail="La base de clientes cambió; reinicie la paginación"
+        )
+    return offset
+
+
+def stream_clientes_json() -> Iterator[str]:
+    """Serializa la lista de clientes lote a lote (mismo formato que ClienteListResponse)"""
+    total = 0
+    separador = ""
+    yield '{"clientes":['
+    for lote in iterar_clientes_csv(CLIENTES_CSV_PATH, CLIENTES_LOTE_SIZE):
+        yield separador + ",".join(c.model_dump_json() for c in lote)
+        separador = ","
+        total += len(lote)
+    yield f'],"total":{total}}}'
 
 
 @app.post("/api/agente/ejecutar", response_model=EjecutarAgenteResponse)
@@ -130,11 +481,15 @@ async def ejecutar_agente(request: EjecutarAgenteRequest):
     Ejecuta el agente FSM para uno o varios clientes
     Compatible con el frontend Next.js
     """
-    global clientes_cache
-    
-    if not clientes_cache:
+    if CLIENTES_STREAMING:
+        if not os.path.exists(CLIENTES_CSV_PATH):
+            raise HTTPException(
+                status_code=404,
+                detail=f"No se encontraron clientes: {CLIENTES_CSV_PATH}"
+            )
+    elif not clientes_store:
         try:
-            clientes_cache = cargar_clientes_csv(CLIENTES_CSV_PATH)
+            clientes_store.reemplazar_columnas(cargar_base_clientes())
         except Exception as e:
             raise HTTPException(
                 status_code=404,
@@ -149,6 +504,10 @@ async def ejecutar_agente(request: EjecutarAgenteRequest):
     
     # Crear sesión
     session_id = session_manager.create_session(request.clienteIds)
+    await asyncio.to_thread(
+        almacen_checkpoints.crear_sesion,
+        session_id, request.clienteIds, session_manager.get_session(session_id)["created_at"]
+    )
     
     # Ejecutar agente de forma asíncrona
     asyncio.create_task(procesar_clientes_async(session_id, request.clienteIds))
@@ -159,46 +518,99 @@ async def ejecutar_agente(request: EjecutarAgenteRequest):
     )
 
 
+def buscar_clientes(client_ids: List[str]) -> Iterator[Tuple[str, Optional[Cliente]]]:
+    """
+    Busca los clientes solicitados
+    
+    En modo streaming recorre el CSV una sola vez por lotes y entrega los clientes
+    en el orden del archivo; los ids no encontrados se entregan al final con None.
+    """
+    if not CLIENTES_STREAMING:
+        for client_id in client_ids:
+            yield client_id, clientes_store.obtener(client_id)
+        return
+    
+    pendientes = set(client_ids)
+    for lote in iterar_clientes_csv(CLIENTES_CSV_PATH, CLIENTES_LOTE_SIZE):
+        for cliente in lote:
+            if cliente.id_cliente in pendientes:
+                pendientes.discard(cliente.id_cliente)
+                yield cliente.id_cliente, cliente
+        if not pendientes:
+            return
+    for client_id in client_ids:
+        if client_id in pendientes:
+            yield client_id, None
+
+
+def registrar_estado(session_id: str, client_id: str, estado_final: Optional[EstadoAgente]):
+    """Agrega a la sesión los logs y el resultado de un cliente (o el error si no existe)"""
+    if estado_final is None:
+        # Log de error
+        error_log = LogEntry(
+            state="ERROR",
+            timestamp=datetime.now().isoformat(),
+            message=f"Cliente {client_id} no encontrado"
+        )
+        session_manager.add_log(session_id, error_log)
+        almacen_checkpoints.registrar(session_id, client_id, None)
+        return
+
+    # Agregar logs a la sesión (se formatean cuando el stream SSE los envía)
+    session_manager.add_bitacora(session_id, estado_final.logs)
+
+    # Convertir resultado al formato del frontend
+    result = None
+    if estado_final.resultado and estado_final.segmento:
+        mensaje_base = decisor.obtener_mensaje_base(estado_final.segmento)
+        result = estado_to_agent_result(estado_final, session_id, mensaje_base)
+        session_manager.add_result(session_id, result)
+    almacen_checkpoints.registrar(session_id, client_id, result)
+
+
+async def vaciar_checkpoints():
+    """Escribe los clientes terminados en el checkpoint cuando toca, fuera del event loop"""
+    if almacen_checkpoints.debe_vaciar():
+        await asyncio.to_thread(almacen_checkpoints.vaciar)
+
+
 async def procesar_clientes_async(session_id: str, client_ids: List[str]):
     """Procesa clientes de forma asíncrona"""
+    # El uso de tokens del LLM se atribuye a esta sesión (la tarea tiene su propio contexto)
+    sesion_llm.set(session_id)
     try:
-        for client_id in client_ids:
-            # Buscar cliente
-            cliente = next(
-                (c for c in clientes_cache if c.id_cliente == client_id),
-                None
+        if orquestador_paralelo is not None and not CLIENTES_STREAMING:
+            # Modo paralelo: los lotes se registran en el orden pedido, cada uno apenas está listo.
+            # Los perfiles se piden por lote, justo antes de enviarlo a un worker
+            async def perfiles_lote(ids: List[str]) -> Dict[str, PerfilSocial]:
+                return await obtener_perfiles_async([c for c in map(clientes_store.obtener, ids) if c])
+
+            async for lote in orquestador_paralelo.procesar(
+                clientes_store, client_ids, obtener_perfiles=perfiles_lote
+            ):
+                for client_id, estado_final in lote:
+                    registrar_estado(session_id, client_id, estado_final)
+                await vaciar_checkpoints()
+        else:
+            # En modo streaming la búsqueda recorre el CSV: se hace fuera del event loop
+            encontrados = await asyncio.to_thread(lambda: list(buscar_clientes(client_ids)))
+            lotes = lotes_con_perfiles(
+                iterar_en_lotes(encontrados, AGENTE_LOTE_SIZE),
+                lambda lote: [cliente for _, cliente in lote if cliente]
             )
-            
-            if not cliente:
-                # Log de error
-                error_log = LogEntry(
-                    state="ERROR",
-                    timestamp=datetime.now().isoformat(),
-                    message=f"Cliente {client_id} no encontrado"
-                )
-                session_manager.add_log(session_id, error_log)
-                continue
-            
-            # Ejecutar agente
-            estado_final = orquestador.ejecutar(cliente)
-            
-            # Agregar logs a la sesión
-            for log in estado_final.logs:
-                log_entry = LogEntry(
-                    state=log.get("estado", "UNKNOWN"),
-                    timestamp=log.get("timestamp", datetime.now().isoformat()),
-                    message=log.get("mensaje", ""),
-                    data=log.get("data")
-                )
-                session_manager.add_log(session_id, log_entry)
-            
-            # Convertir resultado al formato del frontend
-            if estado_final.resultado and estado_final.segmento:
-                mensaje_base = decisor.obtener_mensaje_base(estado_final.segmento)
-                result = estado_to_agent_result(estado_final, session_id, mensaje_base)
-                session_manager.add_result(session_id, result)
+
+            async for lote, perfiles in lotes:
+                validos = [cliente for _, cliente in lote if cliente]
+                # Ejecutar agente sobre el lote completo, etapa por etapa y fuera del event loop
+                estados = iter(await orquestador.ejecutar_lote_async(
+                    validos, [perfiles.get(cliente.id_cliente) for cliente in validos]
+                ))
+                for client_id, cliente in lote:
+                    registrar_estado(session_id, client_id, next(estados) if cliente else None)
+                await vaciar_checkpoints()
         
         # Marcar sesión como completada
+        await asyncio.to_thread(almacen_checkpoints.completar, session_id)
         session_manager.complete_session(session_id)
         
     except Exception as e:
@@ -209,6 +621,55 @@ async def procesar_clientes_async(session_id: str, client_ids: List[str]):
         )
         session_manager.add_log(session_id, error_log)
         session_manager.complete_session(session_id)
+        # El progreso queda guardado y la sesión sigue pendiente: se puede reanudar
+        await asyncio.to_thread(almacen_checkpoints.vaciar)
+
+
+# Sesiones cuya reanudación está en curso (el endpoint espera al checkpoint antes de restaurarlas)
+sesiones_reanudando: Set[str] = set()
+
+
+@app.post("/api/agente/reanudar/{session_id}", response_model=EjecutarAgenteResponse)
+async def reanudar_sesion(session_id: str):
+    """
+    Retoma una sesión interrumpida (p. ej. por un reinicio) desde su checkpoint
+    Solo se procesan los clientes que no habían terminado
+    """
+    sesion = session_manager.get_session(session_id)
+    if session_id in sesiones_reanudando or (sesion and sesion["status"] == "running"):
+        raise HTTPException(status_code=409, detail="La sesión sigue en ejecución")
+    # Se marca antes del primer await: otra reanudación simultánea recibe 409 en lugar de duplicar el trabajo
+    sesiones_reanudando.add(session_id)
+    try:
+        checkpoint = await asyncio.to_thread(almacen_checkpoints.cargar, session_id)
+        if checkpoint is None:
+            raise HTTPException(status_code=404, detail="No hay checkpoint para esta sesión")
+        
+        pendientes = checkpoint["pendientes"]
+        session_manager.restaurar_sesion(
+            session_id, checkpoint["client_ids"], checkpoint["resultados"], checkpoint["created_at"]
+        )
+        session_manager.add_log(session_id, LogEntry(
+            state="INGESTA",
+            timestamp=datetime.now().isoformat(),
+            message=f"Sesión reanudada: {checkpoint['terminados']} cliente(s) ya procesados, {len(pendientes)} pendiente(s)"
+        ))
+        print(f"💾 Reanudando {session_id}: {len(pendientes)} de {len(checkpoint['client_ids'])} cliente(s) pendientes")
+        
+        if pendientes:
+            await asyncio.to_thread(almacen_checkpoints.reabrir, session_id)
+            asyncio.create_task(procesar_clientes_async(session_id, pendientes))
+        else:
+            await asyncio.to_thread(almacen_checkpoints.completar, session_id)
+            session_manager.complete_session(session_id)
+    finally:
+        # Para entonces la sesión ya figura como running (o completada) en session_manager
+        sesiones_reanudando.discard(session_id)
+    
+    return EjecutarAgenteResponse(
+        sessionId=session_id,
+        message=f"Reanudando {len(pendientes)} de {len(checkpoint['client_ids'])} cliente(s)"
+    )
 
 
 @app.get("/api/agente/logs/{session_id}")
@@ -247,7 +708,7 @@ async def stream_logs(session_id: str):
             
             # Obtener nuevos logs
             logs = session.get("logs", [])
-            new_logs = logs[last_log_count:]
+            new_logs = session_manager.formatear_logs(logs[last_log_count:])
             
             # Enviar nuevos logs
             for log in new_logs:
@@ -281,6 +742,21 @@ async def stream_logs(session_id: str):
     )
 
 
+@app.get("/api/agente/uso/{session_id}")
+async def obtener_uso_llm(session_id: str):
+    """
+    Uso del LLM de una sesión: solicitudes, tokens, reintentos por 429 y espera en cola
+    En modo paralelo (AGENTE_WORKERS) las llamadas ocurren en los workers y no se registran aquí
+    """
+    if not session_manager.session_exists(session_id):
+        raise HTTPException(status_code=404, detail="Sesión no encontrada")
+    
+    return {
+        "sessionId": session_id,
+        "uso": planificador_llm.uso_sesion(session_id)
+    }
+
+
 @app.get("/api/resultados/{session_id}")
 async def obtener_resultados(session_id: str):
     """
@@ -339,40 +815,10 @@ async def exportar(session_id: str, formato: str):
             detail="No hay resultados disponibles para esta sesión"
         )
     
-    # Convertir AgentResult a ResultadoCampaña para la exportación
-    from app.models import ResultadoCampaña, Campaña as CampañaBackend
-    
-    resultados_backend = []
-    for result in results:
-        # Convertir campaña frontend a backend
-        campaña_backend = CampañaBackend(
-            id_campaña=f"CAMP-{result.segmento.tipo[:3].upper()}",
-            nombre=result.campaña.titulo,
-            plantilla=result.campaña.plantilla,
-            cta=result.campaña.cta,
-            canal=result.campaña.canal_sugerido or "email",
-            segmento_target=result.segmento.tipo
-        )
-        
-        resultado_backend = ResultadoCampaña(
-            id_cliente=result.cliente.id_cliente,
-            nombre=result.cliente.nombre,
-            segmento=result.segmento.tipo,
-            campaña=campaña_backend,
-            mensaje_html=result.htmlOutput,
-            mensaje_json=result.dict(),
-            métricas_simuladas={
-                "ctr_estimado": 0.05,
-                "tasa_apertura_estimada": 0.25
-            }
-        )
-        resultados_backend.append(resultado_backend)
-    
-    # Exportar según formato
+    # Exportar según formato (json y csv se envían por lotes)
     if formato == "json":
-        content = exportar_resultados_json(resultados_backend)
-        return Response(
-            content=content,
+        return StreamingResponse(
+            iterar_exportacion_json(iterar_en_lotes(resultados_a_backend(results), CLIENTES_LOTE_SIZE)),
             media_type="application/json",
             headers={
                 "Content-Disposition": f"attachment; filename=campañas_{session_id}.json"
@@ -380,9 +826,8 @@ async def exportar(session_id: str, formato: str):
         )
     
     elif formato == "csv":
-        content = exportar_resultados_csv(resultados_backend)
-        return Response(
-            content=content,
+        return StreamingResponse(
+            iterar_exportacion_csv(iterar_en_lotes(resultados_a_backend(results), CLIENTES_LOTE_SIZE)),
             media_type="text/csv",
             headers={
                 "Content-Disposition": f"attachment; filename=campañas_{session_id}.csv"
@@ -390,7 +835,7 @@ async def exportar(session_id: str, formato: str):
         )
     
     elif formato == "html":
-        content = exportar_resultados_html(resultados_backend)
+        content = exportar_resultados_html(list(resultados_a_backend(results)))
         return Response(
             content=content,
             media_type="text/html",
@@ -406,13 +851,49 @@ async def exportar(session_id: str, formato: str):
         )
 
 
+def resultados_a_backend(results: List[AgentResult]) -> Iterator[ResultadoCampaña]:
+    """Convierte AgentResult a ResultadoCampaña para la exportación"""
+    for result in results:
+        # Convertir campaña frontend a backend
+        campaña_backend = CampañaBackend(
+            id_campaña=f"CAMP-{result.segmento.tipo[:3].upper()}",
+            nombre=result.campaña.titulo,
+            plantilla=result.campaña.plantilla,
+            cta=result.campaña.cta,
+            canal=result.campaña.canal_sugerido or "email",
+            segmento_target=result.segmento.tipo
+        )
+        
+        yield ResultadoCampaña(
+            id_cliente=result.cliente.id_cliente,
+            nombre=result.cliente.nombre,
+            segmento=result.segmento.tipo,
+            campaña=campaña_backend,
+            mensaje_html=result.htmlOutput,
+            mensaje_json=result.dict(),
+            métricas_simuladas={
+                "ctr_estimado": 0.05,
+                "tasa_apertura_estimada": 0.25
+            }
+        )
+
+
 @app.get("/health")
 async def health_check():
     """Health check para monitoreo"""
     return {
         "status": "healthy",
-        "clientes_loaded": len(clientes_cache),
-        "use_genai": use_genai
+        "clientes_loaded": len(clientes_store),
+        "cache_clientes": clientes_respuestas.estadisticas(),
+        "cache_perfiles": cache_perfiles.estadisticas(),
+        "cache_llm": cache_llm.estadisticas(),
+        "planificador_llm": planificador_llm.estadisticas(),
+        "segmentacion_especulativa": orquestador.estadisticas_especulacion(),
+        "proveedor_perfiles": proveedor_perfiles.estadisticas() if proveedor_perfiles else None,
+        "paralelo": orquestador_paralelo.estadisticas() if orquestador_paralelo else None,
+        "checkpoints": almacen_checkpoints.estadisticas(),
+        "use_genai": use_genai,
+        "reglas_version": gestor_reglas.actual.version
     }
 
 
@@ -0,0 +1,156 @@
+"""
+Métricas de latencia por nodo del FSM
+Cada etapa del orquestador registra su duración (reloj monotónico) en un
+histograma de cubetas logarítmicas; de ahí salen p50/p95/p99 sin guardar
+cada muestra. En SEGMENTO se separan además el tiempo de espera del LLM
+(SEGMENTO_LLM) y el del fallback a reglas (SEGMENTO_FALLBACK).
+
+Las etapas procesan lotes: la duración de una etapa se registra una vez por
+cliente del lote, porque es lo que cada cliente esperó en ese nodo.
+
+También se cuentan los clientes que terminan en ERROR: en qué nodo fallaron,
+cuántos nodos corrieron para nada (su trabajo se descarta) y cuántos se
+evitaron al saltar directo al nodo de error.
+"""
+import bisect
+import math
+import threading
+from typing import Dict, List
+
+# Nodos en el orden del flujo (los desgloses de SEGMENTO van junto a él)
+NODOS = ("INGESTA", "PERFIL", "SEGMENTO", "SEGMENTO_LLM", "SEGMENTO_FALLBACK", "CAMPAÑA", "SALIDA")
+# Nodos del camino principal del FSM, en orden
+ETAPAS = ("INGESTA", "PERFIL", "SEGMENTO", "CAMPAÑA", "SALIDA")
+
+
+def _limites_cubetas(minimo: float = 1e-6, maximo: float = 600.0, factor: float = 1.15) -> List[float]:
+    """Límites superiores de las cubetas: progresión geométrica (error relativo < factor - 1)"""
+    cantidad = math.ceil(math.log(maximo / minimo, factor))
+    return [minimo * factor ** i for i in range(cantidad + 1)]
+
+
+LIMITES = _limites_cubetas()
+
+
+class HistogramaLatencia:
+    """Histograma de duraciones en segundos con cubetas logarítmicas fijas"""
+
+    def __init__(self):
+        self.conteos = [0] * (len(LIMITES) + 1)
+        self.total = 0
+        self.suma = 0.0
+        self.maximo = 0.0
+
+    def registrar(self, segundos: float, veces: int = 1):
+        """Agrega una duración (veces = clientes que la esperaron)"""
+        self.conteos[bisect.bisect_left(LIMITES, segundos)] += veces
+        self.total += veces
+        self.suma += segundos * veces
+        self.maximo = max(self.maximo, segundos)
+
+    def percentil(self, p: float) -> float:
+        """
+        Percentil aproximado
+
+        Args:
+            p: Percentil entre 0 y 100
+
+        Returns:
+            Media geométrica de la cubeta que lo contiene (acotada al máximo observado)
+        """
+        if not self.total:
+            return 0.0
+        objetivo = max(1, math.ceil(self.total * p / 100))
+        acumulado = 0
+        for i, conteo in enumerate(self.conteos):
+            acumulado += conteo
+            if acumulado >= objetivo:
+                if i == 0:
+                    return min(LIMITES[0], self.maximo)
+                if i == len(LIMITES):
+                    return self.maximo
+                return min(math.sqrt(LIMITES[i - 1] * LIMITES[i]), self.maximo)
+        return self.maximo
+
+    def resumen(self) -> Dict:
+        """Conteo, media, percentiles y máximo en milisegundos"""
+        return {
+            "clientes": self.total,
+            "total_segundos": round(self.suma, 4),
+            "media_ms": round(self.suma / self.total * 1000, 4) if self.total else 0.0,
+            "p50_ms": round(self.percentil(50) * 1000, 4),
+            "p95_ms": round(self.percentil(95) * 1000, 4),
+            "p99_ms": round(self.percentil(99) * 1000, 4),
+            "max_ms": round(self.maximo * 1000, 4)
+        }
+
+
+class MetricasNodos:
+    """Histogramas de latencia y conteo de errores por nodo, seguros entre hilos"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histogramas: Dict[str, HistogramaLatencia] = {nodo: HistogramaLatencia() for nodo in NODOS}
+        self._errores: Dict[str, int] = {}
+        self.nodos_desperdiciados = 0
+        self.nodos_omitidos = 0
+
+    def registrar(self, nodo: str, segundos: float, clientes: int = 1):
+        """
+        Registra la duración de un nodo
+
+        Args:
+            nodo: Nombre del nodo (ver NODOS)
+            segundos: Duración medida con time.perf_counter
+            clientes: Clientes del lote que esperaron esa duración
+        """
+        if clientes <= 0:
+            return
+        with self._lock:
+            if nodo not in self._histogramas:
+                self._histogramas[nodo] = HistogramaLatencia()
+            self._histogramas[nodo].registrar(segundos, clientes)
+
+    def registrar_error(self, nodo: str):
+        """
+        Registra un cliente que falló en un nodo y saltó al nodo de error
+
+        Args:
+            nodo: Nodo de ETAPAS donde falló
+        """
+        posicion = ETAPAS.index(nodo) if nodo in ETAPAS else 0
+        with self._lock:
+            self._errores[nodo] = self._errores.get(nodo, 0) + 1
+            # Los nodos hasta el que falló (inclusive) corrieron para nada; los siguientes se evitaron
+            self.nodos_desperdiciados += posicion + 1
+            self.nodos_omitidos += len(ETAPAS) - posicion - 1
+
+    def resumen(self) -> Dict[str, Dict]:
+        """p50/p95/p99 y errores por nodo, en el orden del flujo"""
+        with self._lock:
+            return {
+                nodo: {**histograma.resumen(), "errores": self._errores.get(nodo, 0)}
+                for nodo, histograma in self._histogramas.items()
+            }
+
+    def resumen_errores(self) -> Dict:
+        """Clientes con error, por nodo, y nodos desperdiciados/evitados"""
+        with self._lock:
+            return {
+                "clientes_con_error": sum(self._errores.values()),
+                "por_nodo": dict(self._errores),
+                "nodos_desperdiciados": self.nodos_desperdiciados,
+                "nodos_omitidos": self.nodos_omitidos
+            }
+
+    def reiniciar(self):
+        """Descarta las mediciones acumuladas"""
+        with self._lock:
+            self._histogramas = {nodo: HistogramaLatencia() for nodo in NODOS}
+            self._errores = {}
+            self.nodos_desperdiciados = 0
+            self.nodos_omitidos = 0
+
+
+# Instancia global, compartida por todos los orquestadores del proceso
+metricas_nodos = MetricasNodos()
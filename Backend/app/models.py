@@ -1,7 +1,9 @@
-from pydantic import BaseModel
-from typing import Optional, Dict, List
+from pydantic import BaseModel, Field, PlainSerializer, TypeAdapter
+from typing import Annotated, Optional, Dict, List
 from enum import Enum
 
+from app.eventos import BitacoraEventos
+
 
 class Estado(str, Enum):
     INGESTA = "INGESTA"
@@ -59,6 +61,7 @@ class SegmentoFrontend(BaseModel):
     tipo: str
     score: int
     rationale: str
+    reglas_version: Optional[str] = None
 
 
 class Campaña(BaseModel):
@@ -98,8 +101,11 @@ class EstadoAgente(BaseModel):
     segmento: Optional[Segmento] = None
     campaña: Optional[Campaña] = None
     resultado: Optional[ResultadoCampaña] = None
-    logs: List[Dict] = []
+    logs: BitacoraEventos = Field(default_factory=BitacoraEventos)
     error: Optional[str] = None
+    # Nodo en el que ocurrió el error (lo fija el nodo que falla)
+    nodo_error: Optional[Estado] = None
+    reglas_version: Optional[str] = None
 
 
 # Modelos para la API compatible con frontend
@@ -111,13 +117,29 @@ class LogEntry(BaseModel):
     data: Optional[Dict] = None
 
 
+class _EsquemaLogEntries:
+    """Documenta la bitácora como List[LogEntry] sin validar cada entrada al serializar"""
+
+    @classmethod
+    def __get_pydantic_json_schema__(cls, esquema, handler):
+        return handler(TypeAdapter(List[LogEntry]).core_schema)
+
+
+# Bitácora que se formatea como lista de LogEntry al serializar la respuesta
+LogsFrontend = Annotated[
+    BitacoraEventos,
+    PlainSerializer(lambda b: b.como_log_entries(), return_type=List[Dict]),
+    _EsquemaLogEntries
+]
+
+
 class AgentResult(BaseModel):
     """Resultado del agente compatible con el frontend"""
     cliente: Cliente
     perfil: PerfilSocialFrontend
     segmento: SegmentoFrontend
     campaña: CampañaFrontend
-    logs: List[LogEntry]
+    logs: LogsFrontend
     htmlOutput: str
     sessionId: Optional[str] = None
     timestamp: Optional[str] = None
@@ -138,3 +160,6 @@ class ClienteListResponse(BaseModel):
     """Response de lista de clientes"""
     clientes: List[Cliente]
     total: int
+    offset: int = 0
+    limit: Optional[int] = None
+    siguiente_cursor: Optional[str] = None
@@ -2,8 +2,14 @@
 Orquestador FSM con LangGraph
 Controla el flujo: INGESTA → PERFIL → SEGMENTO → CAMPAÑA → SALIDA
 """
-from typing import Dict, Any, Literal
+from typing import Callable, Dict, Any, List, Literal, Optional, Sequence, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+import asyncio
+import functools
+import json
+import math
+import time
 from langgraph.graph import StateGraph, END
 from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_openai import ChatOpenAI
@@ -18,271 +24,733 @@ from app.models import (
     Campaña, ResultadoCampaña
 )
 from app.perfilador_social import PerfiladorSocialMock
+from app.cache_perfiles import PerfiladorCacheado, cache_perfiles
+from app.cache_llm import cache_llm, clave_llm
+from app.planificador_llm import LLMPlanificado, planificador_llm
+from app.llm_falso import ChatFalso
 from app.segmentador import Segmentador
+from app.reglas import ReglasCompiladas
 from app.decisor_campaña import DecisorCampaña
 from app.compositor import Compositor
+from app.utils import iterar_en_lotes
+from app.metricas import metricas_nodos
+from app.eventos import Plantilla
+
+SEGMENTOS_DISPONIBLES = """Segmentos disponibles:
+- premium_alto_engagement: Alto gasto, bajo riesgo, alta actividad
+- medio_conservador: Gasto medio, riesgo medio/bajo
+- basico_crecimiento: Bajo gasto, potencial de crecimiento
+- riesgo_alto: Cliente con riesgo alto"""
+
+SEGMENTOS_POR_NOMBRE = {segmento.value: segmento for segmento in Segmento}
+
+
+def parsear_segmentos_json(texto: str, ids: Sequence[str]) -> List[Optional[str]]:
+    """
+    Extrae los segmentos de una respuesta JSON de GenAI para varios clientes
+    
+    Acepta un arreglo de objetos {"id", "segmento"} (se asocian por id) o de
+    textos (se asocian por posición). Los clientes sin respuesta válida quedan
+    en None para que se use el fallback por reglas.
+    
+    Args:
+        texto: Respuesta del modelo (puede traer texto alrededor del arreglo)
+        ids: Ids de los clientes del prompt, en orden
+        
+    Returns:
+        Segmento sugerido (texto sin normalizar) o None, por cliente
+    """
+    inicio, fin = texto.find("["), texto.rfind("]")
+    try:
+        elementos = json.loads(texto[inicio:fin + 1]) if 0 <= inicio < fin else []
+    except ValueError:
+        elementos = []
+    if not isinstance(elementos, list):
+        return [None] * len(ids)
+    
+    por_id: Dict[str, str] = {}
+    por_posicion: List[Optional[str]] = [None] * len(ids)
+    for posicion, elemento in enumerate(elementos):
+        if isinstance(elemento, dict) and isinstance(elemento.get("segmento"), str):
+            if "id" in elemento:
+                por_id[str(elemento["id"])] = elemento["segmento"]
+            elif posicion < len(ids):
+                por_posicion[posicion] = elemento["segmento"]
+        elif isinstance(elemento, str) and posicion < len(ids):
+            por_posicion[posicion] = elemento
+    return [por_id.get(id_cliente, por_posicion[i]) for i, id_cliente in enumerate(ids)]
+
+
+def _cronometrada(nodo: str) -> Callable:
+    """Registra la duración de una etapa en las métricas del orquestador (una vez por cliente del lote)"""
+    def decorador(etapa: Callable) -> Callable:
+        @functools.wraps(etapa)
+        def medida(self, estados: List[EstadoAgente]) -> List[EstadoAgente]:
+            inicio = time.perf_counter()
+            try:
+                return etapa(self, estados)
+            finally:
+                self.metricas.registrar(nodo, time.perf_counter() - inicio, len(estados))
+        return medida
+    return decorador
 
 
 class OrquestadorAgente:
     """Orquestador que controla el flujo del agente con FSM"""
     
-    def __init__(self, use_genai: bool = False):
+    def __init__(self, use_genai: bool = False, ruta_directa: Optional[bool] = None):
         """
         Inicializa el orquestador
         
         Args:
             use_genai: Si True, usa OpenAI para decisiones. Si False, solo reglas.
+            ruta_directa: Si True, ejecutar() encadena los nodos sin LangGraph.
+                Por defecto se activa sola cuando no hay LLM configurado.
         """
         self.use_genai = use_genai
-        self.perfilador = PerfiladorSocialMock()
+        self.perfilador = PerfiladorCacheado(PerfiladorSocialMock(), cache_perfiles)
         self.segmentador = Segmentador()
         self.decisor = DecisorCampaña()
         self.compositor = Compositor()
         
-        if use_genai and os.getenv("OPENAI_API_KEY"):
-            self.llm = ChatOpenAI(
+        # Las llamadas pasan por el planificador (RPM/TPM, deadline y reintentos ante 429)
+        if use_genai and os.getenv("LLM_PROVEEDOR", "openai").lower() == "falso":
+            self.llm = LLMPlanificado(ChatFalso.desde_entorno(), planificador_llm)
+        elif use_genai and os.getenv("OPENAI_API_KEY"):
+            self.llm = LLMPlanificado(ChatOpenAI(
                 model="gpt-3.5-turbo",
-                temperature=0.3
-            )
+                temperature=0.3,
+                max_retries=0  # los reintentos los hace el planificador
+            ), planificador_llm)
         else:
             self.llm = None
         
-        # Construir el grafo de estados
+        # Construir el grafo de estados (síncrono y asíncrono, mismos nodos)
         self.graph = self._construir_grafo()
+        self.graph_async = self._construir_grafo(asincrono=True)
+        
+        # Pool acotado para el trabajo de CPU de la API asíncrona, fuera del event loop
+        self._hilos = ThreadPoolExecutor(
+            max_workers=int(os.getenv("AGENTE_HILOS", "4")),
+            thread_name_prefix="agente"
+        )
+        # Llamadas simultáneas al LLM al segmentar un lote (llm.batch / llm.abatch)
+        self.max_concurrencia_llm = int(os.getenv("LLM_MAX_CONCURRENCIA", "8"))
+        # Clientes por prompt al segmentar con GenAI (>1 = prompt estructurado con respuesta JSON)
+        self.clientes_por_prompt = int(os.getenv("LLM_CLIENTES_POR_PROMPT", "1"))
+        # Respuestas ya conocidas del LLM (ver app/cache_llm.py)
+        self.cache_llm = cache_llm
+        # Reglas primero: solo van al LLM los clientes a menos de este margen relativo
+        # de un umbral de las reglas (0 = todos van al LLM)
+        self.margen_confianza = float(os.getenv("LLM_MARGEN_CONFIANZA", "0"))
+        self.clientes_especulados = 0
+        self.clientes_sin_llm = 0
+        self.clientes_con_llm = 0
+        self.segundos_llm = 0.0
+        # Histogramas de latencia por nodo (ver app/metricas.py)
+        self.metricas = metricas_nodos
+        
+        # Sin LLM el grafo es una cadena lineal fija: se puede recorrer directamente
+        self.ruta_directa = self.llm is None if ruta_directa is None else ruta_directa
+        self._pipeline = (
+            self._nodo_ingesta,
+            self._nodo_perfil,
+            self._nodo_segmento,
+            self._nodo_campaña,
+            self._nodo_salida
+        )
     
-    def _construir_grafo(self) -> StateGraph:
-        """Construye el grafo de estados con LangGraph"""
+    def _construir_grafo(self, asincrono: bool = False) -> StateGraph:
+        """
+        Construye el grafo de estados con LangGraph
+        
+        Args:
+            asincrono: Si True usa los nodos async (para graph.ainvoke)
+        """
         workflow = StateGraph(EstadoAgente)
         
         # Agregar nodos
-        workflow.add_node("ingesta", self._nodo_ingesta)
-        workflow.add_node("perfil", self._nodo_perfil)
-        workflow.add_node("segmento", self._nodo_segmento)
-        workflow.add_node("campaña", self._nodo_campaña)
-        workflow.add_node("salida", self._nodo_salida)
+        if asincrono:
+            workflow.add_node("ingesta", self._anodo_ingesta)
+            workflow.add_node("perfil", self._anodo_perfil)
+            workflow.add_node("segmento", self._anodo_segmento)
+            workflow.add_node("campaña", self._anodo_campaña)
+            workflow.add_node("salida", self._anodo_salida)
+        else:
+            workflow.add_node("ingesta", self._nodo_ingesta)
+            workflow.add_node("perfil", self._nodo_perfil)
+            workflow.add_node("segmento", self._nodo_segmento)
+            workflow.add_node("campaña", self._nodo_campaña)
+            workflow.add_node("salida", self._nodo_salida)
         workflow.add_node("error", self._nodo_error)
         
-        # Definir flujo
+        # Definir flujo: si un nodo deja el estado en ERROR se salta directo al nodo de error
         workflow.set_entry_point("ingesta")
-        workflow.add_edge("ingesta", "perfil")
-        workflow.add_edge("perfil", "segmento")
-        workflow.add_edge("segmento", "campaña")
-        workflow.add_edge("campaña", "salida")
-        workflow.add_edge("salida", END)
+        for nodo, siguiente in (
+            ("ingesta", "perfil"),
+            ("perfil", "segmento"),
+            ("segmento", "campaña"),
+            ("campaña", "salida"),
+            ("salida", END)
+        ):
+            workflow.add_conditional_edges(nodo, self._ruta(siguiente), [siguiente, "error"])
         
         # Manejo de errores
         workflow.add_edge("error", END)
         
         return workflow.compile()
     
+    @staticmethod
+    def _ruta(siguiente: str) -> Callable[[EstadoAgente], str]:
+        """Arista condicional: al nodo de error si el estado falló, si no al siguiente"""
+        def ruta(state: EstadoAgente) -> str:
+            return "error" if state.estado_actual == Estado.ERROR else siguiente
+        return ruta
+    
+    # Cada nodo del grafo es la etapa por lotes aplicada a un solo estado; así
+    # ejecutar() y ejecutar_lote() producen exactamente los mismos logs y errores.
+
     def _nodo_ingesta(self, state: EstadoAgente) -> EstadoAgente:
         """Estado INGESTA: Valida entrada del cliente"""
-        try:
-            state.estado_actual = Estado.INGESTA
-            state.logs.append({
-                "estado": "INGESTA",
-                "mensaje": f"Procesando cliente: {state.cliente.id_cliente if state.cliente else 'N/A'}",
-                "timestamp": datetime.now().isoformat()
-            })
-            
-            if not state.cliente:
-                raise ValueError("Cliente no proporcionado")
-            
-            return state
-        except Exception as e:
-            state.estado_actual = Estado.ERROR
-            state.error = str(e)
-            return state
+        return self._etapa_ingesta([state])[0]
     
     def _nodo_perfil(self, state: EstadoAgente) -> EstadoAgente:
         """Estado PERFIL: Genera perfil social"""
-        try:
-            state.estado_actual = Estado.PERFIL
-            state.logs.append({
-                "estado": "PERFIL",
-                "mensaje": "Generando perfil social...",
-                "timestamp": datetime.now().isoformat()
-            })
-            
-            perfil = self.perfilador.generar_señales(state.cliente)
-            state.perfil_social = perfil
-            
-            state.logs.append({
-                "estado": "PERFIL",
-                "mensaje": f"Perfil generado: {perfil.señales.actividad} actividad, {perfil.señales.tono} tono",
-                "timestamp": datetime.now().isoformat()
-            })
-            
-            return state
-        except Exception as e:
-            state.estado_actual = Estado.ERROR
-            state.error = str(e)
-            return state
+        return self._etapa_perfil([state])[0]
     
     def _nodo_segmento(self, state: EstadoAgente) -> EstadoAgente:
         """Estado SEGMENTO: Segmenta al cliente"""
-        try:
+        return self._etapa_segmento([state])[0]
+    
+    def _nodo_campaña(self, state: EstadoAgente) -> EstadoAgente:
+        """Estado CAMPAÑA: Selecciona campaña"""
+        return self._etapa_campaña([state])[0]
+    
+    def _nodo_salida(self, state: EstadoAgente) -> EstadoAgente:
+        """Estado SALIDA: Genera resultado final"""
+        return self._etapa_salida([state])[0]
+    
+    # Versiones async de los nodos: el trabajo de CPU va al pool de hilos y el
+    # LLM se llama con ainvoke, así el event loop nunca se bloquea.
+    
+    async def _en_hilo(self, funcion: Callable, *args):
+        """Ejecuta una función síncrona en el pool acotado del orquestador"""
+        return await asyncio.get_running_loop().run_in_executor(self._hilos, funcion, *args)
+    
+    async def _anodo_ingesta(self, state: EstadoAgente) -> EstadoAgente:
+        return await self._en_hilo(self._nodo_ingesta, state)
+    
+    async def _anodo_perfil(self, state: EstadoAgente) -> EstadoAgente:
+        return await self._en_hilo(self._nodo_perfil, state)
+    
+    async def _anodo_segmento(self, state: EstadoAgente) -> EstadoAgente:
+        return (await self._etapa_segmento_async([state]))[0]
+    
+    async def _anodo_campaña(self, state: EstadoAgente) -> EstadoAgente:
+        return await self._en_hilo(self._nodo_campaña, state)
+    
+    async def _anodo_salida(self, state: EstadoAgente) -> EstadoAgente:
+        return await self._en_hilo(self._nodo_salida, state)
+    
+    @staticmethod
+    def _marcar_error(state: EstadoAgente, e: Exception, nodo: Estado):
+        """Deja el estado en ERROR recordando en qué nodo falló (lo lee _nodo_error)"""
+        state.estado_actual = Estado.ERROR
+        state.error = str(e)
+        state.nodo_error = nodo
+    
+    @_cronometrada("INGESTA")
+    def _etapa_ingesta(self, estados: List[EstadoAgente]) -> List[EstadoAgente]:
+        """Estado INGESTA sobre un lote: valida la entrada de cada cliente"""
+        for state in estados:
+            try:
+                state.estado_actual = Estado.INGESTA
+                state.logs.registrar(
+                    Estado.INGESTA, Plantilla.PROCESANDO_CLIENTE,
+                    state.cliente.id_cliente if state.cliente else 'N/A'
+                )
+                
+                if not state.cliente:
+                    raise ValueError("Cliente no proporcionado")
+            except Exception as e:
+                self._marcar_error(state, e, Estado.INGESTA)
+        return estados
+    
+    @_cronometrada("PERFIL")
+    def _etapa_perfil(self, estados: List[EstadoAgente]) -> List[EstadoAgente]:
+        """Estado PERFIL sobre un lote: genera juntos los perfiles que falten"""
+        for state in estados:
+            state.estado_actual = Estado.PERFIL
+            state.logs.registrar(Estado.PERFIL, Plantilla.GENERANDO_PERFIL)
+        
+        # El perfil puede venir ya resuelto (proveedor asíncrono, ver ejecutar)
+        pendientes = [state for state in estados if state.perfil_social is None]
+        if len(pendientes) > 1:
+            try:
+                perfiles = self.perfilador.generar_lote([state.cliente for state in pendientes])
+                for state, perfil in zip(pendientes, perfiles):
+                    state.perfil_social = perfil
+            except Exception:
+                # Se reintenta cliente a cliente para aislar el error
+                pass
+        
+        for state in estados:
+            try:
+                if state.perfil_social is None:
+                    state.perfil_social = self.perfilador.generar_señales(state.cliente)
+                perfil = state.perfil_social
+                
+                state.logs.registrar(Estado.PERFIL, Plantilla.PERFIL_GENERADO, perfil.señales.actividad, perfil.señales.tono)
+            except Exception as e:
+                self._marcar_error(state, e, Estado.PERFIL)
+        return estados
+    
+    def _iniciar_segmento(self, estados: List[EstadoAgente]) -> ReglasCompiladas:
+        """Preámbulo común de SEGMENTO: fija la versión de reglas y registra el método"""
+        # Una sola versión de reglas por lote, aunque se recarguen a mitad
+        reglas = self.segmentador.reglas.actual
+        # Determinar método de segmentación
+        metodo = "GenAI (OpenAI)" if self._usar_genai else "Reglas determinísticas"
+        for state in estados:
             state.estado_actual = Estado.SEGMENTO
-            
-            # Determinar método de segmentación
-            metodo = "GenAI (OpenAI)" if (self.use_genai and self.llm) else "Reglas determinísticas"
-            state.logs.append({
-                "estado": "SEGMENTO",
-                "mensaje": f"Aplicando segmentación usando {metodo}...",
-                "timestamp": datetime.now().isoformat()
-            })
-            
-            # Si GenAI está disponible, usarlo para enriquecer la decisión
-            if self.use_genai and self.llm:
-                # Usar GenAI para validar o mejorar la segmentación
-                try:
-                    prompt = f"""Analiza este cliente y sugiere el segmento más apropiado:
+            state.reglas_version = reglas.version
+            state.logs.registrar(Estado.SEGMENTO, Plantilla.APLICANDO_SEGMENTACION, metodo)
+        return reglas
+    
+    def _asignar_segmentos(
+        self,
+        estados: List[EstadoAgente],
+        segmentos: Sequence[Union[Segmento, Exception, None]],
+        reglas: ReglasCompiladas
+    ) -> List[EstadoAgente]:
+        """
+        Cierre común de SEGMENTO: asigna cada segmento ya calculado, calcula los
+        que falten (None) y marca el error de los que fallaron (Exception)
+        """
+        for state, segmento in zip(estados, segmentos):
+            try:
+                if isinstance(segmento, Exception):
+                    raise segmento
+                if segmento is None:
+                    if self._usar_genai:
+                        segmento = self._segmentar_con_genai(state, reglas)
+                    else:
+                        # Usar solo reglas determinísticas
+                        segmento = self.segmentador.segmentar(state.cliente, state.perfil_social, reglas)
+                
+                state.segmento = segmento
+                
+                state.logs.registrar(Estado.SEGMENTO, Plantilla.SEGMENTO_ASIGNADO, segmento.value)
+            except Exception as e:
+                self._marcar_error(state, e, Estado.SEGMENTO)
+        return estados
+    
+    @property
+    def _usar_genai(self) -> bool:
+        return bool(self.use_genai and self.llm)
+    
+    @_cronometrada("SEGMENTO")
+    def _etapa_segmento(self, estados: List[EstadoAgente]) -> List[EstadoAgente]:
+        """Estado SEGMENTO sobre un lote: con reglas se segmenta todo el lote de una vez"""
+        reglas = self._iniciar_segmento(estados)
+        
+        segmentos: List[Union[Segmento, Exception, None]] = [None] * len(estados)
+        if self._usar_genai:
+            consultar = self._especular_segmentos(estados, segmentos, reglas)
+            inicio = time.perf_counter()
+            if len(consultar) > 1:
+                # Todas las consultas del lote en una llamada llm.batch
+                respuestas = self._segmentar_lote_con_genai([estados[i] for i in consultar], reglas)
+            else:
+                respuestas = [self._capturar(self._segmentar_con_genai, estados[i], reglas) for i in consultar]
+            self._medir_llm(len(consultar), time.perf_counter() - inicio)
+            for i, segmento in zip(consultar, respuestas):
+                segmentos[i] = segmento
+        elif len(estados) > 1:
+            try:
+                segmentos = self.segmentador.segmentar_clientes(
+                    [state.cliente for state in estados],
+                    [state.perfil_social for state in estados],
+                    reglas
+                )
+            except Exception:
+                # Algún estado incompleto: se segmenta cliente a cliente para aislar el error
+                segmentos = [None] * len(estados)
+        
+        return self._asignar_segmentos(estados, segmentos, reglas)
+    
+    async def _etapa_segmento_async(self, estados: List[EstadoAgente]) -> List[EstadoAgente]:
+        """Estado SEGMENTO asíncrono: las consultas al LLM del lote van en un llm.abatch"""
+        if not self._usar_genai:
+            return await self._en_hilo(self._etapa_segmento, estados)
+        
+        inicio_etapa = time.perf_counter()
+        # Solo se espera al LLM en el event loop: reglas, numpy y caché van al pool de hilos
+        reglas, segmentos, consultar = await self._en_hilo(self._preparar_segmento, estados)
+        if consultar:
+            inicio = time.perf_counter()
+            respuestas = await self._asegmentar_lote_con_genai([estados[i] for i in consultar], reglas)
+            self._medir_llm(len(consultar), time.perf_counter() - inicio)
+            for i, segmento in zip(consultar, respuestas):
+                segmentos[i] = segmento
+        await self._en_hilo(self._asignar_segmentos, estados, segmentos, reglas)
+        self.metricas.registrar("SEGMENTO", time.perf_counter() - inicio_etapa, len(estados))
+        return estados
+    
+    def _preparar_segmento(
+        self,
+        estados: List[EstadoAgente]
+    ) -> Tuple[ReglasCompiladas, List[Union[Segmento, Exception, None]], List[int]]:
+        """
+        Preámbulo de SEGMENTO con GenAI: fija las reglas y resuelve por reglas
+        los clientes lejos de todo umbral
 
-Cliente: {state.cliente.nombre}
+        Returns:
+            (reglas, segmentos ya asignados, posiciones que se consultan al LLM)
+        """
+        reglas = self._iniciar_segmento(estados)
+        segmentos: List[Union[Segmento, Exception, None]] = [None] * len(estados)
+        return reglas, segmentos, self._especular_segmentos(estados, segmentos, reglas)
+    
+    @staticmethod
+    def _capturar(funcion: Callable, *args) -> Any:
+        """Resultado de la función o la excepción que lanzó (para _asignar_segmentos)"""
+        try:
+            return funcion(*args)
+        except Exception as e:
+            return e
+    
+    def _especular_segmentos(
+        self,
+        estados: List[EstadoAgente],
+        segmentos: List[Union[Segmento, Exception, None]],
+        reglas: ReglasCompiladas
+    ) -> List[int]:
+        """
+        Reglas primero: asigna de inmediato el segmento de las reglas a los
+        clientes lejos de todo umbral (confianza >= margen_confianza)
+        
+        Returns:
+            Posiciones de los clientes que sí se consultan al LLM
+        """
+        todos = list(range(len(estados)))
+        if self.margen_confianza <= 0:
+            return todos
+        try:
+            por_reglas, confianza = self.segmentador.segmentar_con_confianza(
+                [state.cliente for state in estados],
+                [state.perfil_social for state in estados],
+                reglas
+            )
+        except Exception:
+            # Algún estado incompleto: se consulta cliente a cliente y ahí se marca el error
+            return todos
+        
+        consultar = []
+        for i, (state, segmento, distancia) in enumerate(zip(estados, por_reglas, confianza.tolist())):
+            if distancia < self.margen_confianza:
+                consultar.append(i)
+                continue
+            segmentos[i] = segmento
+            if math.isinf(distancia):
+                state.logs.registrar(Estado.SEGMENTO, Plantilla.GENAI_OMITIDO)
+            else:
+                state.logs.registrar(Estado.SEGMENTO, Plantilla.GENAI_OMITIDO_MARGEN, distancia)
+        self.clientes_especulados += len(estados)
+        self.clientes_sin_llm += len(estados) - len(consultar)
+        return consultar
+    
+    def _medir_llm(self, clientes: int, segundos: float):
+        """Acumula la espera por el LLM: cada cliente consultado espera la llamada de su lote"""
+        self.clientes_con_llm += clientes
+        self.segundos_llm += segundos * clientes
+        self.metricas.registrar("SEGMENTO_LLM", segundos, clientes)
+    
+    def cerrar(self):
+        """Detiene los hilos del pool de la API asíncrona (al apagar el servidor)"""
+        self._hilos.shutdown(wait=True)
+    
+    def estadisticas_especulacion(self) -> Dict:
+        """Clientes que se resolvieron sin LLM y latencia ahorrada estimada"""
+        promedio = self.segundos_llm / self.clientes_con_llm if self.clientes_con_llm else 0.0
+        return {
+            "margen_confianza": self.margen_confianza,
+            "clientes": self.clientes_especulados,
+            "sin_llm": self.clientes_sin_llm,
+            "tasa_sin_llm": round(self.clientes_sin_llm / self.clientes_especulados, 4) if self.clientes_especulados else 0.0,
+            "con_llm": self.clientes_con_llm,
+            "latencia_llm_promedio": round(promedio, 4),
+            # Lo que habrían esperado los omitidos con la latencia media observada
+            "latencia_ahorrada_segundos": round(promedio * self.clientes_sin_llm, 3)
+        }
+    
+    @staticmethod
+    def _ficha_cliente(state: EstadoAgente) -> str:
+        """Datos del cliente que se envían a GenAI"""
+        return f"""Cliente: {state.cliente.nombre}
 Sector: {state.cliente.sector}
 Gasto promedio: ${state.cliente.gasto_promedio}
 Riesgo: {state.cliente.riesgo}
 Red social: {state.cliente.red_social}
 Intereses: {', '.join(state.perfil_social.señales.intereses)}
 Actividad: {state.perfil_social.señales.actividad}
-Engagement: {state.perfil_social.señales.engagement_promedio}
+Engagement: {state.perfil_social.señales.engagement_promedio}"""
+    
+    @classmethod
+    def _prompt_segmento(cls, state: EstadoAgente) -> str:
+        """Prompt para que GenAI sugiera el segmento de un cliente"""
+        return f"""Analiza este cliente y sugiere el segmento más apropiado:
 
-Segmentos disponibles:
-- premium_alto_engagement: Alto gasto, bajo riesgo, alta actividad
-- medio_conservador: Gasto medio, riesgo medio/bajo
-- basico_crecimiento: Bajo gasto, potencial de crecimiento
-- riesgo_alto: Cliente con riesgo alto
+{cls._ficha_cliente(state)}
+
+{SEGMENTOS_DISPONIBLES}
 
 Responde SOLO con el nombre del segmento (sin explicación):"""
+    
+    @staticmethod
+    def _prompt_segmento_grupo(fichas: List[Tuple[str, str]]) -> str:
+        """Prompt estructurado para varios clientes; pide un arreglo JSON"""
+        bloques = "\n\n".join(f"[{i}] id: {id_cliente}\n{ficha}" for i, (id_cliente, ficha) in enumerate(fichas, 1))
+        return f"""Analiza estos clientes y sugiere el segmento más apropiado para cada uno:
 
-                    response = self.llm.invoke([HumanMessage(content=prompt)])
-                    segmento_sugerido = response.content.strip().lower()
-                    
-                    # Mapear respuesta de GenAI a enum
-                    segmento_map = {
-                        "premium_alto_engagement": Segmento.PREMIUM_ALTO_ENGAGEMENT,
-                        "medio_conservador": Segmento.MEDIO_CONSERVADOR,
-                        "basico_crecimiento": Segmento.BASICO_CRECIMIENTO,
-                        "riesgo_alto": Segmento.RIESGO_ALTO
-                    }
-                    
-                    # Intentar usar la sugerencia de GenAI, si no coincide usar reglas
-                    if segmento_sugerido in segmento_map:
-                        segmento = segmento_map[segmento_sugerido]
-                        state.logs.append({
-                            "estado": "SEGMENTO",
-                            "mensaje": f"GenAI sugirió: {segmento_sugerido}",
-                            "timestamp": datetime.now().isoformat()
-                        })
-                    else:
-                        # Fallback a reglas determinísticas
-                        segmento = self.segmentador.segmentar(state.cliente, state.perfil_social)
-                        state.logs.append({
-                            "estado": "SEGMENTO",
-                            "mensaje": f"GenAI no pudo determinar, usando reglas: {segmento.value}",
-                            "timestamp": datetime.now().isoformat()
-                        })
-                except Exception as genai_error:
-                    # Si GenAI falla, usar reglas
-                    state.logs.append({
-                        "estado": "SEGMENTO",
-                        "mensaje": f"Error en GenAI ({str(genai_error)[:50]}), usando reglas determinísticas",
-                        "timestamp": datetime.now().isoformat()
-                    })
-                    segmento = self.segmentador.segmentar(state.cliente, state.perfil_social)
+{bloques}
+
+{SEGMENTOS_DISPONIBLES}
+
+Responde SOLO con un arreglo JSON, un objeto por cliente y en el mismo orden, sin explicación:
+[{{"id": "<id del cliente>", "segmento": "<nombre del segmento>"}}]"""
+    
+    @property
+    def _modelo_llm(self) -> str:
+        """Nombre del modelo, parte de la clave de la caché de respuestas"""
+        return getattr(self.llm, "model_name", None) or type(self.llm).__name__
+    
+    def _clave_llm(self, state: EstadoAgente) -> str:
+        return clave_llm(state.cliente, state.perfil_social, self._modelo_llm)
+    
+    def _guardar_respuestas_genai(self, respuestas: List[Tuple[str, str]]):
+        """Guarda en la caché las respuestas que son un segmento válido"""
+        self.cache_llm.guardar([
+            (clave, texto.strip().lower())
+            for clave, texto in respuestas
+            if texto.strip().lower() in SEGMENTOS_POR_NOMBRE
+        ])
+    
+    def _preparar_consultas_genai(
+        self,
+        estados: List[EstadoAgente],
+        reglas: ReglasCompiladas
+    ) -> Tuple[List[Union[Segmento, Exception, None]], List[List[int]], List[List[HumanMessage]], Dict[int, str]]:
+        """
+        Arma las consultas al LLM de un lote
+        
+        Los clientes con respuesta en caché se segmentan aquí y no generan consulta.
+        
+        Returns:
+            (segmentos ya resueltos o con la excepción de los estados que no se
+            pudieron describir, grupos de posiciones por consulta, mensajes por
+            consulta, clave de caché por posición consultada)
+        """
+        segmentos: List[Union[Segmento, Exception, None]] = [None] * len(estados)
+        fichas = {}
+        claves: Dict[int, str] = {}
+        for i, state in enumerate(estados):
+            try:
+                clave = self._clave_llm(state)
+                respuesta = self.cache_llm.obtener(clave)
+                if respuesta is not None:
+                    segmentos[i] = self._segmento_desde_genai(state, reglas, respuesta)
+                else:
+                    fichas[i], claves[i] = self._ficha_cliente(state), clave
+            except Exception as e:
+                segmentos[i] = e
+        
+        validos = list(fichas)
+        if self.clientes_por_prompt > 1:
+            grupos = list(iterar_en_lotes(validos, self.clientes_por_prompt))
+            prompts = [
+                self._prompt_segmento_grupo([(estados[i].cliente.id_cliente, fichas[i]) for i in grupo])
+                for grupo in grupos
+            ]
+        else:
+            grupos = [[i] for i in validos]
+            prompts = [self._prompt_segmento(estados[i]) for i in validos]
+        return segmentos, grupos, [[HumanMessage(content=prompt)] for prompt in prompts], claves
+    
+    def _interpretar_respuestas_genai(
+        self,
+        estados: List[EstadoAgente],
+        segmentos: List[Union[Segmento, Exception, None]],
+        grupos: List[List[int]],
+        respuestas: List[Any],
+        claves: Dict[int, str],
+        reglas: ReglasCompiladas
+    ) -> List[Union[Segmento, Exception, None]]:
+        """Convierte las respuestas del LLM en segmentos, con fallback a reglas por cliente"""
+        nuevas: List[Tuple[str, str]] = []
+        for grupo, respuesta in zip(grupos, respuestas):
+            if isinstance(respuesta, Exception):
+                textos: List[Any] = [respuesta] * len(grupo)
+            elif self.clientes_por_prompt > 1:
+                textos = parsear_segmentos_json(respuesta.content, [estados[i].cliente.id_cliente for i in grupo])
             else:
-                # Usar solo reglas determinísticas
-                segmento = self.segmentador.segmentar(state.cliente, state.perfil_social)
-            
-            state.segmento = segmento
+                textos = [respuesta.content]
             
-            state.logs.append({
-                "estado": "SEGMENTO",
-                "mensaje": f"Segmento asignado: {segmento.value}",
-                "timestamp": datetime.now().isoformat()
-            })
-            
-            return state
-        except Exception as e:
-            state.estado_actual = Estado.ERROR
-            state.error = str(e)
-            return state
+            for i, texto in zip(grupo, textos):
+                try:
+                    if isinstance(texto, Exception):
+                        segmentos[i] = self._segmento_por_error_genai(estados[i], reglas, texto)
+                    else:
+                        # Sin respuesta válida para el cliente: _segmento_desde_genai usa reglas
+                        segmentos[i] = self._segmento_desde_genai(estados[i], reglas, texto or "")
+                        nuevas.append((claves[i], texto or ""))
+                except Exception as e:
+                    segmentos[i] = e
+        self._guardar_respuestas_genai(nuevas)
+        return segmentos
     
-    def _nodo_campaña(self, state: EstadoAgente) -> EstadoAgente:
-        """Estado CAMPAÑA: Selecciona campaña"""
+    def _segmentar_lote_con_genai(
+        self,
+        estados: List[EstadoAgente],
+        reglas: ReglasCompiladas
+    ) -> List[Union[Segmento, Exception, None]]:
+        """Segmenta un lote con una sola llamada llm.batch (concurrencia acotada)"""
+        segmentos, grupos, mensajes, claves = self._preparar_consultas_genai(estados, reglas)
+        respuestas = self.llm.batch(
+            mensajes, config={"max_concurrency": self.max_concurrencia_llm}, return_exceptions=True
+        ) if mensajes else []
+        return self._interpretar_respuestas_genai(estados, segmentos, grupos, respuestas, claves, reglas)
+    
+    async def _asegmentar_lote_con_genai(
+        self,
+        estados: List[EstadoAgente],
+        reglas: ReglasCompiladas
+    ) -> List[Union[Segmento, Exception, None]]:
+        """
+        Igual que _segmentar_lote_con_genai con llm.abatch (no bloquea el event loop)
+
+        Armar las consultas e interpretar las respuestas (caché del LLM, con su
+        capa SQLite, y fallback a reglas) corre en el pool de hilos.
+        """
+        segmentos, grupos, mensajes, claves = await self._en_hilo(self._preparar_consultas_genai, estados, reglas)
+        respuestas = await self.llm.abatch(
+            mensajes, config={"max_concurrency": self.max_concurrencia_llm}, return_exceptions=True
+        ) if mensajes else []
+        return await self._en_hilo(
+            self._interpretar_respuestas_genai, estados, segmentos, grupos, respuestas, claves, reglas
+        )
+    
+    def _segmento_desde_genai(self, state: EstadoAgente, reglas: ReglasCompiladas, respuesta: str) -> Segmento:
+        """Interpreta la respuesta de GenAI; si no es un segmento válido usa reglas"""
+        segmento_sugerido = respuesta.strip().lower()
+        
+        # Intentar usar la sugerencia de GenAI, si no coincide usar reglas
+        if segmento_sugerido in SEGMENTOS_POR_NOMBRE:
+            segmento = SEGMENTOS_POR_NOMBRE[segmento_sugerido]
+            state.logs.registrar(Estado.SEGMENTO, Plantilla.GENAI_SUGIRIO, segmento_sugerido)
+        else:
+            # Fallback a reglas determinísticas
+            segmento = self._segmentar_fallback(state, reglas)
+            state.logs.registrar(Estado.SEGMENTO, Plantilla.GENAI_SIN_RESPUESTA, segmento.value)
+        return segmento
+    
+    def _segmento_por_error_genai(self, state: EstadoAgente, reglas: ReglasCompiladas, genai_error: Exception) -> Segmento:
+        """Si GenAI falla, usar reglas"""
+        state.logs.registrar(
+            Estado.SEGMENTO, Plantilla.GENAI_ERROR, type(genai_error).__name__, str(genai_error)[:120]
+        )
+        return self._segmentar_fallback(state, reglas)
+    
+    def _segmentar_fallback(self, state: EstadoAgente, reglas: ReglasCompiladas) -> Segmento:
+        """Segmento por reglas cuando GenAI falla o no responde un segmento válido"""
+        inicio = time.perf_counter()
         try:
-            state.estado_actual = Estado.CAMPAÑA
-            state.logs.append({
-                "estado": "CAMPAÑA",
-                "mensaje": "Seleccionando campaña...",
-                "timestamp": datetime.now().isoformat()
-            })
-            
-            campaña = self.decisor.seleccionar_campaña(state.segmento)
-            state.campaña = campaña
-            
-            state.logs.append({
-                "estado": "CAMPAÑA",
-                "mensaje": f"Campaña seleccionada: {campaña.nombre}",
-                "timestamp": datetime.now().isoformat()
-            })
-            
-            return state
-        except Exception as e:
-            state.estado_actual = Estado.ERROR
-            state.error = str(e)
-            return state
+            return self.segmentador.segmentar(state.cliente, state.perfil_social, reglas)
+        finally:
+            self.metricas.registrar("SEGMENTO_FALLBACK", time.perf_counter() - inicio)
     
-    def _nodo_salida(self, state: EstadoAgente) -> EstadoAgente:
-        """Estado SALIDA: Genera resultado final"""
+    def _segmentar_con_genai(self, state: EstadoAgente, reglas: ReglasCompiladas) -> Segmento:
+        """Usa GenAI para validar o mejorar la segmentación; si falla, usa reglas"""
         try:
-            state.estado_actual = Estado.SALIDA
-            state.logs.append({
-                "estado": "SALIDA",
-                "mensaje": "Componiendo resultado final...",
-                "timestamp": datetime.now().isoformat()
-            })
-            
-            resultado = self.compositor.componer(
-                state.cliente,
-                state.segmento,
-                state.campaña,
-                state.perfil_social
-            )
-            
-            # Agregar timestamp al JSON
-            resultado.mensaje_json["timestamp"] = datetime.now().isoformat()
-            
-            state.resultado = resultado
-            state.estado_actual = Estado.FIN
-            
-            state.logs.append({
-                "estado": "SALIDA",
-                "mensaje": "Resultado generado exitosamente",
-                "timestamp": datetime.now().isoformat()
-            })
-            
-            return state
-        except Exception as e:
-            state.estado_actual = Estado.ERROR
-            state.error = str(e)
-            return state
+            clave = self._clave_llm(state)
+            respuesta = self.cache_llm.obtener(clave)
+            if respuesta is None:
+                respuesta = self.llm.invoke([HumanMessage(content=self._prompt_segmento(state))]).content
+                self._guardar_respuestas_genai([(clave, respuesta)])
+            return self._segmento_desde_genai(state, reglas, respuesta)
+        except Exception as genai_error:
+            return self._segmento_por_error_genai(state, reglas, genai_error)
+    
+    @_cronometrada("CAMPAÑA")
+    def _etapa_campaña(self, estados: List[EstadoAgente]) -> List[EstadoAgente]:
+        """Estado CAMPAÑA sobre un lote: una selección por segmento distinto"""
+        campañas: Dict[Segmento, Campaña] = {}
+        for state in estados:
+            try:
+                state.estado_actual = Estado.CAMPAÑA
+                state.logs.registrar(Estado.CAMPAÑA, Plantilla.SELECCIONANDO_CAMPAÑA)
+                
+                # La campaña depende solo del segmento
+                campaña = campañas.get(state.segmento)
+                if campaña is None:
+                    campaña = self.decisor.seleccionar_campaña(state.segmento)
+                    campañas[state.segmento] = campaña
+                state.campaña = campaña
+                
+                state.logs.registrar(Estado.CAMPAÑA, Plantilla.CAMPAÑA_SELECCIONADA, campaña.nombre)
+            except Exception as e:
+                self._marcar_error(state, e, Estado.CAMPAÑA)
+        return estados
+    
+    @_cronometrada("SALIDA")
+    def _etapa_salida(self, estados: List[EstadoAgente]) -> List[EstadoAgente]:
+        """Estado SALIDA sobre un lote: compone el resultado de cada cliente"""
+        for state in estados:
+            try:
+                state.estado_actual = Estado.SALIDA
+                state.logs.registrar(Estado.SALIDA, Plantilla.COMPONIENDO_RESULTADO)
+                
+                resultado = self.compositor.componer(
+                    state.cliente,
+                    state.segmento,
+                    state.campaña,
+                    state.perfil_social
+                )
+                
+                # Agregar timestamp al JSON
+                resultado.mensaje_json["timestamp"] = datetime.now().isoformat()
+                
+                state.resultado = resultado
+                state.estado_actual = Estado.FIN
+                
+                state.logs.registrar(Estado.SALIDA, Plantilla.RESULTADO_GENERADO)
+            except Exception as e:
+                self._marcar_error(state, e, Estado.SALIDA)
+        return estados
     
     def _nodo_error(self, state: EstadoAgente) -> EstadoAgente:
         """Maneja errores"""
-        state.logs.append({
-            "estado": "ERROR",
-            "mensaje": f"Error: {state.error}",
-            "timestamp": datetime.now().isoformat()
-        })
+        self.metricas.registrar_error((state.nodo_error or Estado.INGESTA).value)
+        state.logs.registrar(Estado.ERROR, Plantilla.ERROR, state.error)
         return state
     
-    def ejecutar(self, cliente: Cliente) -> EstadoAgente:
+    def _descartar_errores(self, estados: List[EstadoAgente]) -> List[EstadoAgente]:
+        """Manda al nodo de error los estados que fallaron y devuelve los que siguen"""
+        activos = []
+        for state in estados:
+            if state.estado_actual == Estado.ERROR:
+                self._nodo_error(state)
+            else:
+                activos.append(state)
+        return activos
+    
+    def ejecutar(self, cliente: Cliente, perfil: Optional[PerfilSocial] = None) -> EstadoAgente:
         """
         Ejecuta el agente para un cliente
         
         Args:
             cliente: Cliente a procesar
+            perfil: Perfil social ya obtenido (si es None, lo genera el nodo PERFIL)
             
         Returns:
             EstadoAgente con el resultado completo
@@ -290,9 +758,19 @@ Responde SOLO con el nombre del segmento (sin explicación):"""
         estado_inicial = EstadoAgente(
             estado_actual=Estado.INGESTA,
             cliente=cliente,
+            perfil_social=perfil,
             logs=[]
         )
         
+        if self.ruta_directa:
+            # Mismos nodos y mismo orden que el grafo, sin validación de canales de LangGraph
+            estado = estado_inicial
+            for nodo in self._pipeline:
+                estado = nodo(estado)
+                if estado.estado_actual == Estado.ERROR:
+                    return self._nodo_error(estado)
+            return estado
+        
         # Ejecutar el grafo
         resultado = self.graph.invoke(estado_inicial)
         
@@ -301,4 +779,105 @@ Responde SOLO con el nombre del segmento (sin explicación):"""
             return EstadoAgente(**resultado)
         
         return resultado
-
+    
+    def ejecutar_lote(
+        self,
+        clientes: Sequence[Cliente],
+        perfiles: Optional[Sequence[Optional[PerfilSocial]]] = None
+    ) -> List[EstadoAgente]:
+        """
+        Ejecuta el agente para un lote de clientes, etapa por etapa
+        
+        Recorre las mismas etapas que el grafo (INGESTA → PERFIL → SEGMENTO →
+        CAMPAÑA → SALIDA) pero cada una sobre el lote completo: los perfiles se
+        generan juntos, la segmentación por reglas es vectorizada y la campaña
+        se elige una vez por segmento. Los clientes que fallan salen del lote
+        hacia el nodo de error. Los logs y errores de cada cliente son los
+        mismos que con ejecutar().
+        
+        Args:
+            clientes: Clientes a procesar
+            perfiles: Perfil ya obtenido de cada cliente (mismo orden, None = generar)
+            
+        Returns:
+            EstadoAgente de cada cliente, en el mismo orden
+        """
+        perfiles = perfiles or [None] * len(clientes)
+        estados = [
+            EstadoAgente(
+                estado_actual=Estado.INGESTA,
+                cliente=cliente,
+                perfil_social=perfil,
+                logs=[]
+            )
+            for cliente, perfil in zip(clientes, perfiles)
+        ]
+        activos = estados
+        for etapa in (
+            self._etapa_ingesta,
+            self._etapa_perfil,
+            self._etapa_segmento,
+            self._etapa_campaña,
+            self._etapa_salida
+        ):
+            activos = self._descartar_errores(etapa(activos))
+            if not activos:
+                break
+        return estados
+    
+    async def ejecutar_async(self, cliente: Cliente, perfil: Optional[PerfilSocial] = None) -> EstadoAgente:
+        """
+        Versión asíncrona de ejecutar(): no bloquea el event loop
+        
+        Sin LLM toda la ejecución va al pool de hilos; con LLM se recorre el
+        grafo async (graph.ainvoke) y el LLM se llama con ainvoke.
+        """
+        if self.ruta_directa:
+            return await self._en_hilo(self.ejecutar, cliente, perfil)
+        
+        resultado = await self.graph_async.ainvoke(EstadoAgente(
+            estado_actual=Estado.INGESTA,
+            cliente=cliente,
+            perfil_social=perfil,
+            logs=[]
+        ))
+        if isinstance(resultado, dict):
+            return EstadoAgente(**resultado)
+        return resultado
+    
+    async def ejecutar_lote_async(
+        self,
+        clientes: Sequence[Cliente],
+        perfiles: Optional[Sequence[Optional[PerfilSocial]]] = None
+    ) -> List[EstadoAgente]:
+        """
+        Versión asíncrona de ejecutar_lote(): mismas etapas y mismos resultados
+        
+        Las etapas de CPU corren en el pool de hilos; con LLM, las llamadas de
+        SEGMENTO del lote se hacen en paralelo (hasta LLM_MAX_CONCURRENCIA).
+        """
+        if not self._usar_genai:
+            return await self._en_hilo(self.ejecutar_lote, clientes, perfiles)
+        
+        perfiles = perfiles or [None] * len(clientes)
+        estados = [
+            EstadoAgente(
+                estado_actual=Estado.INGESTA,
+                cliente=cliente,
+                perfil_social=perfil,
+                logs=[]
+            )
+            for cliente, perfil in zip(clientes, perfiles)
+        ]
+        activos = estados
+        for etapa in (
+            functools.partial(self._en_hilo, self._etapa_ingesta),
+            functools.partial(self._en_hilo, self._etapa_perfil),
+            self._etapa_segmento_async,
+            functools.partial(self._en_hilo, self._etapa_campaña),
+            functools.partial(self._en_hilo, self._etapa_salida)
+        ):
+            activos = self._descartar_errores(await etapa(activos))
+            if not activos:
+                break
+        return estados
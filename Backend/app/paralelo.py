@@ -0,0 +1,224 @@
+"""
+Ejecución paralela del agente
+Reparte los clientes de una sesión entre procesos de un ProcessPoolExecutor.
+Cada proceso se inicializa una sola vez con su propio orquestador y una copia
+del almacén de clientes; por cada lote solo viajan los ids (y los perfiles ya
+resueltos) y de vuelta los estados finales.
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.cliente_store import ClienteStore
+from app.models import EstadoAgente, PerfilSocial
+from app.reglas import ReglasCompiladas, gestor_reglas
+from app.utils import iterar_en_lotes
+
+# Estado de cada proceso worker (lo crea _inicializar_worker)
+_orquestador = None
+_store: Optional[ClienteStore] = None
+
+
+def _inicializar_worker(
+    columnas: Dict[str, np.ndarray],
+    use_genai: bool,
+    reglas: Tuple[Dict, str],
+    workers: int
+):
+    """
+    Crea el orquestador y el almacén del proceso worker
+
+    Args:
+        columnas: Columnas del almacén de clientes
+        use_genai: Se pasa al OrquestadorAgente
+        reglas: (definición, versión) de las reglas vigentes en el proceso principal
+        workers: Procesos del pool, que se reparten LLM_RPM y LLM_TPM
+    """
+    global _orquestador, _store
+    from app.orquestador import OrquestadorAgente
+    from app.planificador_llm import planificador_llm
+
+    planificador_llm.repartir(workers)
+
+    # Las del proceso principal pueden venir de un recargar posterior al arranque
+    gestor_reglas.publicar(ReglasCompiladas(*reglas))
+    _store = ClienteStore()
+    _store.reemplazar_columnas(columnas)
+    _orquestador = OrquestadorAgente(use_genai=use_genai)
+
+
+def _listo(_: int = 0) -> int:
+    """Tarea vacía para forzar el arranque de los workers"""
+    return os.getpid()
+
+
+def _procesar_lote(
+    client_ids: List[str],
+    perfiles: Dict[str, PerfilSocial]
+) -> List[Tuple[str, Optional[EstadoAgente]]]:
+    """
+    Ejecuta el agente sobre un lote dentro del worker
+
+    Returns:
+        (id, estado final) por cliente en el orden recibido; None si no existe
+    """
+    encontrados = [(client_id, _store.obtener(client_id)) for client_id in client_ids]
+    validos = [cliente for _, cliente in encontrados if cliente]
+    estados = iter(_orquestador.ejecutar_lote(validos, [perfiles.get(c.id_cliente) for c in validos]))
+    return [(client_id, next(estados) if cliente else None) for client_id, cliente in encontrados]
+
+
+def workers_desde_entorno() -> int:
+    """Procesos configurados en AGENTE_WORKERS (0 = desactivado, auto = núcleos disponibles)"""
+    valor = os.getenv("AGENTE_WORKERS", "0").strip().lower()
+    if valor == "auto":
+        return len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    return int(valor)
+
+
+class OrquestadorParalelo:
+    """Pool de procesos pre-inicializados que ejecutan el agente por lotes"""
+
+    def __init__(self, workers: int, use_genai: bool = False, tamaño_lote: int = 100):
+        """
+        Args:
+            workers: Número de procesos
+            use_genai: Se pasa al OrquestadorAgente de cada worker
+            tamaño_lote: Clientes por tarea enviada a un worker
+        """
+        self.workers = workers
+        self.use_genai = use_genai
+        self.tamaño_lote = tamaño_lote
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._version_store: Optional[int] = None
+        self._version_reglas: Optional[str] = None
+        # Serializa la verificación y el reinicio del pool entre sesiones concurrentes
+        self._lock = threading.Lock()
+        self.lotes = 0
+        self.reinicios = 0
+
+    def iniciar(self, store: ClienteStore):
+        """Crea el pool con una copia del almacén y las reglas vigentes"""
+        with self._lock:
+            self._iniciar(store)
+
+    def _iniciar(self, store: ClienteStore):
+        """
+        Crea un pool nuevo y espera a que los workers arranquen (con el lock tomado)
+
+        Se usa "spawn": el proceso principal tiene hilos (uvicorn, vigilancia
+        del CSV) y hacer fork con hilos activos no es seguro. El pool anterior
+        no se cancela: termina los lotes que otras sesiones ya le enviaron y
+        después se cierra solo.
+        """
+        anterior = self._pool
+        reglas = gestor_reglas.actual
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_inicializar_worker,
+            initargs=(store.columnas(), self.use_genai, (reglas.definicion, reglas.version), self.workers)
+        )
+        self._version_store = store.version
+        self._version_reglas = reglas.version
+        list(self._pool.map(_listo, range(self.workers)))
+        if anterior is not None:
+            anterior.shutdown(wait=False)
+            self.reinicios += 1
+
+    def _enviar(
+        self,
+        store: ClienteStore,
+        lotes: List[List[str]],
+        perfiles: Dict[str, PerfilSocial]
+    ) -> List[Future]:
+        """
+        Envía los lotes al pool, reiniciándolo antes si cambió el almacén o las reglas
+
+        Returns:
+            Un futuro por lote
+        """
+        with self._lock:
+            if (
+                self._pool is None
+                or self._version_store != store.version
+                or self._version_reglas != gestor_reglas.actual.version
+            ):
+                self._iniciar(store)
+            return [
+                self._pool.submit(_procesar_lote, lote, {i: perfiles[i] for i in lote if i in perfiles})
+                for lote in lotes
+            ]
+
+    async def procesar(
+        self,
+        store: ClienteStore,
+        client_ids: Sequence[str],
+        perfiles: Optional[Dict[str, PerfilSocial]] = None,
+        obtener_perfiles: Optional[Callable[[List[str]], Awaitable[Dict[str, PerfilSocial]]]] = None
+    ) -> AsyncIterator[List[Tuple[str, Optional[EstadoAgente]]]]:
+        """
+        Procesa los clientes en paralelo y entrega los lotes en el orden pedido
+
+        Args:
+            store: Almacén vigente (si cambió de versión, o cambiaron las reglas, se reinicia el pool)
+            client_ids: Ids a procesar
+            perfiles: Perfiles ya obtenidos por id (opcional)
+            obtener_perfiles: Corrutina que resuelve los perfiles de un lote de ids
+                (opcional). Cada lote se envía apenas tiene sus perfiles, así los
+                workers avanzan mientras se piden los del siguiente.
+
+        Yields:
+            Lista de (id, estado final o None si no existe) por lote, en el orden de client_ids
+        """
+        lotes = list(iterar_en_lotes(list(client_ids), self.tamaño_lote))
+        futuros: Deque[asyncio.Future] = deque()
+        try:
+            if obtener_perfiles is None:
+                futuros.extend(
+                    asyncio.wrap_future(futuro)
+                    for futuro in await asyncio.to_thread(self._enviar, store, lotes, perfiles or {})
+                )
+            else:
+                for lote in lotes:
+                    perfiles_lote = await obtener_perfiles(lote)
+                    futuros.extend(
+                        asyncio.wrap_future(futuro)
+                        for futuro in await asyncio.to_thread(self._enviar, store, [lote], perfiles_lote)
+                    )
+                    # Los lotes ya terminados se entregan sin esperar a pedir el resto de perfiles
+                    while futuros and futuros[0].done():
+                        self.lotes += 1
+                        yield futuros.popleft().result()
+            # En el orden de envío, como el camino serial: un lote que termina antes espera al anterior
+            while futuros:
+                resultado = await futuros[0]
+                futuros.popleft()
+                self.lotes += 1
+                yield resultado
+        finally:
+            for futuro in futuros:
+                futuro.cancel()
+
+    def cerrar(self):
+        """Detiene los procesos del pool"""
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True, cancel_futures=True)
+                self._pool = None
+
+    def estadisticas(self) -> Dict:
+        return {
+            "workers": self.workers,
+            "activo": self._pool is not None,
+            "version_store": self._version_store,
+            "version_reglas": self._version_reglas,
+            "reinicios": self.reinicios,
+            "lotes": self.lotes
+        }
@@ -1,11 +1,80 @@
 """
 Módulo PerfiladorSocialMock
 Simula señales sociales de redes sociales para un cliente
+
+Las señales son determinísticas: cada cliente obtiene siempre las mismas para
+una semilla dada, sin importar el lote o el proceso en que se generen.
 """
-import random
-from typing import Dict
+import hashlib
+import os
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
 from app.models import Cliente, PerfilSocial, SeñalesSociales
 
+# Versión del algoritmo de señales: cambiarla si cambia lo que genera (invalida los perfiles en caché)
+VERSION_GENERADOR = "splitmix64-1"
+
+# Constantes de splitmix64 (mezclador de 64 bits usado como generador por contador)
+_GAMMA = np.uint64(0x9E3779B97F4A7C15)
+_MIX1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX2 = np.uint64(0x94D049BB133111EB)
+
+# Flujos de números aleatorios por cliente (una columna cada uno)
+_FLUJO_INTERESES = 0      # ocupa tantas columnas como intereses haya por sector
+_FLUJO_TONO = 5
+_FLUJO_ENGAGEMENT = 6
+_FLUJO_FRECUENCIA = 7
+_NUM_FLUJOS = 8
+
+
+def _splitmix64(x: np.ndarray) -> np.ndarray:
+    """Mezcla un array uint64 (splitmix64); valores cercanos dan salidas independientes"""
+    x = x.copy()
+    x ^= x >> np.uint64(30)
+    x *= _MIX1
+    x ^= x >> np.uint64(27)
+    x *= _MIX2
+    x ^= x >> np.uint64(31)
+    return x
+
+
+def semillas_clientes(ids: Sequence[str], seed: int) -> np.ndarray:
+    """
+    Semilla de 64 bits por cliente derivada de hash(id_cliente, seed)
+
+    Args:
+        ids: Ids de cliente
+        seed: Semilla global
+
+    Returns:
+        Array uint64 con una semilla por cliente
+    """
+    clave = int(seed).to_bytes(8, "little", signed=True)
+    return np.fromiter(
+        (
+            int.from_bytes(hashlib.blake2b(i.encode("utf-8"), digest_size=8, key=clave).digest(), "little")
+            for i in ids
+        ),
+        dtype=np.uint64,
+        count=len(ids)
+    )
+
+
+def uniformes(semillas: np.ndarray, flujos: int) -> np.ndarray:
+    """
+    Números uniformes en [0, 1) para cada cliente y flujo
+
+    Cada valor depende solo de la semilla del cliente y del número de flujo,
+    así que el resultado de un cliente no cambia con el tamaño del lote.
+
+    Returns:
+        Matriz float64 de forma (len(semillas), flujos)
+    """
+    contador = semillas[:, None] + _GAMMA * np.arange(1, flujos + 1, dtype=np.uint64)
+    return (_splitmix64(contador) >> np.uint64(11)).astype(np.float64) * (1.0 / (1 << 53))
+
 
 class PerfiladorSocialMock:
     """Genera señales sociales simuladas basadas en el cliente"""
@@ -26,7 +95,25 @@ class PerfiladorSocialMock:
     }
     
     ACTIVIDAD_LEVELS = ["alta", "media", "baja"]
-    
+
+    INTERESES_DEFAULT = ["general", "interés", "contenido"]
+    TONOS_DEFAULT = ["general"]
+
+    # Rango de engagement y frecuencias posibles por nivel de actividad
+    ENGAGEMENT_POR_ACTIVIDAD = {"alta": (0.08, 0.15), "media": (0.04, 0.08), "baja": (0.01, 0.04)}
+    FRECUENCIAS_POR_ACTIVIDAD = {
+        "alta": ["diaria", "2-3 veces por semana"],
+        "media": ["semanal", "2 veces por semana"],
+        "baja": ["quincenal", "mensual"],
+    }
+
+    def __init__(self, seed: Optional[int] = None):
+        """
+        Args:
+            seed: Semilla global de las señales (por defecto PERFILES_SEED o 42)
+        """
+        self.seed = int(seed if seed is not None else os.getenv("PERFILES_SEED", "42"))
+
     def generar_señales(self, cliente: Cliente) -> PerfilSocial:
         """
         Genera señales sociales simuladas para un cliente
@@ -35,58 +122,122 @@ class PerfiladorSocialMock:
             cliente: Cliente con información básica
             
         Returns:
-            PerfilSocial con señales simuladas
+            PerfilSocial con señales simuladas (las mismas que en generar_lote)
         """
-        # Intereses basados en sector
-        intereses_base = self.INTERESES_POR_SECTOR.get(
-            cliente.sector.lower(), 
-            ["general", "interés", "contenido"]
-        )
-        intereses = random.sample(intereses_base, k=min(3, len(intereses_base)))
-        
-        # Tono basado en red social
-        tonos_disponibles = self.TONOS_POR_RED.get(
-            cliente.red_social.lower(),
-            ["general"]
-        )
-        tono = random.choice(tonos_disponibles)
-        
+        return self.generar_lote([cliente])[0]
+
+    def generar_columnas(
+        self,
+        ids: Sequence[str],
+        sectores: Sequence[str],
+        redes: Sequence[str],
+        gastos: np.ndarray
+    ) -> Dict[str, List]:
+        """
+        Genera las señales de un lote en forma columnar
+
+        Todas las extracciones aleatorias del lote se hacen en un solo paso
+        vectorizado; luego se agrupa por sector y red para elegir intereses y tono.
+
+        Args:
+            ids: Id de cada cliente
+            sectores: Sector de cada cliente
+            redes: Red social de cada cliente
+            gastos: Gasto promedio de cada cliente
+
+        Returns:
+            Dict con listas intereses, tono, actividad, engagement_promedio y
+            frecuencia_publicacion (una entrada por cliente)
+        """
+        n = len(ids)
+        u = uniformes(semillas_clientes(ids, self.seed), _NUM_FLUJOS)
+        gastos = np.asarray(gastos, dtype=np.float64)
+
         # Actividad basada en gasto promedio (proxy de engagement)
-        if cliente.gasto_promedio > 500:
-            actividad = "alta"
-        elif cliente.gasto_promedio > 200:
-            actividad = "media"
-        else:
-            actividad = "baja"
-        
-        # Engagement promedio simulado
-        engagement_base = 0.05
-        if actividad == "alta":
-            engagement_promedio = round(random.uniform(0.08, 0.15), 3)
-        elif actividad == "media":
-            engagement_promedio = round(random.uniform(0.04, 0.08), 3)
-        else:
-            engagement_promedio = round(random.uniform(0.01, 0.04), 3)
-        
-        # Frecuencia de publicación
-        if actividad == "alta":
-            frecuencia = random.choice(["diaria", "2-3 veces por semana"])
-        elif actividad == "media":
-            frecuencia = random.choice(["semanal", "2 veces por semana"])
-        else:
-            frecuencia = random.choice(["quincenal", "mensual"])
-        
-        señales = SeñalesSociales(
-            intereses=intereses,
-            tono=tono,
-            actividad=actividad,
-            engagement_promedio=engagement_promedio,
-            frecuencia_publicacion=frecuencia
-        )
-        
-        return PerfilSocial(
-            id_cliente=cliente.id_cliente,
-            red_social=cliente.red_social,
-            señales=señales
+        codigo_actividad = np.select([gastos > 500, gastos > 200], [0, 1], default=2)
+        actividades = np.array(self.ACTIVIDAD_LEVELS, dtype=object)[codigo_actividad]
+
+        # Engagement uniforme dentro del rango del nivel de actividad
+        rangos = np.array([self.ENGAGEMENT_POR_ACTIVIDAD[a] for a in self.ACTIVIDAD_LEVELS])
+        minimo, maximo = rangos[codigo_actividad, 0], rangos[codigo_actividad, 1]
+        engagement = np.round(minimo + u[:, _FLUJO_ENGAGEMENT] * (maximo - minimo), 3)
+
+        # Frecuencia de publicación: una de las dos opciones del nivel
+        frecuencias = np.array(
+            [self.FRECUENCIAS_POR_ACTIVIDAD[a] for a in self.ACTIVIDAD_LEVELS], dtype=object
+        )[codigo_actividad, (u[:, _FLUJO_FRECUENCIA] * 2).astype(np.intp)]
+
+        # Intereses: muestra sin reemplazo ordenando claves aleatorias, por sector
+        intereses: List = [None] * n
+        for sector, posiciones in self._agrupar(sectores).items():
+            base = self.INTERESES_POR_SECTOR.get(sector, self.INTERESES_DEFAULT)
+            k = min(3, len(base))
+            elegidos = np.argsort(u[posiciones, _FLUJO_INTERESES:_FLUJO_INTERESES + len(base)], axis=1)[:, :k]
+            opciones = np.array(base, dtype=object)
+            for p, fila in zip(posiciones.tolist(), opciones[elegidos].tolist()):
+                intereses[p] = fila
+
+        # Tono basado en red social
+        tonos = np.empty(n, dtype=object)
+        for red, posiciones in self._agrupar(redes).items():
+            opciones = self.TONOS_POR_RED.get(red, self.TONOS_DEFAULT)
+            indices = (u[posiciones, _FLUJO_TONO] * len(opciones)).astype(np.intp)
+            tonos[posiciones] = np.array(opciones, dtype=object)[indices]
+
+        return {
+            "intereses": intereses,
+            "tono": tonos.tolist(),
+            "actividad": actividades.tolist(),
+            "engagement_promedio": engagement.tolist(),
+            "frecuencia_publicacion": frecuencias.tolist(),
+        }
+
+    def generar_lote(self, clientes: Sequence[Cliente]) -> List[PerfilSocial]:
+        """
+        Genera señales sociales para un lote de clientes
+
+        El perfil de cada cliente depende solo de su id, sus datos y la
+        semilla, no del lote ni del proceso donde se genere.
+
+        Args:
+            clientes: Clientes con información básica
+
+        Returns:
+            PerfilSocial de cada cliente, en el mismo orden
+        """
+        columnas = self.generar_columnas(
+            [c.id_cliente for c in clientes],
+            [c.sector for c in clientes],
+            [c.red_social for c in clientes],
+            np.fromiter((c.gasto_promedio for c in clientes), dtype=np.float64, count=len(clientes))
         )
+        # Los valores salen de catálogos fijos: se construye sin revalidar
+        return [
+            PerfilSocial.model_construct(
+                id_cliente=cliente.id_cliente,
+                red_social=cliente.red_social,
+                señales=SeñalesSociales.model_construct(
+                    intereses=intereses,
+                    tono=tono,
+                    actividad=actividad,
+                    engagement_promedio=engagement,
+                    frecuencia_publicacion=frecuencia
+                )
+            )
+            for cliente, intereses, tono, actividad, engagement, frecuencia in zip(
+                clientes,
+                columnas["intereses"],
+                columnas["tono"],
+                columnas["actividad"],
+                columnas["engagement_promedio"],
+                columnas["frecuencia_publicacion"]
+            )
+        ]
 
+    @staticmethod
+    def _agrupar(valores: Sequence[str]) -> Dict[str, np.ndarray]:
+        """Posiciones de cada valor (en minúsculas) dentro del lote"""
+        grupos: Dict[str, List[int]] = {}
+        for i, valor in enumerate(valores):
+            grupos.setdefault(valor.lower(), []).append(i)
+        return {valor: np.array(posiciones, dtype=np.intp) for valor, posiciones in grupos.items()}
@@ -0,0 +1,374 @@
+"""
+Planificador de llamadas al LLM
+Se interpone entre el orquestador y el modelo de chat para respetar los
+límites del proveedor: solicitudes por minuto (RPM) y tokens por minuto (TPM)
+con token buckets, cola con deadline por solicitud y reintentos con backoff
+exponencial ante respuestas 429. Lleva el uso de tokens por sesión.
+
+La sesión se toma de la variable de contexto sesion_llm, que fija quien
+procesa la sesión (ver procesar_clientes_async en app/main.py).
+"""
+import asyncio
+import contextvars
+import os
+import random
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+# Sesión a la que se atribuye el uso de tokens de las llamadas en curso
+sesion_llm: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("sesion_llm", default=None)
+
+
+class ErrorPlanificador(Exception):
+    """La solicitud no puede salir antes de su deadline"""
+
+
+def estimar_tokens(mensajes: List[Any]) -> int:
+    """Estimación de tokens de entrada (~4 caracteres por token)"""
+    return sum(len(str(getattr(m, "content", m))) for m in mensajes) // 4 + 1
+
+
+def es_limite_tasa(error: Exception) -> bool:
+    """True si el error es un 429 del proveedor (openai.RateLimitError o equivalente)"""
+    return getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError"
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Segundos indicados por el encabezado Retry-After del 429, si vienen"""
+    respuesta = getattr(error, "response", None)
+    valor = getattr(respuesta, "headers", {}).get("retry-after") if respuesta is not None else None
+    try:
+        return float(valor) if valor is not None else None
+    except ValueError:
+        return None
+
+
+class BucketMinuto:
+    """
+    Token bucket por minuto, seguro entre hilos
+
+    Cada reserva descuenta del saldo aunque quede negativo y devuelve cuánto
+    debe esperar quien reservó: las solicitudes quedan en cola en orden de
+    llegada sin mantener el lock mientras esperan.
+    """
+
+    def __init__(self, por_minuto: float, reloj: Callable[[], float] = time.monotonic):
+        """
+        Args:
+            por_minuto: Capacidad por minuto (0 = sin límite)
+            reloj: Fuente de tiempo en segundos
+        """
+        self.por_minuto = por_minuto
+        self.reloj = reloj
+        self._saldo = float(por_minuto)
+        self._ultimo = reloj()
+        self._lock = threading.Lock()
+
+    def reservar(self, cantidad: float, limite: float) -> float:
+        """
+        Reserva cantidad unidades
+
+        Args:
+            cantidad: Unidades a consumir (1 solicitud o N tokens)
+            limite: Instante (según reloj) en que la solicitud debe haber salido
+
+        Returns:
+            Segundos a esperar antes de enviar
+
+        Raises:
+            ErrorPlanificador: Si la espera supera el límite (no se reserva nada)
+        """
+        if self.por_minuto <= 0:
+            return 0.0
+        with self._lock:
+            ahora = self.reloj()
+            self._saldo = min(self.por_minuto, self._saldo + (ahora - self._ultimo) * self.por_minuto / 60)
+            self._ultimo = ahora
+            espera = max(0.0, (cantidad - self._saldo) * 60 / self.por_minuto)
+            if ahora + espera > limite:
+                raise ErrorPlanificador(
+                    f"Límite de {self.por_minuto:g}/min: la espera de {espera:.1f}s supera el deadline"
+                )
+            self._saldo -= cantidad
+            return espera
+
+    def ajustar(self, cantidad: float):
+        """Cobra (o devuelve, si es negativa) una diferencia respecto a lo reservado"""
+        if self.por_minuto <= 0:
+            return
+        with self._lock:
+            self._saldo -= cantidad
+
+
+def _uso_vacio() -> Dict[str, float]:
+    return {
+        "solicitudes": 0,
+        "tokens_entrada": 0,
+        "tokens_salida": 0,
+        "reintentos_429": 0,
+        "rechazadas": 0,
+        "errores": 0,
+        "espera_segundos": 0.0
+    }
+
+
+class PlanificadorLLM:
+    """RPM/TPM, deadline y backoff ante 429 para las llamadas al modelo de chat"""
+
+    def __init__(
+        self,
+        rpm: float = 0,
+        tpm: float = 0,
+        reintentos: int = 3,
+        deadline_segundos: float = 60.0,
+        backoff_segundos: float = 1.0,
+        tokens_salida: int = 50,
+        max_sesiones: int = 1000,
+        reloj: Callable[[], float] = time.monotonic
+    ):
+        """
+        Args:
+            rpm: Solicitudes por minuto (0 = sin límite)
+            tpm: Tokens por minuto (0 = sin límite)
+            reintentos: Reintentos como máximo ante un 429
+            deadline_segundos: Tiempo máximo desde que la solicitud entra en cola
+                hasta que sale (incluye esperas de backoff)
+            backoff_segundos: Espera base del backoff exponencial (con jitter)
+            tokens_salida: Tokens de respuesta que se reservan por solicitud
+            max_sesiones: Sesiones con uso registrado que se conservan
+            reloj: Fuente de tiempo en segundos (inyectable para pruebas)
+        """
+        self.rpm = BucketMinuto(rpm, reloj)
+        self.tpm = BucketMinuto(tpm, reloj)
+        self.reintentos = reintentos
+        self.deadline_segundos = deadline_segundos
+        self.backoff_segundos = backoff_segundos
+        self.tokens_salida = tokens_salida
+        self.max_sesiones = max_sesiones
+        self.reloj = reloj
+        self.en_cola = 0
+        self._total = _uso_vacio()
+        self._sesiones: "OrderedDict[str, Dict[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def desde_entorno(cls) -> "PlanificadorLLM":
+        """Crea el planificador con LLM_RPM, LLM_TPM, LLM_REINTENTOS y LLM_DEADLINE_SEGUNDOS"""
+        return cls(
+            rpm=float(os.getenv("LLM_RPM", "0")),
+            tpm=float(os.getenv("LLM_TPM", "0")),
+            reintentos=int(os.getenv("LLM_REINTENTOS", "3")),
+            deadline_segundos=float(os.getenv("LLM_DEADLINE_SEGUNDOS", "60"))
+        )
+
+    def repartir(self, partes: int):
+        """
+        Divide RPM y TPM entre varios procesos que comparten la cuota del proveedor
+
+        Cada worker del pool paralelo tiene su propio planificador: sin repartir,
+        el límite real sería partes × LLM_RPM.
+
+        Args:
+            partes: Procesos entre los que se reparte el límite
+        """
+        if partes <= 1:
+            return
+        self.rpm = BucketMinuto(self.rpm.por_minuto / partes, self.reloj)
+        self.tpm = BucketMinuto(self.tpm.por_minuto / partes, self.reloj)
+
+    def _registrar(self, sesion: Optional[str], **valores: float):
+        """Suma valores al uso total y al de la sesión"""
+        with self._lock:
+            usos = [self._total]
+            if sesion is not None:
+                if sesion not in self._sesiones:
+                    self._sesiones[sesion] = _uso_vacio()
+                    while len(self._sesiones) > self.max_sesiones:
+                        self._sesiones.popitem(last=False)
+                usos.append(self._sesiones[sesion])
+            for uso in usos:
+                for campo, valor in valores.items():
+                    uso[campo] += valor
+
+    def _reservar(self, tokens: int, limite: float, sesion: Optional[str]) -> float:
+        """Reserva una solicitud y sus tokens; devuelve la espera"""
+        try:
+            espera_rpm = self.rpm.reservar(1, limite)
+            try:
+                espera_tpm = self.tpm.reservar(tokens, limite)
+            except ErrorPlanificador:
+                self.rpm.ajustar(-1)
+                raise
+        except ErrorPlanificador:
+            self._registrar(sesion, rechazadas=1)
+            raise
+        espera = max(espera_rpm, espera_tpm)
+        if espera:
+            self._registrar(sesion, espera_segundos=espera)
+        return espera
+
+    def _espera_reintento(self, error: Exception, intento: int, limite: float, sesion: Optional[str]) -> Optional[float]:
+        """Espera antes de reintentar un 429, o None si no se reintenta"""
+        if not es_limite_tasa(error) or intento >= self.reintentos:
+            self._registrar(sesion, errores=1)
+            return None
+        espera = _retry_after(error)
+        if espera is None:
+            espera = self.backoff_segundos * 2 ** intento + random.uniform(0, self.backoff_segundos)
+        if self.reloj() + espera > limite:
+            self._registrar(sesion, errores=1)
+            return None
+        self._registrar(sesion, reintentos_429=1, espera_segundos=espera)
+        return espera
+
+    def _contabilizar(self, respuesta: Any, reservados: int, sesion: Optional[str]):
+        """Registra el uso real de tokens y corrige la reserva de TPM"""
+        entrada = reservados - self.tokens_salida
+        uso = getattr(respuesta, "usage_metadata", None) or {}
+        tokens_entrada = uso.get("input_tokens", entrada)
+        tokens_salida = uso.get("output_tokens", self.tokens_salida)
+        self.tpm.ajustar(tokens_entrada + tokens_salida - reservados)
+        self._registrar(sesion, solicitudes=1, tokens_entrada=tokens_entrada, tokens_salida=tokens_salida)
+
+    def invoke(self, llm: Any, mensajes: List[Any], **kwargs) -> Any:
+        """
+        llm.invoke(mensajes) respetando los límites
+
+        Raises:
+            ErrorPlanificador: Si la solicitud no puede salir antes del deadline
+            Exception: El error del modelo si no es un 429 o se agotaron los reintentos
+        """
+        sesion = sesion_llm.get()
+        limite = self.reloj() + self.deadline_segundos
+        tokens = estimar_tokens(mensajes) + self.tokens_salida
+        with self._lock:
+            self.en_cola += 1
+        try:
+            for intento in range(self.reintentos + 1):
+                espera = self._reservar(tokens, limite, sesion)
+                if espera:
+                    time.sleep(espera)
+                try:
+                    respuesta = llm.invoke(mensajes, **kwargs)
+                except Exception as e:
+                    espera = self._espera_reintento(e, intento, limite, sesion)
+                    if espera is None:
+                        raise
+                    time.sleep(espera)
+                    continue
+                self._contabilizar(respuesta, tokens, sesion)
+                return respuesta
+        finally:
+            with self._lock:
+                self.en_cola -= 1
+
+    async def ainvoke(self, llm: Any, mensajes: List[Any], **kwargs) -> Any:
+        """Igual que invoke con llm.ainvoke; las esperas no bloquean el event loop"""
+        sesion = sesion_llm.get()
+        limite = self.reloj() + self.deadline_segundos
+        tokens = estimar_tokens(mensajes) + self.tokens_salida
+        with self._lock:
+            self.en_cola += 1
+        try:
+            for intento in range(self.reintentos + 1):
+                espera = self._reservar(tokens, limite, sesion)
+                if espera:
+                    await asyncio.sleep(espera)
+                try:
+                    respuesta = await llm.ainvoke(mensajes, **kwargs)
+                except Exception as e:
+                    espera = self._espera_reintento(e, intento, limite, sesion)
+                    if espera is None:
+                        raise
+                    await asyncio.sleep(espera)
+                    continue
+                self._contabilizar(respuesta, tokens, sesion)
+                return respuesta
+        finally:
+            with self._lock:
+                self.en_cola -= 1
+
+    def uso_sesion(self, sesion: str) -> Dict[str, float]:
+        """Uso de tokens y solicitudes de una sesión (en cero si no llamó al LLM)"""
+        with self._lock:
+            return self._formatear(self._sesiones.get(sesion) or _uso_vacio())
+
+    @staticmethod
+    def _formatear(uso: Dict[str, float]) -> Dict[str, float]:
+        return {
+            **uso,
+            "tokens_total": uso["tokens_entrada"] + uso["tokens_salida"],
+            "espera_segundos": round(uso["espera_segundos"], 3)
+        }
+
+    def estadisticas(self) -> Dict:
+        """Límites configurados y uso acumulado del proceso"""
+        with self._lock:
+            return {
+                "rpm": self.rpm.por_minuto,
+                "tpm": self.tpm.por_minuto,
+                "reintentos": self.reintentos,
+                "deadline_segundos": self.deadline_segundos,
+                "en_cola": self.en_cola,
+                "sesiones": len(self._sesiones),
+                **self._formatear(self._total)
+            }
+
+
+class LLMPlanificado:
+    """
+    Modelo de chat con la interfaz que usa el orquestador (invoke, ainvoke,
+    batch, abatch) cuyas llamadas pasan todas por el planificador
+    """
+
+    def __init__(self, llm: Any, planificador: PlanificadorLLM):
+        """
+        Args:
+            llm: Modelo de chat (ChatOpenAI, ChatFalso, ...)
+            planificador: Planificador compartido que aplica los límites
+        """
+        self.llm = llm
+        self.planificador = planificador
+
+    @property
+    def model_name(self) -> str:
+        return getattr(self.llm, "model_name", None) or type(self.llm).__name__
+
+    def invoke(self, mensajes: List[Any], **kwargs) -> Any:
+        return self.planificador.invoke(self.llm, mensajes, **kwargs)
+
+    async def ainvoke(self, mensajes: List[Any], **kwargs) -> Any:
+        return await self.planificador.ainvoke(self.llm, mensajes, **kwargs)
+
+    def batch(self, entradas: List[List[Any]], config: Optional[Dict] = None, return_exceptions: bool = False) -> List[Any]:
+        """Una llamada por entrada en hilos, como máximo config["max_concurrency"] a la vez"""
+        def llamar(mensajes):
+            try:
+                return self.invoke(mensajes)
+            except Exception as e:
+                if return_exceptions:
+                    return e
+                raise
+
+        max_concurrencia = (config or {}).get("max_concurrency") or max(1, len(entradas))
+        with ThreadPoolExecutor(max_workers=max_concurrencia) as pool:
+            # Cada hilo hereda el contexto de quien llama (la sesión de sesion_llm)
+            futuros = [pool.submit(contextvars.copy_context().run, llamar, mensajes) for mensajes in entradas]
+            return [futuro.result() for futuro in futuros]
+
+    async def abatch(self, entradas: List[List[Any]], config: Optional[Dict] = None, return_exceptions: bool = False) -> List[Any]:
+        """Igual que batch con ainvoke, sobre el event loop"""
+        limite = asyncio.Semaphore((config or {}).get("max_concurrency") or max(1, len(entradas)))
+
+        async def llamar(mensajes):
+            async with limite:
+                return await self.ainvoke(mensajes)
+
+        return await asyncio.gather(*(llamar(m) for m in entradas), return_exceptions=return_exceptions)
+
+
+# Instancia global: los límites del proveedor se comparten en todo el proceso
+planificador_llm = PlanificadorLLM.desde_entorno()
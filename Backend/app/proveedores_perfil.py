@@ -0,0 +1,236 @@
+"""
+Proveedores asíncronos de perfiles sociales
+Interfaz común para obtener señales sociales sin bloquear el event loop, con
+concurrencia acotada (semáforo), límite de solicitudes por segundo, timeout
+por solicitud y pool de conexiones HTTP reutilizable.
+
+Proveedores disponibles:
+- mock: PerfiladorSocialMock en proceso, con latencia simulada opcional
+- http: servicio HTTP (ver app/stub_perfiles.py para un stub local)
+"""
+import asyncio
+import os
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Protocol, Sequence
+
+import httpx
+
+from app.models import Cliente, PerfilSocial
+from app.perfilador_social import PerfiladorSocialMock
+from app.utils import iterar_en_lotes
+
+
+class ErrorProveedor(Exception):
+    """Fallo al obtener perfiles del proveedor (timeout, HTTP, respuesta inválida)"""
+
+
+class ProveedorPerfilAsync(Protocol):
+    """Contrato de un proveedor asíncrono de perfiles sociales"""
+
+    async def obtener_perfiles(self, clientes: Sequence[Cliente]) -> List[PerfilSocial]:
+        """Perfil de cada cliente, en el mismo orden"""
+        ...
+
+    async def cerrar(self) -> None:
+        """Libera conexiones y recursos"""
+        ...
+
+
+class LimitadorTasa:
+    """Token bucket asíncrono: como máximo por_segundo solicitudes, con ráfagas de rafaga"""
+
+    def __init__(self, por_segundo: float, rafaga: Optional[int] = None):
+        """
+        Args:
+            por_segundo: Solicitudes por segundo permitidas (0 = sin límite)
+            rafaga: Solicitudes que pueden salir juntas (por defecto por_segundo)
+        """
+        self.por_segundo = por_segundo
+        self.capacidad = rafaga or max(1, int(por_segundo))
+        self._tokens = float(self.capacidad)
+        self._ultimo = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def adquirir(self):
+        """Espera hasta que haya un token disponible"""
+        if self.por_segundo <= 0:
+            return
+        async with self._lock:
+            while True:
+                ahora = time.monotonic()
+                self._tokens = min(self.capacidad, self._tokens + (ahora - self._ultimo) * self.por_segundo)
+                self._ultimo = ahora
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.por_segundo)
+
+
+class ProveedorBase(ABC):
+    """
+    Aplica los límites comunes alrededor de _solicitar()
+
+    Los clientes se envían en lotes de tamaño_lote; cada lote es una solicitud
+    que espera turno en el semáforo y en el limitador de tasa, y se cancela
+    si supera timeout_segundos.
+    """
+
+    nombre = "base"
+
+    def __init__(
+        self,
+        max_concurrencia: int = 8,
+        solicitudes_por_segundo: float = 0,
+        timeout_segundos: float = 10.0,
+        tamaño_lote: int = 50
+    ):
+        """
+        Args:
+            max_concurrencia: Solicitudes simultáneas como máximo
+            solicitudes_por_segundo: Límite de tasa del proveedor (0 = sin límite)
+            timeout_segundos: Tiempo máximo por solicitud
+            tamaño_lote: Clientes por solicitud
+        """
+        self.max_concurrencia = max_concurrencia
+        self.timeout_segundos = timeout_segundos
+        self.tamaño_lote = tamaño_lote
+        self._semaforo = asyncio.BoundedSemaphore(max_concurrencia)
+        self._limitador = LimitadorTasa(solicitudes_por_segundo)
+        self.solicitudes = 0
+        self.errores = 0
+        self.timeouts = 0
+        self.segundos = 0.0
+
+    @abstractmethod
+    async def _solicitar(self, clientes: List[Cliente]) -> List[PerfilSocial]:
+        """Obtiene los perfiles de un lote (lo implementa cada proveedor)"""
+
+    async def _solicitar_con_limites(self, clientes: List[Cliente]) -> List[PerfilSocial]:
+        async with self._semaforo:
+            await self._limitador.adquirir()
+            inicio = time.perf_counter()
+            self.solicitudes += 1
+            try:
+                perfiles = await asyncio.wait_for(self._solicitar(clientes), self.timeout_segundos)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                raise ErrorProveedor(
+                    f"{self.nombre}: timeout de {self.timeout_segundos}s para {len(clientes)} clientes"
+                )
+            except ErrorProveedor:
+                self.errores += 1
+                raise
+            except Exception as e:
+                self.errores += 1
+                raise ErrorProveedor(f"{self.nombre}: {e!r}") from e
+            finally:
+                self.segundos += time.perf_counter() - inicio
+        if len(perfiles) != len(clientes):
+            self.errores += 1
+            raise ErrorProveedor(f"{self.nombre}: se esperaban {len(clientes)} perfiles, llegaron {len(perfiles)}")
+        return perfiles
+
+    async def obtener_perfiles(self, clientes: Sequence[Cliente]) -> List[PerfilSocial]:
+        """
+        Perfiles de una lista de clientes, con las solicitudes en paralelo
+
+        Args:
+            clientes: Clientes a perfilar
+
+        Returns:
+            Perfil de cada cliente, en el mismo orden
+
+        Raises:
+            ErrorProveedor: Si alguna solicitud falla o excede el timeout
+        """
+        lotes = await asyncio.gather(*(
+            self._solicitar_con_limites(lote)
+            for lote in iterar_en_lotes(list(clientes), self.tamaño_lote)
+        ))
+        return [perfil for lote in lotes for perfil in lote]
+
+    async def cerrar(self):
+        pass
+
+    def estadisticas(self) -> Dict:
+        """Contadores de uso del proveedor"""
+        return {
+            "proveedor": self.nombre,
+            "max_concurrencia": self.max_concurrencia,
+            "solicitudes": self.solicitudes,
+            "errores": self.errores,
+            "timeouts": self.timeouts,
+            "segundos_promedio": round(self.segundos / self.solicitudes, 4) if self.solicitudes else 0.0
+        }
+
+
+class ProveedorMockAsync(ProveedorBase):
+    """PerfiladorSocialMock en proceso, con latencia simulada por solicitud"""
+
+    nombre = "mock"
+
+    def __init__(self, latencia_segundos: float = 0.0, perfilador: Optional[PerfiladorSocialMock] = None, **limites):
+        super().__init__(**limites)
+        self.latencia_segundos = latencia_segundos
+        self.perfilador = perfilador or PerfiladorSocialMock()
+
+    async def _solicitar(self, clientes: List[Cliente]) -> List[PerfilSocial]:
+        if self.latencia_segundos:
+            await asyncio.sleep(self.latencia_segundos)
+        # generar_lote es vectorizado pero síncrono: fuera del event loop, los lotes se solapan
+        return await asyncio.to_thread(self.perfilador.generar_lote, clientes)
+
+
+class ProveedorHTTP(ProveedorBase):
+    """Servicio HTTP de perfiles: POST {url}/perfiles con {"clientes": [...]}"""
+
+    nombre = "http"
+
+    def __init__(self, url: str, transporte: Optional[httpx.AsyncBaseTransport] = None, **limites):
+        """
+        Args:
+            url: URL base del servicio
+            transporte: Transporte httpx alternativo (p. ej. ASGITransport en pruebas)
+            **limites: Ver ProveedorBase
+        """
+        super().__init__(**limites)
+        # Un único cliente para todo el proceso: las conexiones se reutilizan (keep-alive)
+        self._cliente = httpx.AsyncClient(
+            base_url=url,
+            transport=transporte,
+            timeout=self.timeout_segundos,
+            limits=httpx.Limits(
+                max_connections=self.max_concurrencia,
+                max_keepalive_connections=self.max_concurrencia
+            )
+        )
+
+    async def _solicitar(self, clientes: List[Cliente]) -> List[PerfilSocial]:
+        respuesta = await self._cliente.post("/perfiles", json={"clientes": [c.model_dump() for c in clientes]})
+        if respuesta.status_code != 200:
+            raise ErrorProveedor(f"http: estado {respuesta.status_code}: {respuesta.text[:200]}")
+        return [PerfilSocial.model_validate(p) for p in respuesta.json()["perfiles"]]
+
+    async def cerrar(self):
+        await self._cliente.aclose()
+
+
+def crear_proveedor_desde_entorno() -> ProveedorBase:
+    """
+    Crea el proveedor configurado con las variables PERFILES_PROVEEDOR*
+
+    Debe llamarse dentro del event loop que lo va a usar (p. ej. en el startup).
+    """
+    limites = {
+        "max_concurrencia": int(os.getenv("PERFILES_MAX_CONCURRENCIA", "8")),
+        "solicitudes_por_segundo": float(os.getenv("PERFILES_RPS", "0")),
+        "timeout_segundos": float(os.getenv("PERFILES_TIMEOUT_SEGUNDOS", "10")),
+        "tamaño_lote": int(os.getenv("PERFILES_LOTE_PROVEEDOR", "50")),
+    }
+    tipo = os.getenv("PERFILES_PROVEEDOR", "mock").lower()
+    if tipo == "http":
+        return ProveedorHTTP(os.getenv("PERFILES_PROVEEDOR_URL", "http://127.0.0.1:8100"), **limites)
+    if tipo == "mock":
+        return ProveedorMockAsync(float(os.getenv("PERFILES_LATENCIA_MS", "0")) / 1000, **limites)
+    raise ValueError(f"PERFILES_PROVEEDOR no válido: {tipo}. Use: mock, http")
@@ -0,0 +1,315 @@
+"""
+Reglas de segmentación configurables
+Las reglas y el score se definen en un archivo JSON y se compilan al cargarlo
+en evaluadores (predicados precompilados y máscaras vectorizadas), sin
+interpretar la definición por cliente. Las reglas se pueden reemplazar en
+caliente; cada resultado lleva el id de versión de las reglas que lo produjo.
+"""
+import hashlib
+import json
+import operator
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.models import Segmento
+
+# Códigos para la API por lotes: índice en la tupla; cualquier otro valor
+# se codifica como len(tupla) ("otro")
+RIESGOS = ("bajo", "medio", "alto")
+ACTIVIDADES = ("alta", "media", "baja")
+SEGMENTOS = tuple(Segmento)
+
+# Campos que pueden usar las reglas, en el orden en que se pasan a los evaluadores
+CAMPOS_NUMERICOS = ("gasto", "engagement")
+CAMPOS_CATEGORICOS = {"riesgo": RIESGOS, "actividad": ACTIVIDADES}
+CAMPOS = ("gasto", "riesgo", "actividad", "engagement")
+
+OPERADORES = {"gt": operator.gt, "gte": operator.ge, "lt": operator.lt, "lte": operator.le}
+
+RUTA_REGLAS_DEFAULT = Path(__file__).parent / "reglas_segmentacion.json"
+
+
+def codificar(valores: Sequence[str], categorias: Sequence[str]) -> np.ndarray:
+    """
+    Codifica textos como índices de categorias (comparación exacta)
+
+    Args:
+        valores: Textos a codificar
+        categorias: Categorías conocidas (p. ej. RIESGOS)
+
+    Returns:
+        Array int8 con el índice de cada valor, o len(categorias) si no se reconoce
+    """
+    tabla = {c: i for i, c in enumerate(categorias)}
+    otro = len(categorias)
+    return np.fromiter(
+        (tabla.get(v, otro) for v in valores),
+        dtype=np.int8,
+        count=len(valores)
+    )
+
+
+def _tabla_categorica(campo: str, permitidos: Sequence[str]) -> np.ndarray:
+    """Tabla booleana código -> permitido (incluye el código "otro")"""
+    categorias = CAMPOS_CATEGORICOS[campo]
+    desconocidos = [v for v in permitidos if v not in categorias]
+    if desconocidos:
+        raise ValueError(f"Valores no válidos para '{campo}': {desconocidos}. Use: {list(categorias)}")
+    tabla = np.zeros(len(categorias) + 1, dtype=bool)
+    tabla[[categorias.index(v) for v in permitidos]] = True
+    return tabla
+
+
+def _compilar_condiciones(condiciones: Dict) -> Tuple[List[Callable], List[Callable]]:
+    """
+    Compila las condiciones de una regla
+
+    Returns:
+        (predicados escalares sobre la tupla de CAMPOS con textos,
+         predicados vectoriales sobre la tupla de CAMPOS con arrays de códigos)
+    """
+    escalares, vectoriales = [], []
+    for campo, condicion in condiciones.items():
+        if campo not in CAMPOS:
+            raise ValueError(f"Campo desconocido en regla: {campo}. Use: {list(CAMPOS)}")
+        i = CAMPOS.index(campo)
+        for nombre_op, valor in condicion.items():
+            if campo in CAMPOS_CATEGORICOS and nombre_op == "in":
+                permitidos = frozenset(valor)
+                tabla = _tabla_categorica(campo, valor)
+                escalares.append(lambda v, i=i, p=permitidos: v[i] in p)
+                vectoriales.append(lambda v, i=i, t=tabla: t[v[i]])
+            elif campo in CAMPOS_NUMERICOS and nombre_op in OPERADORES:
+                op, umbral = OPERADORES[nombre_op], float(valor)
+                # operator.* funciona igual con escalares y con arrays de NumPy
+                escalares.append(lambda v, i=i, op=op, u=umbral: op(v[i], u))
+                vectoriales.append(lambda v, i=i, op=op, u=umbral: op(v[i], u))
+            else:
+                raise ValueError(f"Operador '{nombre_op}' no válido para '{campo}'")
+    return escalares, vectoriales
+
+
+def _compilar_factor(factor: Dict) -> Tuple[Callable, Callable]:
+    """
+    Compila un factor del score
+
+    Returns:
+        (puntos escalares, puntos vectoriales) sobre las tuplas de CAMPOS
+    """
+    campo = factor["campo"]
+    if campo not in CAMPOS:
+        raise ValueError(f"Campo desconocido en score: {campo}")
+    i = CAMPOS.index(campo)
+    default = int(factor.get("default", 0))
+
+    if "valores" in factor:
+        if campo not in CAMPOS_CATEGORICOS:
+            raise ValueError(f"'valores' solo aplica a campos categóricos, no a '{campo}'")
+        categorias = CAMPOS_CATEGORICOS[campo]
+        _tabla_categorica(campo, list(factor["valores"]))
+        puntos = {v: int(p) for v, p in factor["valores"].items()}
+        tabla = np.array([puntos.get(c, default) for c in categorias] + [default], dtype=np.int16)
+        return (lambda v: puntos.get(v[i], default)), (lambda v: tabla[v[i]])
+
+    if campo not in CAMPOS_NUMERICOS:
+        raise ValueError(f"'tramos' solo aplica a campos numéricos, no a '{campo}'")
+    tramos = []
+    for tramo in factor["tramos"]:
+        ops = [(OPERADORES[k], float(u)) for k, u in tramo.items() if k != "puntos"]
+        tramos.append((ops, int(tramo["puntos"])))
+
+    def escalar(v):
+        for ops, puntos in tramos:
+            if all(op(v[i], u) for op, u in ops):
+                return puntos
+        return default
+
+    def vectorial(v):
+        condiciones = [np.logical_and.reduce([op(v[i], u) for op, u in ops]) for ops, _ in tramos]
+        return np.select(condiciones, [p for _, p in tramos], default=default)
+
+    return escalar, vectorial
+
+
+class ReglasCompiladas:
+    """Reglas de segmentación y score listas para evaluar"""
+
+    def __init__(self, definicion: Dict, version: str):
+        """
+        Args:
+            definicion: Contenido del archivo de reglas
+            version: Id de versión (se adjunta a cada resultado)
+        """
+        self.version = version
+        self.definicion = definicion
+
+        segmentacion = definicion["segmentacion"]
+        self._reglas = []
+        for regla in segmentacion["reglas"]:
+            escalares, vectoriales = _compilar_condiciones(regla["condiciones"])
+            self._reglas.append((Segmento(regla["segmento"]), escalares, vectoriales))
+        self._default = Segmento(segmentacion["default"])
+        # Umbrales numéricos de las reglas, para medir la confianza (ver confianza_lote)
+        self._umbrales = {
+            campo: sorted({
+                float(umbral)
+                for regla in segmentacion["reglas"]
+                for umbral in regla["condiciones"].get(campo, {}).values()
+            })
+            for campo in CAMPOS_NUMERICOS
+        }
+
+        score = definicion["score"]
+        self._score_base = int(score.get("base", 0))
+        self._score_min = int(score.get("min", 0))
+        self._score_max = int(score.get("max", 100))
+        self._factores = [_compilar_factor(f) for f in score.get("factores", [])]
+
+    def segmentar(self, gasto: float, riesgo: str, actividad: str, engagement: float) -> Segmento:
+        """Segmenta un cliente (riesgo en minúsculas); gana la primera regla que se cumple"""
+        valores = (gasto, riesgo, actividad, engagement)
+        for segmento, predicados, _ in self._reglas:
+            if all(p(valores) for p in predicados):
+                return segmento
+        return self._default
+
+    def segmentar_lote(
+        self,
+        gasto: np.ndarray,
+        riesgo: np.ndarray,
+        actividad: np.ndarray,
+        engagement: np.ndarray
+    ) -> np.ndarray:
+        """Segmenta un lote con máscaras; retorna códigos int8 (índices de SEGMENTOS)"""
+        valores = (gasto, riesgo, actividad, engagement)
+        n = len(gasto)
+        condiciones = [
+            np.logical_and.reduce([p(valores) for p in predicados]) if predicados else np.ones(n, dtype=bool)
+            for _, _, predicados in self._reglas
+        ]
+        # np.select toma la primera condición verdadera: mismo orden que las reglas
+        return np.select(
+            condiciones,
+            [SEGMENTOS.index(segmento) for segmento, _, _ in self._reglas],
+            default=SEGMENTOS.index(self._default)
+        ).astype(np.int8)
+
+    def confianza_lote(
+        self,
+        gasto: np.ndarray,
+        riesgo: np.ndarray,
+        actividad: np.ndarray,
+        engagement: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Segmenta un lote y mide qué tan lejos está cada cliente de cambiar de segmento
+
+        La confianza es la distancia relativa |valor - umbral| / |umbral| al
+        umbral de gasto o engagement más cercano cuyo cruce cambia el segmento
+        asignado; es inf si ningún umbral lo cambia (p. ej. riesgo alto).
+
+        Returns:
+            (códigos de segmento como segmentar_lote, confianza por cliente)
+        """
+        numericos = {"gasto": gasto, "engagement": engagement}
+        codigos = self.segmentar_lote(gasto, riesgo, actividad, engagement)
+        confianza = np.full(len(gasto), np.inf)
+        for campo, umbrales in self._umbrales.items():
+            for umbral in umbrales:
+                escala = abs(umbral) or 1.0
+                distancia = np.abs(numericos[campo] - umbral) / escala
+                # Se evalúa justo a cada lado del umbral (cubre gt/gte/lt/lte)
+                for lado in (umbral - escala * 1e-9, umbral + escala * 1e-9):
+                    movidos = {**numericos, campo: np.full(len(gasto), lado)}
+                    cambia = self.segmentar_lote(movidos["gasto"], riesgo, actividad, movidos["engagement"]) != codigos
+                    confianza = np.where(cambia, np.minimum(confianza, distancia), confianza)
+        return codigos, confianza
+
+    def puntuar(self, gasto: float, riesgo: str, actividad: str, engagement: float) -> int:
+        """Score 0-100 de un cliente (riesgo en minúsculas)"""
+        valores = (gasto, riesgo, actividad, engagement)
+        score = self._score_base + sum(escalar(valores) for escalar, _ in self._factores)
+        return max(self._score_min, min(self._score_max, score))
+
+    def puntuar_lote(
+        self,
+        gasto: np.ndarray,
+        riesgo: np.ndarray,
+        actividad: np.ndarray,
+        engagement: np.ndarray
+    ) -> np.ndarray:
+        """Score de un lote (riesgo y actividad como códigos)"""
+        valores = (gasto, riesgo, actividad, engagement)
+        score = np.full(len(gasto), self._score_base, dtype=np.int32)
+        for _, vectorial in self._factores:
+            score += vectorial(valores)
+        return np.clip(score, self._score_min, self._score_max)
+
+
+def cargar_reglas(ruta: Path) -> ReglasCompiladas:
+    """
+    Lee y compila un archivo de reglas JSON
+
+    El id de versión combina el campo "version" del archivo con un hash del
+    contenido, de modo que editar el archivo siempre produce un id nuevo.
+    """
+    contenido = Path(ruta).read_bytes()
+    definicion = json.loads(contenido)
+    huella = hashlib.blake2b(contenido, digest_size=4).hexdigest()
+    return ReglasCompiladas(definicion, f"{definicion.get('version', '0')}-{huella}")
+
+
+class GestorReglas:
+    """Mantiene las reglas vigentes y permite reemplazarlas en caliente"""
+
+    # Versiones anteriores que se conservan para resultados en curso
+    MAX_VERSIONES = 8
+
+    def __init__(self, ruta: Optional[str] = None):
+        self.ruta = Path(ruta or os.getenv("REGLAS_SEGMENTACION_PATH") or RUTA_REGLAS_DEFAULT)
+        self._lock = threading.Lock()
+        self._versiones: "OrderedDict[str, ReglasCompiladas]" = OrderedDict()
+        self._actual = self._registrar(cargar_reglas(self.ruta))
+
+    def _registrar(self, reglas: ReglasCompiladas) -> ReglasCompiladas:
+        self._versiones[reglas.version] = reglas
+        self._versiones.move_to_end(reglas.version)
+        while len(self._versiones) > self.MAX_VERSIONES:
+            self._versiones.popitem(last=False)
+        return reglas
+
+    @property
+    def actual(self) -> ReglasCompiladas:
+        """Reglas vigentes (tomar una vez por cliente para evaluar de forma consistente)"""
+        return self._actual
+
+    def obtener(self, version: Optional[str]) -> ReglasCompiladas:
+        """Reglas de una versión concreta; si ya no está disponible, las vigentes"""
+        with self._lock:
+            return self._versiones.get(version, self._actual)
+
+    def recargar(self, ruta: Optional[str] = None) -> ReglasCompiladas:
+        """
+        Compila el archivo de reglas y lo publica de forma atómica
+
+        Si el archivo no es válido se lanza la excepción y las reglas vigentes
+        no cambian.
+        """
+        if ruta:
+            self.ruta = Path(ruta)
+        return self.publicar(cargar_reglas(self.ruta))
+
+    def publicar(self, reglas: ReglasCompiladas) -> ReglasCompiladas:
+        """Publica reglas ya compiladas como vigentes (p.ej. las recibidas por un worker)"""
+        with self._lock:
+            self._actual = self._registrar(reglas)
+        return reglas
+
+
+# Instancia global del gestor
+gestor_reglas = GestorReglas()
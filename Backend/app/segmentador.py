@@ -2,16 +2,32 @@
 Módulo Segmentador
 Aplica reglas determinísticas para segmentar clientes
 """
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
 from app.models import Cliente, PerfilSocial, Segmento
+from app.reglas import (
+    GestorReglas, ReglasCompiladas, gestor_reglas,
+    RIESGOS, ACTIVIDADES, SEGMENTOS, codificar
+)
 
 
 class Segmentador:
     """Segmenta clientes basado en reglas determinísticas"""
-    
+
+    def __init__(self, reglas: Optional[GestorReglas] = None):
+        """
+        Args:
+            reglas: Gestor de reglas a usar (por defecto el global, ver app/reglas.py)
+        """
+        self.reglas = reglas or gestor_reglas
+
     def segmentar(
-        self, 
-        cliente: Cliente, 
-        perfil_social: PerfilSocial
+        self,
+        cliente: Cliente,
+        perfil_social: PerfilSocial,
+        reglas: Optional[ReglasCompiladas] = None
     ) -> Segmento:
         """
         Segmenta un cliente basado en:
@@ -19,40 +35,108 @@ class Segmentador:
         - Riesgo
         - Gasto promedio
         - Señales sociales (actividad, engagement)
-        
+
+        Las reglas se leen de app/reglas_segmentacion.json (ver app/reglas.py);
+        por defecto: premium_alto_engagement, riesgo_alto, medio_conservador y
+        basico_crecimiento, en ese orden.
+
         Args:
             cliente: Información del cliente
             perfil_social: Perfil social generado
-            
+            reglas: Versión de reglas a usar (por defecto la vigente)
+
         Returns:
             Segmento asignado
         """
-        gasto = cliente.gasto_promedio
-        riesgo = cliente.riesgo.lower()
-        actividad = perfil_social.señales.actividad
-        engagement = perfil_social.señales.engagement_promedio
-        
-        # Regla 1: Premium Alto Engagement
-        # Alto gasto + baja/medio riesgo + alta actividad + buen engagement
-        if (gasto > 500 and 
-            riesgo in ["bajo", "medio"] and 
-            actividad == "alta" and 
-            engagement > 0.08):
-            return Segmento.PREMIUM_ALTO_ENGAGEMENT
-        
-        # Regla 2: Riesgo Alto
-        # Cualquier cliente con riesgo alto
-        if riesgo == "alto":
-            return Segmento.RIESGO_ALTO
-        
-        # Regla 3: Medio Conservador
-        # Gasto medio + riesgo medio/bajo + actividad media/baja
-        if (200 <= gasto <= 500 and 
-            riesgo in ["bajo", "medio"] and 
-            actividad in ["media", "baja"]):
-            return Segmento.MEDIO_CONSERVADOR
-        
-        # Regla 4: Básico Crecimiento (default)
-        # Clientes con bajo gasto pero potencial de crecimiento
-        return Segmento.BASICO_CRECIMIENTO
+        reglas = reglas or self.reglas.actual
+        return reglas.segmentar(
+            cliente.gasto_promedio,
+            cliente.riesgo.lower(),
+            perfil_social.señales.actividad,
+            perfil_social.señales.engagement_promedio
+        )
+
+    def segmentar_lote(
+        self,
+        gasto: np.ndarray,
+        riesgo: np.ndarray,
+        actividad: np.ndarray,
+        engagement: np.ndarray,
+        reglas: Optional[ReglasCompiladas] = None
+    ) -> np.ndarray:
+        """
+        Segmenta un lote de clientes con máscaras booleanas, en el mismo
+        orden de reglas que segmentar()
+
+        Args:
+            gasto: Gasto promedio por cliente
+            riesgo: Códigos de riesgo en minúsculas (ver RIESGOS y codificar)
+            actividad: Códigos de actividad (ver ACTIVIDADES y codificar)
+            engagement: Engagement promedio por cliente
+            reglas: Versión de reglas a usar (por defecto la vigente)
+
+        Returns:
+            Array int8 de códigos de segmento (índices de SEGMENTOS)
+        """
+        reglas = reglas or self.reglas.actual
+        return reglas.segmentar_lote(
+            np.asarray(gasto, dtype=np.float64),
+            np.asarray(riesgo),
+            np.asarray(actividad),
+            np.asarray(engagement, dtype=np.float64)
+        )
+
+    def segmentar_clientes(
+        self,
+        clientes: Sequence[Cliente],
+        perfiles: Sequence[PerfilSocial],
+        reglas: Optional[ReglasCompiladas] = None
+    ) -> List[Segmento]:
+        """
+        Segmenta una lista de clientes con sus perfiles usando segmentar_lote
+
+        Args:
+            clientes: Clientes a segmentar
+            perfiles: Perfil social de cada cliente (mismo orden)
+            reglas: Versión de reglas a usar (por defecto la vigente)
+
+        Returns:
+            Segmento de cada cliente
+        """
+        codigos = self.segmentar_lote(*self._columnas(clientes, perfiles), reglas)
+        return [SEGMENTOS[c] for c in codigos.tolist()]
+
+    def segmentar_con_confianza(
+        self,
+        clientes: Sequence[Cliente],
+        perfiles: Sequence[PerfilSocial],
+        reglas: Optional[ReglasCompiladas] = None
+    ) -> Tuple[List[Segmento], np.ndarray]:
+        """
+        Segmenta una lista de clientes y mide la confianza de las reglas
+
+        Args:
+            clientes: Clientes a segmentar
+            perfiles: Perfil social de cada cliente (mismo orden)
+            reglas: Versión de reglas a usar (por defecto la vigente)
+
+        Returns:
+            (segmento de cada cliente, distancia relativa al umbral más
+            cercano que lo cambiaría; ver ReglasCompiladas.confianza_lote)
+        """
+        reglas = reglas or self.reglas.actual
+        codigos, confianza = reglas.confianza_lote(*self._columnas(clientes, perfiles))
+        return [SEGMENTOS[c] for c in codigos.tolist()], confianza
 
+    @staticmethod
+    def _columnas(
+        clientes: Sequence[Cliente],
+        perfiles: Sequence[PerfilSocial]
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Columnas (gasto, riesgo, actividad, engagement) para la API por lotes"""
+        return (
+            np.fromiter((c.gasto_promedio for c in clientes), dtype=np.float64, count=len(clientes)),
+            codificar([c.riesgo.lower() for c in clientes], RIESGOS),
+            codificar([p.señales.actividad for p in perfiles], ACTIVIDADES),
+            np.fromiter((p.señales.engagement_promedio for p in perfiles), dtype=np.float64, count=len(perfiles))
+        )
@@ -2,9 +2,10 @@
 Gestor de sesiones para almacenar resultados de ejecuciones
 """
 import uuid
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Sequence, Union
 from datetime import datetime
 from app.models import AgentResult, LogEntry
+from app.eventos import BitacoraEventos
 import threading
 
 
@@ -32,12 +33,48 @@ class SessionManager:
         
         return session_id
     
+    def restaurar_sesion(
+        self,
+        session_id: str,
+        client_ids: List[str],
+        results: List[AgentResult],
+        created_at: str
+    ):
+        """Recrea en memoria una sesión desde su checkpoint, con los resultados ya obtenidos"""
+        with self._lock:
+            self._sessions[session_id] = {
+                "session_id": session_id,
+                "client_ids": client_ids,
+                "results": list(results),
+                "logs": [],
+                "status": "running",
+                "created_at": created_at,
+                "completed_at": None
+            }
+    
     def add_log(self, session_id: str, log: LogEntry):
         """Agrega un log a la sesión"""
         with self._lock:
             if session_id in self._sessions:
                 self._sessions[session_id]["logs"].append(log.dict())
     
+    def add_bitacora(self, session_id: str, bitacora: BitacoraEventos):
+        """Agrega los eventos de un cliente sin formatearlos (ver formatear_logs)"""
+        with self._lock:
+            if session_id in self._sessions:
+                self._sessions[session_id]["logs"].append(bitacora)
+    
+    @staticmethod
+    def formatear_logs(logs: Sequence[Union[Dict, BitacoraEventos]]) -> List[Dict]:
+        """Expande las bitácoras guardadas a dicts con la forma de LogEntry"""
+        formateados = []
+        for log in logs:
+            if isinstance(log, BitacoraEventos):
+                formateados.extend(log.como_log_entries())
+            else:
+                formateados.append(log)
+        return formateados
+    
     def add_result(self, session_id: str, result: AgentResult):
         """Agrega un resultado a la sesión"""
         with self._lock:
@@ -69,7 +106,7 @@ class SessionManager:
         with self._lock:
             session = self._sessions.get(session_id)
             if session:
-                return session.get("logs", [])
+                return self.formatear_logs(session.get("logs", []))
             return []
     
     def session_exists(self, session_id: str) -> bool:
@@ -0,0 +1,212 @@
+"""
+Snapshot binario de la base de clientes
+Guarda las columnas validadas del CSV como archivos .npy junto al CSV para que
+los siguientes arranques las mapeen en memoria en lugar de volver a parsearlo
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from app.cliente_store import _Textos
+from app.utils import COLUMNAS_CLIENTE, leer_columnas_csv
+
+# Cambiar al modificar el formato en disco (invalida snapshots anteriores)
+SNAPSHOT_VERSION = 2
+
+# Columnas de baja cardinalidad: se guardan como códigos + diccionario
+COLUMNAS_CATEGORICAS = ("sector", "riesgo", "red_social")
+
+
+def clave_csv(ruta_csv: str) -> Dict:
+    """
+    Calcula la clave de un CSV: tamaño, mtime y hash del contenido
+
+    Args:
+        ruta_csv: Ruta al archivo CSV
+
+    Returns:
+        Diccionario con size, mtime_ns, blake2b y version
+    """
+    stat = os.stat(ruta_csv)
+    hasher = hashlib.blake2b(digest_size=20)
+    with open(ruta_csv, "rb") as f:
+        while bloque := f.read(1 << 20):
+            hasher.update(bloque)
+    return {
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        "blake2b": hasher.hexdigest(),
+        "version": SNAPSHOT_VERSION
+    }
+
+
+# Campos de la clave que identifican el contenido; size y mtime_ns quedan en el
+# meta como referencia, pero tocar el CSV sin cambiarlo no invalida el snapshot
+CAMPOS_IDENTIDAD = ("blake2b", "version")
+
+
+def _nombre_snapshot(clave: Dict) -> str:
+    """Nombre del directorio del snapshot: contenido y versión de formato"""
+    return f"{clave['blake2b']}-v{clave['version']}"
+
+
+def _meta_valido(directorio: Path, clave: Dict) -> Optional[Dict]:
+    """Lee el meta.json de un snapshot si corresponde a la clave"""
+    try:
+        meta = json.loads((directorio / "meta.json").read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if any(meta.get(k) != clave[k] for k in CAMPOS_IDENTIDAD):
+        return None
+    return meta
+
+
+def directorio_snapshot(ruta_csv: str, directorio: Optional[str] = None) -> Path:
+    """Directorio base de snapshots de un CSV (por defecto junto al CSV)"""
+    csv = Path(ruta_csv)
+    return Path(directorio or csv.parent) / f"{csv.name}.snapshot"
+
+
+def _guardar_textos(directorio: Path, nombre: str, valores: np.ndarray) -> None:
+    """
+    Guarda una columna de textos como buffer UTF-8 + offsets (el formato de _Textos)
+
+    Un array <U ocupa 4 bytes por carácter del texto más largo en cada fila;
+    así cada fila ocupa solo sus bytes.
+    """
+    textos = _Textos([str(v) for v in valores])
+    np.save(directorio / f"{nombre}.utf8.npy", np.frombuffer(textos.buffer, dtype=np.uint8), allow_pickle=False)
+    np.save(directorio / f"{nombre}.offsets.npy", textos.offsets, allow_pickle=False)
+
+
+def _leer_textos(directorio: Path, nombre: str) -> np.ndarray:
+    """Columna de textos guardada con _guardar_textos, como array de objetos"""
+    buffer = np.load(directorio / f"{nombre}.utf8.npy", allow_pickle=False).tobytes()
+    offsets = np.load(directorio / f"{nombre}.offsets.npy", allow_pickle=False)
+    return _Textos.desde_buffer(buffer, offsets).objetos()
+
+
+def escribir_snapshot(columnas: Dict[str, np.ndarray], destino: Path, clave: Dict) -> Path:
+    """
+    Escribe las columnas como .npy sin comprimir (mapeables en memoria)
+
+    Las columnas de textos (nombre, id_cliente) se guardan como un buffer
+    UTF-8 y sus offsets; las categóricas, como códigos + diccionario.
+
+    Se escribe en un directorio temporal y se renombra al final, de modo que
+    varios procesos arrancando a la vez nunca lean un snapshot a medias.
+
+    Args:
+        columnas: Columnas validadas (ver utils.validar_columnas)
+        destino: Directorio base de snapshots
+        clave: Clave del CSV (ver clave_csv)
+
+    Returns:
+        Directorio del snapshot escrito
+    """
+    destino.mkdir(parents=True, exist_ok=True)
+    final = destino / _nombre_snapshot(clave)
+    tmp = Path(tempfile.mkdtemp(dir=destino, prefix=".tmp-"))
+    try:
+        categorias = {}
+        textos = []
+        for nombre, valores in columnas.items():
+            if nombre in COLUMNAS_CATEGORICAS:
+                codigos, uniques = pd.factorize(valores)
+                categorias[nombre] = uniques.tolist()
+                np.save(tmp / f"{nombre}.npy", codigos.astype(np.int32), allow_pickle=False)
+            elif valores.dtype == object or valores.dtype.kind == "U":
+                _guardar_textos(tmp, nombre, valores)
+                textos.append(nombre)
+            else:
+                np.save(tmp / f"{nombre}.npy", valores, allow_pickle=False)
+
+        meta = {
+            **clave, "filas": len(next(iter(columnas.values()))), "categorias": categorias, "textos": textos
+        }
+        (tmp / "meta.json").write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+
+        try:
+            os.replace(tmp, final)
+        except OSError:
+            if _meta_valido(final, clave) is not None:
+                # Otro proceso ya escribió el mismo snapshot
+                shutil.rmtree(tmp, ignore_errors=True)
+            else:
+                # Snapshot a medias o inválido con el mismo nombre: se reemplaza
+                shutil.rmtree(final, ignore_errors=True)
+                os.replace(tmp, final)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+    # Eliminar snapshots de versiones anteriores del CSV
+    for anterior in destino.iterdir():
+        if anterior != final and not anterior.name.startswith(".tmp-"):
+            shutil.rmtree(anterior, ignore_errors=True)
+
+    return final
+
+
+def leer_snapshot(destino: Path, clave: Dict) -> Optional[Dict[str, np.ndarray]]:
+    """
+    Lee un snapshot si existe y coincide con la clave del CSV
+
+    Args:
+        destino: Directorio base de snapshots
+        clave: Clave actual del CSV
+
+    Returns:
+        Columnas (las numéricas mapeadas en memoria) o None si no hay snapshot válido
+    """
+    directorio = destino / _nombre_snapshot(clave)
+    meta = _meta_valido(directorio, clave)
+    if meta is None:
+        return None
+
+    columnas = {}
+    for nombre in COLUMNAS_CLIENTE:
+        if nombre in meta["textos"]:
+            columnas[nombre] = _leer_textos(directorio, nombre)
+            continue
+        valores = np.load(directorio / f"{nombre}.npy", mmap_mode="r", allow_pickle=False)
+        if nombre in meta["categorias"]:
+            valores = np.array(meta["categorias"][nombre], dtype=object)[valores]
+        columnas[nombre] = valores
+    return columnas
+
+
+def cargar_columnas_con_snapshot(ruta_csv: str, directorio: Optional[str] = None) -> Dict[str, np.ndarray]:
+    """
+    Carga las columnas de clientes usando el snapshot cuando es válido
+
+    Si no hay snapshot (o el CSV cambió) se parsea el CSV y se intenta escribir
+    uno nuevo; un sistema de archivos de solo lectura no es un error.
+
+    Args:
+        ruta_csv: Ruta al archivo CSV
+        directorio: Directorio alternativo para los snapshots (p. ej. /tmp en Lambda)
+
+    Returns:
+        Diccionario columna -> array de NumPy
+    """
+    clave = clave_csv(ruta_csv)
+    destino = directorio_snapshot(ruta_csv, directorio)
+
+    columnas = leer_snapshot(destino, clave)
+    if columnas is not None:
+        return columnas
+
+    columnas = leer_columnas_csv(ruta_csv)
+    try:
+        escribir_snapshot(columnas, destino, clave)
+    except OSError as e:
+        print(f"⚠️ No se pudo escribir el snapshot en {destino}: {e}")
+    return columnas
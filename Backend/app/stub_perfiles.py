@@ -0,0 +1,77 @@
+"""
+Servidor stub de perfiles sociales
+Imita un proveedor externo de señales sociales para pruebas y benchmarks sin
+red: responde con PerfiladorSocialMock tras una latencia configurable.
+
+Uso:
+    python -m app.stub_perfiles --puerto 8100 --latencia-ms 80 --jitter-ms 20
+"""
+import argparse
+import asyncio
+import random
+from typing import List
+
+from fastapi import FastAPI, HTTPException
+from pydantic import BaseModel
+
+from app.models import Cliente, PerfilSocial
+from app.perfilador_social import PerfiladorSocialMock
+
+
+class SolicitudPerfiles(BaseModel):
+    clientes: List[Cliente]
+
+
+class RespuestaPerfiles(BaseModel):
+    perfiles: List[PerfilSocial]
+
+
+def crear_app_stub(latencia_ms: float = 50, jitter_ms: float = 0, tasa_error: float = 0.0) -> FastAPI:
+    """
+    Crea la aplicación del stub
+
+    Args:
+        latencia_ms: Latencia fija de cada solicitud
+        jitter_ms: Variación aleatoria uniforme en ±jitter_ms
+        tasa_error: Fracción de solicitudes que responden 503
+
+    Returns:
+        Aplicación FastAPI con POST /perfiles
+    """
+    app = FastAPI(title="Stub de perfiles sociales")
+    perfilador = PerfiladorSocialMock()
+    app.state.solicitudes = 0
+
+    @app.post("/perfiles", response_model=RespuestaPerfiles)
+    async def perfiles(solicitud: SolicitudPerfiles):
+        app.state.solicitudes += 1
+        latencia = max(0.0, latencia_ms + random.uniform(-jitter_ms, jitter_ms))
+        await asyncio.sleep(latencia / 1000)
+        if tasa_error and random.random() < tasa_error:
+            raise HTTPException(status_code=503, detail="Error simulado")
+        return RespuestaPerfiles(perfiles=perfilador.generar_lote(solicitud.clientes))
+
+    @app.get("/health")
+    async def health():
+        return {"status": "healthy", "solicitudes": app.state.solicitudes}
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Stub local de un proveedor de perfiles sociales")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=8100)
+    parser.add_argument("--latencia-ms", type=float, default=50)
+    parser.add_argument("--jitter-ms", type=float, default=0)
+    parser.add_argument("--tasa-error", type=float, default=0.0)
+    args = parser.parse_args()
+
+    print(f"🧪 Stub de perfiles en http://{args.host}:{args.puerto} (latencia {args.latencia_ms} ms ± {args.jitter_ms})")
+    uvicorn.run(crear_app_stub(args.latencia_ms, args.jitter_ms, args.tasa_error), host=args.host, port=args.puerto)
+
+
+if __name__ == "__main__":
+    main()
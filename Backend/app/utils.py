@@ -2,11 +2,105 @@
 Utilidades para carga de datos y exportación
 """
 import pandas as pd
+import numpy as np
 import json
-from typing import List, Dict
+import textwrap
+from itertools import islice
+from typing import List, Dict, Iterable, Iterator, TypeVar
 from pathlib import Path
 from app.models import Cliente, ResultadoCampaña
 
+T = TypeVar("T")
+
+# Tamaño de lote por defecto para la ingesta y exportación en streaming
+TAMAÑO_LOTE_DEFAULT = 10_000
+
+# Columnas obligatorias del CSV de clientes y su tipo
+COLUMNAS_CLIENTE: Dict[str, type] = {
+    "id_cliente": str,
+    "nombre": str,
+    "sector": str,
+    "gasto_promedio": float,
+    "riesgo": str,
+    "red_social": str,
+}
+
+
+def validar_columnas(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """
+    Valida y convierte las columnas de clientes de una sola vez
+
+    Args:
+        df: DataFrame leído del CSV
+
+    Returns:
+        Diccionario columna -> array de NumPy (object para textos, float64 para gasto)
+    """
+    faltantes = [c for c in COLUMNAS_CLIENTE if c not in df.columns]
+    if faltantes:
+        raise ValueError(f"Columnas faltantes en CSV: {', '.join(faltantes)}")
+
+    columnas = {}
+    for nombre, tipo in COLUMNAS_CLIENTE.items():
+        serie = df[nombre]
+        if tipo is float:
+            serie = pd.to_numeric(serie, errors="coerce")
+        nulos = serie.isna().to_numpy()
+        if nulos.any():
+            # El índice es global también al leer por chunks
+            filas = (df.index.to_numpy()[nulos][:5] + 1).tolist()
+            raise ValueError(f"Valores vacíos o inválidos en '{nombre}' (filas {filas})")
+        if tipo is float:
+            columnas[nombre] = serie.to_numpy(dtype=np.float64)
+        else:
+            columnas[nombre] = serie.astype(str).to_numpy(dtype=object)
+
+    return columnas
+
+
+def leer_columnas_csv(ruta_csv: str) -> Dict[str, np.ndarray]:
+    """
+    Lee el CSV de clientes como columnas validadas
+
+    Args:
+        ruta_csv: Ruta al archivo CSV
+
+    Returns:
+        Diccionario columna -> array de NumPy
+    """
+    df = pd.read_csv(
+        ruta_csv,
+        usecols=lambda c: c in COLUMNAS_CLIENTE,
+        dtype={c: str for c, t in COLUMNAS_CLIENTE.items() if t is str}
+    )
+    return validar_columnas(df)
+
+
+def clientes_desde_columnas(columnas: Dict[str, np.ndarray]) -> List[Cliente]:
+    """
+    Construye los clientes en bloque a partir de columnas ya validadas
+
+    Args:
+        columnas: Diccionario columna -> array (ver validar_columnas)
+
+    Returns:
+        Lista de clientes
+    """
+    # Las columnas ya están validadas: se omite la validación por fila de pydantic
+    return [
+        Cliente.model_construct(
+            id_cliente=id_cliente,
+            nombre=nombre,
+            sector=sector,
+            gasto_promedio=gasto,
+            riesgo=riesgo,
+            red_social=red_social
+        )
+        for id_cliente, nombre, sector, gasto, riesgo, red_social in zip(
+            *(columnas[c].tolist() for c in COLUMNAS_CLIENTE)
+        )
+    ]
+
 
 def cargar_clientes_csv(ruta_csv: str) -> List[Cliente]:
     """
@@ -18,21 +112,38 @@ def cargar_clientes_csv(ruta_csv: str) -> List[Cliente]:
     Returns:
         Lista de clientes
     """
-    df = pd.read_csv(ruta_csv)
-    clientes = []
-    
-    for _, row in df.iterrows():
-        cliente = Cliente(
-            id_cliente=str(row["id_cliente"]),
-            nombre=str(row["nombre"]),
-            sector=str(row["sector"]),
-            gasto_promedio=float(row["gasto_promedio"]),
-            riesgo=str(row["riesgo"]),
-            red_social=str(row["red_social"])
-        )
-        clientes.append(cliente)
+    return clientes_desde_columnas(leer_columnas_csv(ruta_csv))
+
+
+def iterar_clientes_csv(
+    ruta_csv: str,
+    tamaño_lote: int = TAMAÑO_LOTE_DEFAULT
+) -> Iterator[List[Cliente]]:
+    """
+    Lee el CSV de clientes en lotes sin cargar la base completa en memoria
     
-    return clientes
+    Args:
+        ruta_csv: Ruta al archivo CSV
+        tamaño_lote: Número de filas por lote
+        
+    Yields:
+        Lotes de clientes de como máximo tamaño_lote elementos
+    """
+    with pd.read_csv(
+        ruta_csv,
+        usecols=lambda c: c in COLUMNAS_CLIENTE,
+        dtype={c: str for c, t in COLUMNAS_CLIENTE.items() if t is str},
+        chunksize=tamaño_lote
+    ) as lector:
+        for df in lector:
+            yield clientes_desde_columnas(validar_columnas(df))
+
+
+def iterar_en_lotes(items: Iterable[T], tamaño_lote: int = TAMAÑO_LOTE_DEFAULT) -> Iterator[List[T]]:
+    """Agrupa un iterable en listas de como máximo tamaño_lote elementos"""
+    iterador = iter(items)
+    while lote := list(islice(iterador, tamaño_lote)):
+        yield lote
 
 
 def exportar_resultados_json(resultados: List[ResultadoCampaña]) -> str:
@@ -45,11 +156,44 @@ def exportar_resultados_json(resultados: List[ResultadoCampaña]) -> str:
     Returns:
         JSON string
     """
-    datos = []
-    for resultado in resultados:
-        datos.append(resultado.mensaje_json)
+    return "".join(iterar_exportacion_json([resultados]))
+
+
+def iterar_exportacion_json(lotes: Iterable[List[ResultadoCampaña]]) -> Iterator[str]:
+    """
+    Exporta resultados a JSON por partes, un fragmento por lote
     
-    return json.dumps(datos, indent=2, ensure_ascii=False)
+    Args:
+        lotes: Lotes de resultados de campaña
+        
+    Yields:
+        Fragmentos del array JSON (misma salida que exportar_resultados_json)
+    """
+    separador = "[\n"
+    for lote in lotes:
+        fragmentos = [
+            textwrap.indent(json.dumps(resultado.mensaje_json, indent=2, ensure_ascii=False), "  ")
+            for resultado in lote
+        ]
+        if fragmentos:
+            yield separador + ",\n".join(fragmentos)
+            separador = ",\n"
+    yield "[]" if separador == "[\n" else "\n]"
+
+
+def _fila_csv(resultado: ResultadoCampaña) -> Dict:
+    """Aplana un resultado de campaña a una fila del CSV exportado"""
+    return {
+        "id_cliente": resultado.id_cliente,
+        "nombre": resultado.nombre,
+        "segmento": resultado.segmento,
+        "id_campaña": resultado.campaña.id_campaña,
+        "nombre_campaña": resultado.campaña.nombre,
+        "canal": resultado.campaña.canal,
+        "cta": resultado.campaña.cta,
+        "ctr_estimado": resultado.métricas_simuladas.get("ctr_estimado") if resultado.métricas_simuladas else None,
+        "tasa_apertura": resultado.métricas_simuladas.get("tasa_apertura_estimada") if resultado.métricas_simuladas else None
+    }
 
 
 def exportar_resultados_csv(resultados: List[ResultadoCampaña]) -> str:
@@ -62,22 +206,26 @@ def exportar_resultados_csv(resultados: List[ResultadoCampaña]) -> str:
     Returns:
         CSV string
     """
-    datos = []
-    for resultado in resultados:
-        datos.append({
-            "id_cliente": resultado.id_cliente,
-            "nombre": resultado.nombre,
-            "segmento": resultado.segmento,
-            "id_campaña": resultado.campaña.id_campaña,
-            "nombre_campaña": resultado.campaña.nombre,
-            "canal": resultado.campaña.canal,
-            "cta": resultado.campaña.cta,
-            "ctr_estimado": resultado.métricas_simuladas.get("ctr_estimado") if resultado.métricas_simuladas else None,
-            "tasa_apertura": resultado.métricas_simuladas.get("tasa_apertura_estimada") if resultado.métricas_simuladas else None
-        })
+    return "".join(iterar_exportacion_csv([resultados]))
+
+
+def iterar_exportacion_csv(lotes: Iterable[List[ResultadoCampaña]]) -> Iterator[str]:
+    """
+    Exporta resultados a CSV por partes, escribiendo la cabecera solo una vez
     
-    df = pd.DataFrame(datos)
-    return df.to_csv(index=False)
+    Args:
+        lotes: Lotes de resultados de campaña
+        
+    Yields:
+        Fragmentos CSV, uno por lote
+    """
+    cabecera = True
+    for lote in lotes:
+        if not lote:
+            continue
+        df = pd.DataFrame([_fila_csv(resultado) for resultado in lote])
+        yield df.to_csv(index=False, header=cabecera)
+        cabecera = False
 
 
 def exportar_resultados_html(resultados: List[ResultadoCampaña]) -> str:
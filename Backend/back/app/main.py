@@ -110,9 +110,8 @@ async def ejecutar_agente(request: EjecutarAgenteRequest):
     resultados = []
     
     if request.procesar_todos:
-        # Procesar todos los clientes
-        for cliente in clientes_cache:
-            estado_final = orquestador.ejecutar(cliente)
+        # Procesar todos los clientes en un solo lote
+        for estado_final in orquestador.ejecutar_lote(clientes_cache):
             if estado_final.resultado:
                 resultados.append(estado_final.resultado)
     elif request.id_cliente:
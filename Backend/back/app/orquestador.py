@@ -2,7 +2,7 @@
 Orquestador FSM con LangGraph
 Controla el flujo: INGESTA → PERFIL → SEGMENTO → CAMPAÑA → SALIDA
 """
-from typing import Dict, Any, Literal
+from typing import Dict, Any, List, Literal, Sequence
 from datetime import datetime
 from langgraph.graph import StateGraph, END
 from langchain_core.messages import HumanMessage, SystemMessage
@@ -232,4 +232,31 @@ class OrquestadorAgente:
         resultado = self.graph.invoke(estado_inicial)
         
         return resultado
-
+    
+    def ejecutar_lote(self, clientes: Sequence[Cliente]) -> List[EstadoAgente]:
+        """
+        Ejecuta el agente para un lote de clientes, etapa por etapa
+        
+        Aplica cada nodo del FSM a todo el lote antes de pasar al siguiente,
+        sin despachar el grafo una vez por cliente. Los logs y errores de cada
+        cliente son los mismos que con ejecutar().
+        
+        Args:
+            clientes: Clientes a procesar
+            
+        Returns:
+            EstadoAgente de cada cliente, en el mismo orden
+        """
+        estados = [
+            EstadoAgente(estado_actual=Estado.INGESTA, cliente=cliente, logs=[])
+            for cliente in clientes
+        ]
+        for nodo in (
+            self._nodo_ingesta,
+            self._nodo_perfil,
+            self._nodo_segmento,
+            self._nodo_campaña,
+            self._nodo_salida
+        ):
+            estados = [nodo(estado) for estado in estados]
+        return estados
@@ -0,0 +1,408 @@
+"""
+Benchmarks de rendimiento del backend
+Genera bases de clientes sintéticas y mide las rutas críticas
+
+Uso:
+    python benchmark.py carga --filas 100000
+    python benchmark.py snapshot --filas 100000 1000000
+    python benchmark.py memoria --filas 200000
+    python benchmark.py segmentacion --filas 1000000
+    python benchmark.py perfiles --filas 200000
+    python benchmark.py agente --filas 5000
+    python benchmark.py paralelo --filas 20000 --workers 1 2 4 8
+    python benchmark.py proveedor --clientes 2000 --latencia-ms 50 --concurrencia 1 4 16 64
+    python benchmark.py llm --filas 150 --latencia-ms 200 --tasa-error 0.1 --rpm 0 100
+    python benchmark.py llm --filas 150 --rpm 0 --margen 0.1
+"""
+import argparse
+import asyncio
+import gc
+import os
+import threading
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from app.models import Cliente
+from app.utils import cargar_clientes_csv, clientes_desde_columnas, leer_columnas_csv
+from app.snapshot import cargar_columnas_con_snapshot
+from app.cliente_store import ClienteStore
+from app.models import PerfilSocial, SeñalesSociales
+from app.segmentador import Segmentador, RIESGOS, ACTIVIDADES
+from app.perfilador_social import PerfiladorSocialMock
+from app.proveedores_perfil import ProveedorHTTP
+from app.orquestador import OrquestadorAgente
+from app.paralelo import OrquestadorParalelo
+from app.stub_perfiles import crear_app_stub
+from app.cache_llm import CacheRespuestasLLM
+from app.cache_perfiles import cache_perfiles
+from app.llm_falso import ChatFalso
+from app.planificador_llm import LLMPlanificado, PlanificadorLLM, sesion_llm
+
+SECTORES = ["retail", "tech", "salud", "educación", "gastronomía"]
+RIESGOS = ["bajo", "medio", "alto"]
+REDES = ["instagram", "facebook", "twitter", "linkedin"]
+
+
+def generar_csv_sintetico(ruta: Path, filas: int, seed: int = 42) -> Path:
+    """Escribe un CSV de clientes sintético con el formato de data/clientes.csv"""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "id_cliente": [f"C{i:08d}" for i in range(filas)],
+        "nombre": [f"Cliente {i}" for i in range(filas)],
+        "sector": rng.choice(SECTORES, filas),
+        "gasto_promedio": rng.uniform(50, 1200, filas).round(2),
+        "riesgo": rng.choice(RIESGOS, filas),
+        "red_social": rng.choice(REDES, filas),
+    })
+    df.to_csv(ruta, index=False)
+    return ruta
+
+
+def _cargar_iterrows(ruta_csv: str):
+    """Ruta original de carga (fila a fila con iterrows), como referencia"""
+    df = pd.read_csv(ruta_csv)
+    return [
+        Cliente(
+            id_cliente=str(row["id_cliente"]),
+            nombre=str(row["nombre"]),
+            sector=str(row["sector"]),
+            gasto_promedio=float(row["gasto_promedio"]),
+            riesgo=str(row["riesgo"]),
+            red_social=str(row["red_social"])
+        )
+        for _, row in df.iterrows()
+    ]
+
+
+def _medir(funcion, *args):
+    """Ejecuta la función y retorna (resultado, segundos)"""
+    inicio = time.perf_counter()
+    resultado = funcion(*args)
+    return resultado, time.perf_counter() - inicio
+
+
+def bench_carga(args):
+    """Compara la carga fila a fila contra la carga columnar"""
+    with tempfile.TemporaryDirectory() as tmp:
+        ruta = generar_csv_sintetico(Path(tmp) / "clientes.csv", args.filas)
+        print(f"📋 CSV sintético: {args.filas:,} filas\n")
+
+        rutas = [("iterrows", _cargar_iterrows), ("columnar", cargar_clientes_csv)]
+        for nombre, funcion in rutas:
+            clientes, segundos = _medir(funcion, str(ruta))
+            assert len(clientes) == args.filas
+            print(f"   {nombre:<10} {segundos:8.3f} s  {args.filas / segundos:12,.0f} filas/s")
+
+
+def bench_snapshot(args):
+    """Compara el arranque parseando el CSV contra el arranque desde el snapshot"""
+    for filas in args.filas:
+        with tempfile.TemporaryDirectory() as tmp:
+            ruta = str(generar_csv_sintetico(Path(tmp) / "clientes.csv", filas))
+            print(f"📋 CSV sintético: {filas:,} filas")
+
+            columnas_csv, t_csv = _medir(leer_columnas_csv, ruta)
+            _, t_escritura = _medir(cargar_columnas_con_snapshot, ruta)
+            columnas_snap, t_snap = _medir(cargar_columnas_con_snapshot, ruta)
+            _, t_clientes_csv = _medir(clientes_desde_columnas, columnas_csv)
+            _, t_clientes_snap = _medir(clientes_desde_columnas, columnas_snap)
+
+            print(f"   columnas desde CSV       {t_csv:8.3f} s")
+            print(f"   primer arranque (+snap)  {t_escritura:8.3f} s")
+            print(f"   columnas desde snapshot  {t_snap:8.3f} s  ({t_csv / t_snap:.1f}x)")
+            print(f"   arranque completo CSV    {t_csv + t_clientes_csv:8.3f} s")
+            print(f"   arranque completo snap   {t_snap + t_clientes_snap:8.3f} s\n")
+
+
+def _memoria_retenida(funcion, *args):
+    """Bytes que quedan asignados tras ejecutar la función (resultado vivo)"""
+    gc.collect()
+    tracemalloc.start()
+    resultado = funcion(*args)
+    gc.collect()
+    retenidos = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return resultado, retenidos
+
+
+def _store_desde_csv(ruta_csv: str) -> ClienteStore:
+    store = ClienteStore()
+    store.reemplazar_columnas(leer_columnas_csv(ruta_csv))
+    return store
+
+
+def bench_memoria(args):
+    """Compara bytes por cliente: lista de Cliente vs ClienteStore columnar"""
+    with tempfile.TemporaryDirectory() as tmp:
+        ruta = str(generar_csv_sintetico(Path(tmp) / "clientes.csv", args.filas))
+        print(f"📋 CSV sintético: {args.filas:,} filas\n")
+
+        clientes, bytes_lista = _memoria_retenida(cargar_clientes_csv, ruta)
+        del clientes
+        store, bytes_store = _memoria_retenida(_store_desde_csv, ruta)
+
+        print(f"   List[Cliente]   {bytes_lista / 2**20:9.1f} MiB  {bytes_lista / args.filas:7.1f} bytes/cliente")
+        print(f"   ClienteStore    {bytes_store / 2**20:9.1f} MiB  {bytes_store / len(store):7.1f} bytes/cliente")
+        print(f"   Reducción       {bytes_lista / bytes_store:9.1f}x")
+
+
+def bench_segmentacion(args):
+    """Compara la segmentación cliente a cliente contra segmentar_lote"""
+    rng = np.random.default_rng(42)
+    n = args.filas
+    gasto = rng.uniform(50, 1200, n)
+    riesgo = rng.integers(0, len(RIESGOS), n).astype(np.int8)
+    actividad = rng.integers(0, len(ACTIVIDADES), n).astype(np.int8)
+    engagement = rng.uniform(0.01, 0.15, n)
+    segmentador = Segmentador()
+    print(f"📋 {n:,} clientes\n")
+
+    _, t_lote = _medir(segmentador.segmentar_lote, gasto, riesgo, actividad, engagement)
+    print(f"   segmentar_lote  {t_lote:8.3f} s  {n / t_lote:14,.0f} clientes/s")
+
+    # La ruta escalar se mide sobre una muestra y se extrapola
+    muestra = min(n, 50_000)
+    clientes = [
+        Cliente.model_construct(id_cliente=str(i), nombre="", sector="retail", gasto_promedio=float(gasto[i]),
+                                riesgo=RIESGOS[riesgo[i]], red_social="instagram")
+        for i in range(muestra)
+    ]
+    perfiles = [
+        PerfilSocial.model_construct(id_cliente=str(i), red_social="instagram", señales=SeñalesSociales.model_construct(
+            intereses=[], tono="", actividad=ACTIVIDADES[actividad[i]],
+            engagement_promedio=float(engagement[i]), frecuencia_publicacion=""))
+        for i in range(muestra)
+    ]
+    _, t_escalar = _medir(lambda: [segmentador.segmentar(c, p) for c, p in zip(clientes, perfiles)])
+    print(f"   segmentar       {t_escalar * n / muestra:8.3f} s  {muestra / t_escalar:14,.0f} clientes/s (muestra {muestra:,})")
+
+
+def bench_perfiles(args):
+    """Compara la generación de perfiles cliente a cliente contra generar_lote"""
+    rng = np.random.default_rng(42)
+    n = args.filas
+    clientes = [
+        Cliente.model_construct(id_cliente=f"C{i:07d}", nombre="", sector=SECTORES[s],
+                                gasto_promedio=float(g), riesgo="bajo", red_social=REDES[r])
+        for i, (s, g, r) in enumerate(zip(
+            rng.integers(0, len(SECTORES), n), rng.uniform(50, 1200, n), rng.integers(0, len(REDES), n)
+        ))
+    ]
+    perfilador = PerfiladorSocialMock()
+    print(f"📋 {n:,} clientes\n")
+
+    _, t_columnas = _medir(
+        perfilador.generar_columnas,
+        [c.id_cliente for c in clientes], [c.sector for c in clientes],
+        [c.red_social for c in clientes], np.array([c.gasto_promedio for c in clientes])
+    )
+    print(f"   generar_columnas  {t_columnas:8.3f} s  {n / t_columnas:14,.0f} clientes/s")
+    _, t_lote = _medir(perfilador.generar_lote, clientes)
+    print(f"   generar_lote      {t_lote:8.3f} s  {n / t_lote:14,.0f} clientes/s")
+
+    muestra = min(n, 20_000)
+    _, t_escalar = _medir(lambda: [perfilador.generar_señales(c) for c in clientes[:muestra]])
+    print(f"   generar_señales   {t_escalar * n / muestra:8.3f} s  {muestra / t_escalar:14,.0f} clientes/s (muestra {muestra:,})")
+
+
+def bench_agente(args):
+    """Compara ejecutar por el grafo LangGraph, por la ruta directa y ejecutar_lote"""
+    with tempfile.TemporaryDirectory() as tmp:
+        clientes = cargar_clientes_csv(str(generar_csv_sintetico(Path(tmp) / "clientes.csv", args.filas)))
+    print(f"📋 {len(clientes):,} clientes\n")
+
+    for nombre, orquestador in (
+        ("grafo", OrquestadorAgente(ruta_directa=False)),
+        ("directo", OrquestadorAgente(ruta_directa=True)),
+    ):
+        # Cada ejecución empieza con la caché de perfiles vacía: si no, la
+        # segunda reutiliza los perfiles de la primera y parece más rápida
+        cache_perfiles.invalidar()
+        latencias = np.empty(len(clientes))
+        for i, cliente in enumerate(clientes):
+            inicio = time.perf_counter()
+            orquestador.ejecutar(cliente)
+            latencias[i] = time.perf_counter() - inicio
+        p50, p99 = np.percentile(latencias, [50, 99]) * 1000
+        print(
+            f"   ejecutar ({nombre:7s})  {latencias.sum():8.3f} s  {len(clientes) / latencias.sum():10,.0f} clientes/s"
+            f"  p50 {p50:.3f} ms  p99 {p99:.3f} ms"
+        )
+
+    cache_perfiles.invalidar()
+    _, t_lote = _medir(OrquestadorAgente().ejecutar_lote, clientes)
+    print(f"   ejecutar_lote        {t_lote:8.3f} s  {len(clientes) / t_lote:10,.0f} clientes/s")
+
+
+def bench_paralelo(args):
+    """Escalado del modo paralelo con distinto número de procesos"""
+    with tempfile.TemporaryDirectory() as tmp:
+        store = _store_desde_csv(str(generar_csv_sintetico(Path(tmp) / "clientes.csv", args.filas)))
+    ids = [c.id_cliente for c in store.todos()]
+    print(f"📋 {len(ids):,} clientes, lotes de {args.lote} ({os.cpu_count()} núcleos)\n")
+
+    async def procesar(paralelo):
+        return sum([len(lote) async for lote in paralelo.procesar(store, ids)])
+
+    base = None
+    for workers in args.workers:
+        paralelo = OrquestadorParalelo(workers, tamaño_lote=args.lote)
+        try:
+            # El arranque de los procesos no se mide
+            paralelo.iniciar(store)
+            _, segundos = _medir(asyncio.run, procesar(paralelo))
+        finally:
+            paralelo.cerrar()
+        base = base or segundos
+        print(
+            f"   {workers:2d} procesos  {segundos:8.3f} s  {len(ids) / segundos:10,.0f} clientes/s"
+            f"  aceleración x{base / segundos:.2f}"
+        )
+
+
+def _iniciar_stub(latencia_ms: float, jitter_ms: float, puerto: int):
+    """Levanta el stub de perfiles con uvicorn en un hilo y espera a que acepte conexiones"""
+    import uvicorn
+
+    config = uvicorn.Config(
+        crear_app_stub(latencia_ms, jitter_ms), host="127.0.0.1", port=puerto, log_level="warning"
+    )
+    servidor = uvicorn.Server(config)
+    threading.Thread(target=servidor.run, daemon=True).start()
+    while not servidor.started:
+        time.sleep(0.05)
+    return servidor
+
+
+def bench_proveedor(args):
+    """Throughput del proveedor HTTP contra el stub local con distintas concurrencias"""
+    clientes = [
+        Cliente.model_construct(id_cliente=f"C{i:07d}", nombre="", sector=SECTORES[i % len(SECTORES)],
+                                gasto_promedio=float(100 + i % 900), riesgo="bajo", red_social=REDES[i % len(REDES)])
+        for i in range(args.clientes)
+    ]
+    servidor = _iniciar_stub(args.latencia_ms, args.jitter_ms, args.puerto)
+    print(f"📋 {args.clientes:,} clientes, lotes de {args.lote}, latencia {args.latencia_ms} ms ± {args.jitter_ms}\n")
+
+    async def medir(concurrencia):
+        proveedor = ProveedorHTTP(
+            f"http://127.0.0.1:{args.puerto}", max_concurrencia=concurrencia, tamaño_lote=args.lote
+        )
+        try:
+            inicio = time.perf_counter()
+            await proveedor.obtener_perfiles(clientes)
+            return time.perf_counter() - inicio
+        finally:
+            await proveedor.cerrar()
+
+    try:
+        for concurrencia in args.concurrencia:
+            segundos = asyncio.run(medir(concurrencia))
+            print(f"   concurrencia {concurrencia:4d}  {segundos:8.3f} s  {args.clientes / segundos:12,.0f} perfiles/s")
+    finally:
+        servidor.should_exit = True
+
+
+def bench_llm(args):
+    """Segmentación con GenAI contra el modelo falso, con distintos límites de RPM"""
+    with tempfile.TemporaryDirectory() as tmp:
+        clientes = cargar_clientes_csv(str(generar_csv_sintetico(Path(tmp) / "clientes.csv", args.filas)))
+    print(
+        f"📋 {len(clientes):,} clientes, latencia {args.latencia_ms} ms, 429 simulados {args.tasa_error:.0%},"
+        f" concurrencia {args.concurrencia}\n"
+    )
+
+    for rpm in args.rpm:
+        planificador = PlanificadorLLM(rpm=rpm, reintentos=args.reintentos, backoff_segundos=0.05)
+        orquestador = OrquestadorAgente(use_genai=True)
+        orquestador.llm = LLMPlanificado(
+            ChatFalso(latencia_segundos=args.latencia_ms / 1000, tasa_error=args.tasa_error), planificador
+        )
+        orquestador.cache_llm = CacheRespuestasLLM(ttl_segundos=0)
+        orquestador.max_concurrencia_llm = args.concurrencia
+        orquestador.margen_confianza = args.margen
+
+        async def sesion():
+            sesion_llm.set("benchmark")
+            return await orquestador.ejecutar_lote_async(clientes)
+
+        estados, segundos = _medir(asyncio.run, sesion())
+        uso = planificador.uso_sesion("benchmark")
+        fallback = sum(any("Error en GenAI" in log["mensaje"] for log in e.logs) for e in estados)
+        print(
+            f"   rpm {f'{rpm:g}' if rpm else 'sin límite':>10}  {segundos:8.3f} s  {len(clientes) / segundos:8,.1f} clientes/s"
+            f"  429 reintentados {uso['reintentos_429']:4d}  fallback {fallback:4d}"
+            f"  tokens {uso['tokens_total']:8,d}  espera acumulada {uso['espera_segundos']:.1f} s"
+        )
+        if args.margen:
+            especulacion = orquestador.estadisticas_especulacion()
+            print(
+                f"   {'':14s}  sin LLM {especulacion['tasa_sin_llm']:.0%} de los clientes,"
+                f" latencia ahorrada ~{especulacion['latencia_ahorrada_segundos']:.1f} s"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks del backend CRM")
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+
+    carga = subparsers.add_parser("carga", help="Carga del CSV de clientes")
+    carga.add_argument("--filas", type=int, default=100_000)
+    carga.set_defaults(funcion=bench_carga)
+
+    snapshot = subparsers.add_parser("snapshot", help="Arranque desde CSV vs snapshot binario")
+    snapshot.add_argument("--filas", type=int, nargs="+", default=[100_000, 1_000_000])
+    snapshot.set_defaults(funcion=bench_snapshot)
+
+    memoria = subparsers.add_parser("memoria", help="Memoria por cliente antes/después del almacén columnar")
+    memoria.add_argument("--filas", type=int, default=200_000)
+    memoria.set_defaults(funcion=bench_memoria)
+
+    segmentacion = subparsers.add_parser("segmentacion", help="Segmentación escalar vs por lotes")
+    segmentacion.add_argument("--filas", type=int, default=1_000_000)
+    segmentacion.set_defaults(funcion=bench_segmentacion)
+
+    perfiles = subparsers.add_parser("perfiles", help="Generación de perfiles sociales escalar vs por lotes")
+    perfiles.add_argument("--filas", type=int, default=200_000)
+    perfiles.set_defaults(funcion=bench_perfiles)
+
+    agente = subparsers.add_parser("agente", help="Ejecución del agente cliente a cliente vs por lotes")
+    agente.add_argument("--filas", type=int, default=5_000)
+    agente.set_defaults(funcion=bench_agente)
+
+    paralelo = subparsers.add_parser("paralelo", help="Escalado del modo paralelo (ProcessPoolExecutor)")
+    paralelo.add_argument("--filas", type=int, default=20_000)
+    paralelo.add_argument("--lote", type=int, default=500)
+    paralelo.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    paralelo.set_defaults(funcion=bench_paralelo)
+
+    proveedor = subparsers.add_parser("proveedor", help="Proveedor HTTP de perfiles contra el stub local")
+    proveedor.add_argument("--clientes", type=int, default=2_000)
+    proveedor.add_argument("--lote", type=int, default=10)
+    proveedor.add_argument("--latencia-ms", type=float, default=50)
+    proveedor.add_argument("--jitter-ms", type=float, default=10)
+    proveedor.add_argument("--concurrencia", type=int, nargs="+", default=[1, 4, 16, 64])
+    proveedor.add_argument("--puerto", type=int, default=8765)
+    proveedor.set_defaults(funcion=bench_proveedor)
+
+    llm = subparsers.add_parser("llm", help="Planificador del LLM (RPM, 429) contra el modelo falso")
+    llm.add_argument("--filas", type=int, default=150)
+    llm.add_argument("--latencia-ms", type=float, default=200)
+    llm.add_argument("--tasa-error", type=float, default=0.1)
+    llm.add_argument("--concurrencia", type=int, default=32)
+    llm.add_argument("--reintentos", type=int, default=3)
+    llm.add_argument("--rpm", type=float, nargs="+", default=[0, 100])
+    llm.add_argument("--margen", type=float, default=0, help="LLM_MARGEN_CONFIANZA (reglas primero)")
+    llm.set_defaults(funcion=bench_llm)
+
+    args = parser.parse_args()
+    args.funcion(args)
+
+
+if __name__ == "__main__":
+    main()
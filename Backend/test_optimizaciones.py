@@ -0,0 +1,1228 @@
+"""
+Pruebas de las optimizaciones de carga y procesamiento
+Se ejecutan con pytest o directamente: python test_optimizaciones.py
+"""
+import asyncio
+import gc
+import json
+import os
+import pickle
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+import numpy as np
+
+from app.utils import (
+    cargar_clientes_csv,
+    iterar_clientes_csv,
+    exportar_resultados_json,
+    exportar_resultados_csv,
+    iterar_exportacion_json,
+    iterar_exportacion_csv,
+    iterar_en_lotes
+)
+from app.orquestador import OrquestadorAgente
+from app import snapshot as snapshot_modulo
+from app.snapshot import cargar_columnas_con_snapshot, directorio_snapshot
+from app.utils import clientes_desde_columnas, leer_columnas_csv
+from app.cliente_store import ClienteStore
+from app.cache_respuestas import CacheRespuestas, RespuestaSerializada
+from app.models import AgentResult, Cliente, PerfilSocial, SeñalesSociales, Segmento, EstadoAgente, Estado
+from app.reglas import GestorReglas, RUTA_REGLAS_DEFAULT, gestor_reglas
+from app.perfilador_social import PerfiladorSocialMock
+from app.cache_perfiles import CachePerfiles, PerfiladorCacheado, origen_perfiles
+from app.cache_llm import CacheRespuestasLLM, clave_llm
+from app.llm_falso import ChatFalso
+from app.metricas import HistogramaLatencia, MetricasNodos, NODOS
+from app.eventos import BitacoraEventos, Plantilla
+from app.planificador_llm import BucketMinuto, ErrorPlanificador, LLMPlanificado, PlanificadorLLM, sesion_llm
+from app.proveedores_perfil import ErrorProveedor, ProveedorBase, ProveedorHTTP, ProveedorMockAsync
+from app.stub_perfiles import crear_app_stub
+from app.paralelo import OrquestadorParalelo
+from app.adapters import estado_to_agent_result
+from app.checkpoints import AlmacenCheckpoints
+from app.session_manager import SessionManager
+from app.segmentador import Segmentador, SEGMENTOS, RIESGOS, ACTIVIDADES, codificar
+from benchmark import generar_csv_sintetico, _cargar_iterrows
+
+CSV_EJEMPLO = "data/clientes.csv"
+
+
+def test_carga_columnar_equivale_a_iterrows():
+    """La carga columnar produce los mismos clientes que la ruta fila a fila"""
+    with tempfile.TemporaryDirectory() as tmp:
+        ruta = str(generar_csv_sintetico(Path(tmp) / "clientes.csv", 2_000))
+        assert cargar_clientes_csv(ruta) == _cargar_iterrows(ruta)
+    assert cargar_clientes_csv(CSV_EJEMPLO) == _cargar_iterrows(CSV_EJEMPLO)
+
+
+def test_carga_rechaza_columnas_invalidas():
+    """Columnas faltantes o gasto no numérico producen ValueError"""
+    with tempfile.TemporaryDirectory() as tmp:
+        ruta = Path(tmp) / "clientes.csv"
+        ruta.write_text("id_cliente,nombre\nC1,Ana\n", encoding="utf-8")
+        try:
+            cargar_clientes_csv(str(ruta))
+            assert False, "Debió fallar por columnas faltantes"
+        except ValueError as e:
+            assert "gasto_promedio" in str(e)
+
+        ruta.write_text(
+            "id_cliente,nombre,sector,gasto_promedio,riesgo,red_social\n"
+            "C1,Ana,retail,abc,bajo,instagram\n",
+            encoding="utf-8"
+        )
+        try:
+            cargar_clientes_csv(str(ruta))
+            assert False, "Debió fallar por gasto inválido"
+        except ValueError as e:
+            assert "gasto_promedio" in str(e)
+
+
+def test_ingesta_por_lotes_equivale_a_carga_completa():
+    """La lectura en streaming entrega los mismos clientes en lotes acotados"""
+    with tempfile.TemporaryDirectory() as tmp:
+        ruta = str(generar_csv_sintetico(Path(tmp) / "clientes.csv", 2_500))
+        lotes = list(iterar_clientes_csv(ruta, tamaño_lote=1_000))
+        assert [len(lote) for lote in lotes] == [1_000, 1_000, 500]
+        assert [c for lote in lotes for c in lote] == cargar_clientes_csv(ruta)
+
+
+def test_exportacion_por_lotes_equivale_a_completa():
+    """Exportar por lotes produce el mismo JSON/CSV que exportar de una vez"""
+    orquestador = OrquestadorAgente(use_genai=False)
+    resultados = [orquestador.ejecutar(c).resultado for c in cargar_clientes_csv(CSV_EJEMPLO)]
+
+    esperado_json = json.dumps([r.mensaje_json for r in resultados], indent=2, ensure_ascii=False)
+    assert exportar_resultados_json(resultados) == esperado_json
+    assert "".join(iterar_exportacion_json(iterar_en_lotes(resultados, 3))) == esperado_json
+    assert exportar_resultados_json([]) == "[]"
+
+    assert "".join(iterar_exportacion_csv(iterar_en_lotes(resultados, 3))) == exportar_resultados_csv(resultados)
+
+
+def test_snapshot_equivale_al_csv_y_se_invalida():
+    """El snapshot reproduce el CSV y se regenera cuando el CSV cambia"""
+    with tempfile.TemporaryDirectory() as tmp:
+        ruta = str(generar_csv_sintetico(Path(tmp) / "clientes.csv", 1_500))
+        esperado = cargar_clientes_csv(ruta)
+
+        assert clientes_desde_columnas(cargar_columnas_con_snapshot(ruta)) == esperado
+        snapshots = list(directorio_snapshot(ruta).iterdir())
+        assert len(snapshots) == 1
+        # Los textos ocupan sus bytes UTF-8, no 4 bytes por carácter del más largo
+        bytes_nombres = sum(len(c.nombre.encode("utf-8")) for c in esperado)
+        assert not (snapshots[0] / "nombre.npy").exists()
+        assert (snapshots[0] / "nombre.utf8.npy").stat().st_size < bytes_nombres + 256
+        assert clientes_desde_columnas(cargar_columnas_con_snapshot(ruta)) == esperado
+
+        # Tocar el CSV sin cambiar su contenido no obliga a parsearlo de nuevo
+        os.utime(ruta, ns=(time.time_ns(), time.time_ns() + 10**9))
+        parseos = []
+        leer_original = snapshot_modulo.leer_columnas_csv
+        snapshot_modulo.leer_columnas_csv = lambda r: parseos.append(r) or leer_original(r)
+        try:
+            for _ in range(3):
+                assert clientes_desde_columnas(cargar_columnas_con_snapshot(ruta)) == esperado
+        finally:
+            snapshot_modulo.leer_columnas_csv = leer_original
+        assert parseos == [] and list(directorio_snapshot(ruta).iterdir()) == snapshots
+
+        generar_csv_sintetico(Path(ruta), 1_000, seed=7)
+        assert clientes_desde_columnas(cargar_columnas_con_snapshot(ruta)) == cargar_clientes_csv(ruta)
+        nuevos = list(directorio_snapshot(ruta).iterdir())
+        assert len(nuevos) == 1 and nuevos != snapshots
+
+        # Textos con caracteres fuera de ASCII y vacíos vuelven idénticos
+        columnas = leer_columnas_csv(ruta)
+        columnas["nombre"] = columnas["nombre"].copy()
+        columnas["nombre"][:3] = ["Muñoz Peña", "", "José 🚀"]
+        clave = {"blake2b": "prueba", "version": snapshot_modulo.SNAPSHOT_VERSION}
+        snapshot_modulo.escribir_snapshot(columnas, Path(tmp) / "otro", clave)
+        leidas = snapshot_modulo.leer_snapshot(Path(tmp) / "otro", clave)
+        assert leidas["nombre"].tolist() == columnas["nombre"].tolist()
+        assert leidas["id_cliente"].tolist() == columnas["id_cliente"].tolist()
+
+
+def test_store_busqueda_e_indices():
+    """El almacén responde igual que un recorrido lineal de la lista"""
+    with tempfile.TemporaryDirectory() as tmp:
+        clientes = cargar_clientes_csv(str(generar_csv_sintetico(Path(tmp) / "clientes.csv", 3_000)))
+    store = ClienteStore(clientes)
+
+    assert len(store) == len(clientes) and store.todos() == clientes
+    assert store.obtener(clientes[1234].id_cliente) == clientes[1234]
+    assert store.vista(clientes[1234].id_cliente).a_cliente() == clientes[1234]
+    assert clientes[1234].id_cliente in store and "NO-EXISTE" not in store
+    assert store.obtener("NO-EXISTE") is None
+    assert store.filtrar(sector="tech", riesgo="ALTO") == [
+        c for c in clientes if c.sector == "tech" and c.riesgo == "alto"
+    ]
+    assert store.filtrar(sector=None) == clientes
+    assert store.filtrar(red_social="myspace") == []
+
+    # Más de 65535 categorías no desbordan los códigos; un nombre largo no infla las demás filas
+    n = 70_000
+    columnas = {
+        "id_cliente": np.array([str(i) for i in range(n)], dtype=object),
+        "nombre": np.array(["x" * 300 if i == 0 else f"Ñandú {i}" for i in range(n)], dtype=object),
+        "sector": np.array([f"s{i}" for i in range(n)], dtype=object),
+        "gasto_promedio": np.arange(n, dtype=np.float64),
+        "riesgo": np.array(["bajo"] * n, dtype=object),
+        "red_social": np.array(["instagram"] * n, dtype=object),
+    }
+    grande = ClienteStore()
+    grande.reemplazar_columnas(columnas)
+    assert grande.obtener("69999").sector == "s69999" and grande.obtener("69999").nombre == "Ñandú 69999"
+    assert grande.filtrar(sector="s69999")[0].id_cliente == "69999"
+    assert grande._datos.nombres.nbytes < 300 * n / 10
+    assert grande.columnas()["nombre"].tolist() == columnas["nombre"].tolist()
+
+
+def test_store_consulta_paginada_equivale_a_fuerza_bruta():
+    """Filtros, rango de gasto, orden y paginación coinciden con un recorrido lineal"""
+    with tempfile.TemporaryDirectory() as tmp:
+        clientes = cargar_clientes_csv(str(generar_csv_sintetico(Path(tmp) / "clientes.csv", 3_000)))
+    store = ClienteStore(clientes)
+
+    consultas = [
+        dict(sector="salud", gasto_min=300.0, orden="-gasto_promedio", offset=5, limit=20),
+        dict(gasto_min=100.0, gasto_max=400.0, orden="nombre", limit=50),
+        dict(riesgo="alto", red_social="twitter", orden="id_cliente"),
+        dict(orden="sector", offset=2_990, limit=20),
+    ]
+    for consulta in consultas:
+        seleccion = [
+            c for c in clientes
+            if all(getattr(c, campo) == consulta[campo] for campo in ("sector", "riesgo", "red_social") if campo in consulta)
+            and c.gasto_promedio >= consulta.get("gasto_min", float("-inf"))
+            and c.gasto_promedio <= consulta.get("gasto_max", float("inf"))
+        ]
+        if "orden" in consulta:
+            campo = consulta["orden"].lstrip("-")
+            seleccion.sort(key=lambda c: getattr(c, campo))
+            if consulta["orden"].startswith("-"):
+                seleccion.reverse()
+        offset, limit = consulta.get("offset", 0), consulta.get("limit")
+        esperado = seleccion[offset:None if limit is None else offset + limit]
+
+        posiciones, total = store.consultar(**consulta)
+        assert total == len(seleccion)
+        assert store.materializar(posiciones) == esperado
+        assert store.filas(posiciones, ["id_cliente"]) == [{"id_cliente": c.id_cliente} for c in esperado]
+
+
+def test_cache_respuestas_etag_e_invalidacion():
+    """La caché reutiliza los bytes por clave y se vacía al cambiar la versión"""
+    cache = CacheRespuestas(max_entradas=2)
+    llamadas = []
+
+    def generar(valor):
+        return lambda: llamadas.append(valor) or {"valor": valor, "relleno": "x" * 2_000}
+
+    primera = cache.obtener("a", 1, generar(1))
+    assert cache.obtener("a", 1, generar(99)) is primera and llamadas == [1]
+    assert primera.cuerpo_gzip is not None
+    assert primera.coincide(primera.etag) and primera.coincide(f'"otro", W/{primera.etag}')
+    assert not primera.coincide('"otro"') and not primera.coincide(None)
+
+    # El cuerpo gzip tiene su propio ETag fuerte y gzip;q=0 significa "no"
+    assert primera.etag_gzip == primera.etag[:-1] + '-gz"'
+    assert primera.variante("gzip, deflate") == (primera.cuerpo_gzip, primera.etag_gzip, True)
+    assert primera.variante("br;q=1.0, *;q=0.5")[2] and primera.variante("GZIP;Q=0.8")[2]
+    for sin_gzip in (None, "", "identity", "gzip;q=0", "br, gzip; q=0.0", "*;q=0", "gzip;q=0, *"):
+        assert primera.variante(sin_gzip) == (primera.cuerpo, primera.etag, False), sin_gzip
+    assert primera.coincide(primera.etag_gzip, primera.etag_gzip)
+    assert not primera.coincide(primera.etag, primera.etag_gzip)
+    chica = RespuestaSerializada({"valor": 1})
+    assert chica.etag_gzip is None and chica.variante("gzip") == (chica.cuerpo, chica.etag, False)
+
+    cache.obtener("b", 1, generar(2))
+    cache.obtener("c", 1, generar(3))
+    assert cache.estadisticas()["entradas"] == 2
+
+    nueva = cache.obtener("a", 2, generar(4))
+    assert nueva is not primera and llamadas == [1, 2, 3, 4]
+    assert cache.estadisticas()["entradas"] == 1
+
+
+def test_store_recarga_incremental():
+    """La recarga cuenta cambios por id y reutiliza lo que no cambió"""
+    with tempfile.TemporaryDirectory() as tmp:
+        ruta = str(generar_csv_sintetico(Path(tmp) / "clientes.csv", 2_000))
+        columnas = leer_columnas_csv(ruta)
+    store = ClienteStore()
+    store.reemplazar_columnas(columnas)
+    version = store.version
+    datos = store._datos
+
+    resumen = store.recargar({c: v.copy() for c, v in columnas.items()})
+    assert (resumen["insertados"], resumen["actualizados"], resumen["eliminados"]) == (0, 0, 0)
+    assert store.version == version and store._datos is datos
+
+    # Solo cambia el gasto de una fila: se reutilizan ids y categorías
+    modificadas = {c: v.copy() for c, v in columnas.items()}
+    modificadas["gasto_promedio"][10] += 1
+    resumen = store.recargar(modificadas)
+    assert (resumen["insertados"], resumen["actualizados"], resumen["eliminados"]) == (0, 1, 0)
+    assert store.version == version + 1
+    assert store._datos.indice_id is datos.indice_id
+    assert store._datos.categorias["sector"] is datos.categorias["sector"]
+
+    # Se elimina la primera fila, se cambia un sector y se agrega un cliente nuevo
+    nuevas = {c: v[1:].copy() for c, v in columnas.items()}
+    nuevas["sector"][0] = "tech" if nuevas["sector"][0] != "tech" else "salud"
+    for campo, valor in [("id_cliente", "NUEVO"), ("nombre", "Nuevo"), ("sector", "retail"),
+                         ("gasto_promedio", 10.0), ("riesgo", "bajo"), ("red_social", "x")]:
+        nuevas[campo] = np.append(nuevas[campo], valor)
+    resumen = store.recargar(nuevas)
+    assert (resumen["insertados"], resumen["actualizados"], resumen["eliminados"]) == (1, 2, 1)
+    assert store.todos() == clientes_desde_columnas(nuevas)
+
+
+def test_segmentar_lote_equivale_a_segmentar():
+    """Propiedad: para entradas aleatorias (incluidos los umbrales exactos y
+    valores desconocidos) el lote da el mismo segmento que la ruta escalar"""
+    rng = np.random.default_rng(1234)
+    segmentador = Segmentador()
+    n = 20_000
+    gasto = np.where(
+        rng.random(n) < 0.3,
+        rng.choice([199.99, 200.0, 500.0, 500.01], n),
+        rng.uniform(0, 1_000, n).round(2)
+    )
+    engagement = np.where(
+        rng.random(n) < 0.3,
+        rng.choice([0.08, 0.0801, 0.0799], n),
+        rng.uniform(0, 0.2, n).round(3)
+    )
+    riesgos = rng.choice(["bajo", "medio", "alto", "Alto", "MEDIO", "desconocido"], n)
+    actividades = rng.choice(["alta", "media", "baja", "Alta", "nula"], n)
+
+    codigos = segmentador.segmentar_lote(
+        gasto,
+        codificar([r.lower() for r in riesgos], RIESGOS),
+        codificar(actividades.tolist(), ACTIVIDADES),
+        engagement
+    )
+    clientes, perfiles = [], []
+    for i in range(n):
+        cliente = Cliente(id_cliente=str(i), nombre="x", sector="retail", gasto_promedio=gasto[i],
+                          riesgo=riesgos[i], red_social="instagram")
+        perfil = PerfilSocial(id_cliente=str(i), red_social="instagram", señales=SeñalesSociales(
+            intereses=[], tono="casual", actividad=actividades[i],
+            engagement_promedio=engagement[i], frecuencia_publicacion="semanal"))
+        assert SEGMENTOS[codigos[i]] == segmentador.segmentar(cliente, perfil), (cliente, perfil)
+        clientes.append(cliente)
+        perfiles.append(perfil)
+    assert segmentador.segmentar_clientes(clientes, perfiles) == [SEGMENTOS[c] for c in codigos]
+
+
+def _segmentar_original(gasto, riesgo, actividad, engagement):
+    """Reglas tal como estaban escritas en el código antes de moverlas a JSON"""
+    riesgo = riesgo.lower()
+    if gasto > 500 and riesgo in ["bajo", "medio"] and actividad == "alta" and engagement > 0.08:
+        return Segmento.PREMIUM_ALTO_ENGAGEMENT
+    if riesgo == "alto":
+        return Segmento.RIESGO_ALTO
+    if 200 <= gasto <= 500 and riesgo in ["bajo", "medio"] and actividad in ["media", "baja"]:
+        return Segmento.MEDIO_CONSERVADOR
+    return Segmento.BASICO_CRECIMIENTO
+
+
+def _score_original(gasto, riesgo, actividad, engagement):
+    score = 50 + (25 if gasto > 500 else 15 if gasto > 200 else 5)
+    score += {"bajo": 15, "medio": 5}.get(riesgo.lower(), -10)
+    score += {"alta": 10, "media": 5}.get(actividad, 0)
+    score += 10 if engagement > 0.08 else 5 if engagement > 0.04 else 0
+    return max(0, min(100, score))
+
+
+def test_reglas_json_equivalen_a_las_originales():
+    """Las reglas por defecto reproducen la segmentación y el score hardcodeados"""
+    reglas = GestorReglas(str(RUTA_REGLAS_DEFAULT)).actual
+    rng = np.random.default_rng(99)
+    n = 5_000
+    gasto = rng.choice([0.0, 150.0, 199.99, 200.0, 200.01, 350.0, 500.0, 500.01, 900.0], n)
+    engagement = rng.choice([0.0, 0.04, 0.0401, 0.08, 0.0801, 0.12], n)
+    riesgos = rng.choice(["bajo", "medio", "alto", "Medio", "otro"], n).tolist()
+    actividades = rng.choice(["alta", "media", "baja", "Alta"], n).tolist()
+
+    codigos = reglas.segmentar_lote(
+        gasto, codificar([r.lower() for r in riesgos], RIESGOS), codificar(actividades, ACTIVIDADES), engagement
+    )
+    scores = reglas.puntuar_lote(
+        gasto, codificar([r.lower() for r in riesgos], RIESGOS), codificar(actividades, ACTIVIDADES), engagement
+    )
+    for i in range(n):
+        esperado = _segmentar_original(gasto[i], riesgos[i], actividades[i], engagement[i])
+        assert reglas.segmentar(gasto[i], riesgos[i].lower(), actividades[i], engagement[i]) == esperado
+        assert SEGMENTOS[codigos[i]] == esperado
+        score = _score_original(gasto[i], riesgos[i], actividades[i], engagement[i])
+        assert reglas.puntuar(gasto[i], riesgos[i].lower(), actividades[i], engagement[i]) == score
+        assert scores[i] == score
+
+
+def test_reglas_recarga_atomica():
+    """Recargar publica una versión nueva; un archivo inválido no cambia las vigentes"""
+    with tempfile.TemporaryDirectory() as tmp:
+        ruta = Path(tmp) / "reglas.json"
+        definicion = json.loads(RUTA_REGLAS_DEFAULT.read_text(encoding="utf-8"))
+        ruta.write_text(json.dumps(definicion), encoding="utf-8")
+        gestor = GestorReglas(str(ruta))
+        segmentador = Segmentador(gestor)
+        version = gestor.actual.version
+        cliente = Cliente(id_cliente="1", nombre="x", sector="retail", gasto_promedio=450.0,
+                          riesgo="bajo", red_social="instagram")
+        perfil = PerfilSocial(id_cliente="1", red_social="instagram", señales=SeñalesSociales(
+            intereses=[], tono="casual", actividad="alta", engagement_promedio=0.1,
+            frecuencia_publicacion="diaria"))
+        assert segmentador.segmentar(cliente, perfil) == Segmento.BASICO_CRECIMIENTO
+
+        definicion["segmentacion"]["reglas"][0]["condiciones"]["gasto"] = {"gt": 400}
+        ruta.write_text(json.dumps(definicion), encoding="utf-8")
+        gestor.recargar()
+        assert gestor.actual.version != version
+        assert segmentador.segmentar(cliente, perfil) == Segmento.PREMIUM_ALTO_ENGAGEMENT
+        assert gestor.obtener(version).segmentar(450.0, "bajo", "alta", 0.1) == Segmento.BASICO_CRECIMIENTO
+
+        nueva = gestor.actual.version
+        definicion["segmentacion"]["reglas"][0]["condiciones"]["riesgo"] = {"in": ["critico"]}
+        ruta.write_text(json.dumps(definicion), encoding="utf-8")
+        try:
+            gestor.recargar()
+            assert False, "Debió rechazar un valor de riesgo desconocido"
+        except ValueError:
+            pass
+        assert gestor.actual.version == nueva
+
+
+def test_perfiles_deterministicos_por_cliente():
+    """El perfil de un cliente depende solo de su id y la semilla, no del lote"""
+    with tempfile.TemporaryDirectory() as tmp:
+        ruta = str(generar_csv_sintetico(Path(tmp) / "clientes.csv", 3_000))
+        clientes = cargar_clientes_csv(ruta)
+
+    perfilador = PerfiladorSocialMock(seed=7)
+    perfiles = perfilador.generar_lote(clientes)
+    assert perfiles == PerfiladorSocialMock(seed=7).generar_lote(clientes)
+    assert perfiles[::-1] == perfilador.generar_lote(clientes[::-1])
+    assert perfiles[1234:1300] == perfilador.generar_lote(clientes[1234:1300])
+    assert perfiles[42] == perfilador.generar_señales(clientes[42])
+    assert perfiles != PerfiladorSocialMock(seed=8).generar_lote(clientes)
+
+    for cliente, perfil in zip(clientes, perfiles):
+        señales = perfil.señales
+        base = PerfiladorSocialMock.INTERESES_POR_SECTOR.get(cliente.sector.lower(), PerfiladorSocialMock.INTERESES_DEFAULT)
+        assert len(set(señales.intereses)) == min(3, len(base)) and set(señales.intereses) <= set(base)
+        assert señales.tono in PerfiladorSocialMock.TONOS_POR_RED.get(cliente.red_social.lower(), ["general"])
+        minimo, maximo = PerfiladorSocialMock.ENGAGEMENT_POR_ACTIVIDAD[señales.actividad]
+        assert minimo <= señales.engagement_promedio <= maximo
+        assert señales.frecuencia_publicacion in PerfiladorSocialMock.FRECUENCIAS_POR_ACTIVIDAD[señales.actividad]
+
+
+def test_cache_perfiles_ttl_lru_y_disco():
+    """La caché respeta TTL y tamaño, genera solo los faltantes y persiste en SQLite"""
+    clientes = cargar_clientes_csv(CSV_EJEMPLO)
+    perfilador = PerfiladorSocialMock(seed=3)
+    generados = []
+
+    def generar_lote(lote):
+        generados.append(len(lote))
+        return perfilador.generar_lote(lote)
+
+    ahora = [1000.0]
+    with tempfile.TemporaryDirectory() as tmp:
+        ruta = str(Path(tmp) / "perfiles.db")
+        cache = CachePerfiles(ttl_segundos=60, max_entradas=4, ruta_sqlite=ruta, reloj=lambda: ahora[0])
+
+        perfiles = cache.obtener_lote(clientes, generar_lote)
+        assert perfiles == perfilador.generar_lote(clientes) and generados == [len(clientes)]
+        assert cache.obtener_lote(clientes[-4:], generar_lote) == perfiles[-4:] and len(generados) == 1
+        stats = cache.estadisticas()
+        assert stats["entradas"] == 4 and stats["descartados"] == len(clientes) - 4 and stats["hits"] == 4
+
+        # Los descartados de memoria se recuperan del disco, también desde otra instancia
+        otra = CachePerfiles(ttl_segundos=60, max_entradas=4, ruta_sqlite=ruta, reloj=lambda: ahora[0])
+        assert otra.obtener_lote(clientes[:2], generar_lote) == perfiles[:2] and len(generados) == 1
+        assert otra.estadisticas()["hits_disco"] == 2
+
+        # Al vencer el TTL se regeneran en un solo lote
+        ahora[0] += 61
+        assert cache.obtener_lote(clientes, generar_lote) == perfiles
+        assert generados == [len(clientes), len(clientes)]
+        assert cache.estadisticas()["expirados"] == 4
+
+        # Si cambian los datos de un cliente (p.ej. tras recargar el CSV) su perfil se regenera
+        cambiado = clientes[0].model_copy(update={"gasto_promedio": clientes[0].gasto_promedio + 5_000})
+        nuevo = cache.obtener_lote([cambiado, clientes[-1]], generar_lote)
+        assert generados[-1] == 1 and nuevo == perfilador.generar_lote([cambiado, clientes[-1]])
+        assert nuevo[0] != perfiles[0]
+        otra.cerrar()
+        otra = CachePerfiles(ttl_segundos=60, max_entradas=4, ruta_sqlite=ruta, reloj=lambda: ahora[0])
+        assert otra.obtener_lote([cambiado], generar_lote) == nuevo[:1] and generados[-1] == 1
+        # En disco la fila del cliente se reemplazó: sus datos anteriores ya no tienen perfil
+        otra.obtener_lote([clientes[0]], generar_lote)
+        assert generados[-1] == 1 and len(generados) == 4
+
+        # Con otra semilla (u otro generador) los perfiles en disco no se reutilizan
+        otra.cerrar()
+        otra = CachePerfiles(ttl_segundos=60, ruta_sqlite=ruta, reloj=lambda: ahora[0], origen=origen_perfiles(7))
+        assert otra.origen != cache.origen == origen_perfiles()
+        assert otra.obtener_lote([cambiado], generar_lote) == nuevo[:1] and len(generados) == 5
+
+        # La versión async consulta y guarda (SQLite incluido) fuera del event loop
+        hilos = []
+        for nombre in ("obtener", "guardar"):
+            def registrar_hilo(*args, _original=getattr(cache, nombre)):
+                hilos.append(threading.current_thread())
+                return _original(*args)
+            setattr(cache, nombre, registrar_hilo)
+
+        async def generar_async(lote):
+            return generar_lote(lote)
+
+        ahora[0] += 61
+        assert asyncio.run(cache.obtener_lote_async(clientes, generar_async)) == perfiles
+        assert len(hilos) == len(clientes) + 1 and threading.main_thread() not in hilos
+
+        cacheado = PerfiladorCacheado(perfilador, CachePerfiles(ttl_segundos=0))
+        assert cacheado.generar_señales(clientes[0]) == perfiles[0]
+        assert cacheado.cache.estadisticas()["entradas"] == 0
+        otra.cerrar()
+        cache.cerrar()
+
+
+def test_proveedores_async_limites_y_stub_http():
+    """Los proveedores respetan la concurrencia, cortan por timeout y el stub HTTP equivale al mock"""
+    clientes = cargar_clientes_csv(CSV_EJEMPLO)
+    esperados = PerfiladorSocialMock().generar_lote(clientes)
+
+    # Un proveedor sin _solicitar no se puede instanciar
+    class ProveedorIncompleto(ProveedorBase):
+        nombre = "incompleto"
+    try:
+        ProveedorIncompleto()
+        assert False, "Debió exigir _solicitar"
+    except TypeError:
+        pass
+
+    class ProveedorContador(ProveedorMockAsync):
+        activos = maximo = 0
+
+        async def _solicitar(self, lote):
+            ProveedorContador.activos += 1
+            ProveedorContador.maximo = max(ProveedorContador.maximo, ProveedorContador.activos)
+            try:
+                return await super()._solicitar(lote)
+            finally:
+                ProveedorContador.activos -= 1
+
+    async def escenario():
+        proveedor = ProveedorContador(latencia_segundos=0.01, max_concurrencia=2, tamaño_lote=1)
+        assert await proveedor.obtener_perfiles(clientes) == esperados
+        assert ProveedorContador.maximo == 2 and proveedor.solicitudes == len(clientes)
+
+        # El mock (proveedor por defecto) genera los perfiles fuera del event loop
+        hilos = []
+
+        class PerfiladorHilos(PerfiladorSocialMock):
+            def generar_lote(self, lote):
+                hilos.append(threading.current_thread())
+                return super().generar_lote(lote)
+
+        mock = ProveedorMockAsync(perfilador=PerfiladorHilos(), tamaño_lote=4)
+        assert await mock.obtener_perfiles(clientes) == esperados
+        assert len(hilos) == 3 and threading.main_thread() not in hilos
+
+        lento = ProveedorMockAsync(latencia_segundos=0.5, timeout_segundos=0.01)
+        try:
+            await lento.obtener_perfiles(clientes[:1])
+            assert False, "Debió exceder el timeout"
+        except ErrorProveedor:
+            assert lento.timeouts == 1
+
+        stub = crear_app_stub(latencia_ms=1)
+        http = ProveedorHTTP("http://stub", transporte=httpx.ASGITransport(app=stub), tamaño_lote=3)
+        try:
+            assert await http.obtener_perfiles(clientes) == esperados
+            assert stub.state.solicitudes == 4
+        finally:
+            await http.cerrar()
+
+        fallando = ProveedorHTTP("http://stub", transporte=httpx.ASGITransport(app=crear_app_stub(0, tasa_error=1.0)))
+        try:
+            await fallando.obtener_perfiles(clientes)
+            assert False, "Debió propagar el error del stub"
+        except ErrorProveedor as e:
+            assert "503" in str(e)
+        finally:
+            await fallando.cerrar()
+
+    asyncio.run(escenario())
+
+
+def _estado_comparable(estado):
+    """Estado sin los campos que cambian entre ejecuciones (timestamps y métricas simuladas)"""
+    datos = estado.model_dump()
+    datos["logs"] = [(log["estado"], log["mensaje"]) for log in datos["logs"]]
+    if datos["resultado"]:
+        datos["resultado"].pop("métricas_simuladas")
+        datos["resultado"]["mensaje_json"].pop("timestamp", None)
+    return datos
+
+
+def test_ejecutar_lote_equivale_a_ejecutar():
+    """ejecutar_lote produce los mismos estados, logs y errores que ejecutar cliente a cliente"""
+    orquestador = OrquestadorAgente()
+    clientes = cargar_clientes_csv(CSV_EJEMPLO)
+    # Un cliente ausente en medio del lote no debe afectar a los demás
+    entrada = clientes[:4] + [None] + clientes[4:]
+
+    lote = orquestador.ejecutar_lote(entrada)
+    uno_a_uno = [orquestador.ejecutar(cliente) for cliente in entrada]
+    assert [_estado_comparable(e) for e in lote] == [_estado_comparable(e) for e in uno_a_uno]
+    assert lote[4].estado_actual.value == "ERROR" and lote[4].resultado is None
+    assert all(e.resultado is not None for i, e in enumerate(lote) if i != 4)
+
+    perfiles = PerfiladorSocialMock(seed=11).generar_lote(clientes)
+    for estado, perfil in zip(orquestador.ejecutar_lote(clientes, perfiles), perfiles):
+        assert estado.perfil_social == perfil
+
+
+def test_ruta_directa_equivale_al_grafo():
+    """Sin LLM, la ruta directa produce lo mismo que el grafo de LangGraph"""
+    directo = OrquestadorAgente()
+    grafo = OrquestadorAgente(ruta_directa=False)
+    assert directo.ruta_directa and not grafo.ruta_directa
+
+    clientes = cargar_clientes_csv(CSV_EJEMPLO) + [None]
+    for cliente in clientes:
+        assert _estado_comparable(directo.ejecutar(cliente)) == _estado_comparable(grafo.ejecutar(cliente))
+
+
+def test_orquestador_paralelo_equivale_a_ejecutar_lote():
+    """El pool de procesos devuelve los mismos estados que ejecutar_lote, por lotes terminados"""
+    store = ClienteStore(cargar_clientes_csv(CSV_EJEMPLO))
+    ids = [c.id_cliente for c in store.todos()] + ["NO_EXISTE"]
+    esperados = {e.cliente.id_cliente: _estado_comparable(e) for e in OrquestadorAgente().ejecutar_lote(store.todos())}
+
+    async def recolectar(paralelo):
+        lotes = [lote async for lote in paralelo.procesar(store, ids)]
+        return lotes
+
+    paralelo = OrquestadorParalelo(workers=2, tamaño_lote=3)
+    ruta_reglas = gestor_reglas.ruta
+    try:
+        lotes = asyncio.run(recolectar(paralelo))
+        # Los lotes llegan en el orden pedido aunque un worker termine antes
+        assert len(lotes) == 4 and [i for lote in lotes for i, _ in lote] == ids
+        estados = dict(par for lote in lotes for par in lote)
+        assert estados.pop("NO_EXISTE") is None
+        assert {i: _estado_comparable(e) for i, e in estados.items()} == esperados
+
+        # Un cambio en el almacén reinicia el pool con los datos nuevos
+        version = paralelo.estadisticas()["version_store"]
+        store.reemplazar(store.todos()[:2])
+        lotes = asyncio.run(recolectar(paralelo))
+        assert paralelo.estadisticas()["version_store"] == version + 1
+        assert sum(e is not None for lote in lotes for _, e in lote) == 2
+
+        # Con perfiles por lote: se piden lote a lote y el resultado no cambia
+        pedidos = []
+
+        async def obtener_perfiles(lote):
+            pedidos.append(list(lote))
+            return {c.id_cliente: c for c in PerfiladorSocialMock().generar_lote(
+                [store.obtener(i) for i in lote if store.obtener(i)])}
+
+        async def recolectar_por_lote():
+            return [lote async for lote in paralelo.procesar(store, ids, obtener_perfiles=obtener_perfiles)]
+
+        lotes = asyncio.run(recolectar_por_lote())
+        assert pedidos == [ids[i:i + 3] for i in range(0, len(ids), 3)]
+        assert [i for lote in lotes for i, _ in lote] == ids
+        assert sum(e is not None for lote in lotes for _, e in lote) == 2
+
+        # Recargar las reglas también reinicia el pool; dos sesiones concurrentes lo reinician una sola vez
+        with tempfile.TemporaryDirectory() as tmp:
+            ruta = Path(tmp) / "reglas.json"
+            definicion = json.loads(RUTA_REGLAS_DEFAULT.read_text(encoding="utf-8"))
+            definicion["version"] = "prueba-paralelo"
+            ruta.write_text(json.dumps(definicion), encoding="utf-8")
+            nueva = gestor_reglas.recargar(str(ruta)).version
+            reinicios = paralelo.estadisticas()["reinicios"]
+
+            async def dos_sesiones():
+                return await asyncio.gather(recolectar(paralelo), recolectar(paralelo))
+
+            for lotes in asyncio.run(dos_sesiones()):
+                estados = [e for lote in lotes for _, e in lote if e is not None]
+                assert len(estados) == 2 and {e.reglas_version for e in estados} == {nueva}
+            assert paralelo.estadisticas()["reinicios"] == reinicios + 1
+            assert paralelo.estadisticas()["version_reglas"] == nueva
+    finally:
+        gestor_reglas.recargar(str(ruta_reglas))
+        paralelo.cerrar()
+
+
+class _LLMFalso:
+    """
+    Modelo de chat falso: sugiere premium si el gasto es > 500 y responde algo
+    inválido en otro caso (el orquestador cae a reglas), tras una latencia.
+    Entiende también el prompt de varios clientes con respuesta JSON.
+    """
+
+    def __init__(self, latencia: float, ids_invalidos=()):
+        self.latencia = latencia
+        self.ids_invalidos = set(ids_invalidos)
+        self.llamadas = 0
+        self.lotes = []
+
+    @staticmethod
+    def _sugerencia(gasto: float) -> str:
+        return "premium_alto_engagement" if gasto > 500 else "no sé"
+
+    def _responder(self, mensajes):
+        self.llamadas += 1
+        prompt = mensajes[0].content
+        if "arreglo JSON" in prompt:
+            fichas = re.findall(r"\[\d+\] id: (\S+)\n(?:.*\n){2}Gasto promedio: \$([\d.]+)", prompt)
+            contenido = "```json\n" + json.dumps([
+                {"id": id_cliente, "segmento": "???" if id_cliente in self.ids_invalidos else self._sugerencia(float(gasto))}
+                for id_cliente, gasto in fichas
+            ]) + "\n```"
+        else:
+            gasto = float(prompt.split("Gasto promedio: $")[1].split("\n")[0])
+            contenido = " " + self._sugerencia(gasto).title() + "\n"
+        return type("Respuesta", (), {"content": contenido})()
+
+    def invoke(self, mensajes):
+        time.sleep(self.latencia)
+        return self._responder(mensajes)
+
+    async def ainvoke(self, mensajes):
+        await asyncio.sleep(self.latencia)
+        return self._responder(mensajes)
+
+    def batch(self, entradas, config=None, return_exceptions=False):
+        self.lotes.append((len(entradas), config["max_concurrency"]))
+        with ThreadPoolExecutor(config["max_concurrency"]) as pool:
+            return list(pool.map(self.invoke, entradas))
+
+    async def abatch(self, entradas, config=None, return_exceptions=False):
+        self.lotes.append((len(entradas), config["max_concurrency"]))
+        limite = asyncio.Semaphore(config["max_concurrency"])
+
+        async def llamar(mensajes):
+            async with limite:
+                return await self.ainvoke(mensajes)
+
+        return await asyncio.gather(*(llamar(m) for m in entradas))
+
+
+def test_ejecucion_async_no_bloquea_el_event_loop():
+    """La API async da los mismos estados que la síncrona sin bloquear el event loop"""
+    clientes = cargar_clientes_csv(CSV_EJEMPLO)
+    orquestador = OrquestadorAgente(ruta_directa=False)
+    orquestador.use_genai, orquestador.llm = True, _LLMFalso(latencia=0.2)
+    orquestador.cache_llm = CacheRespuestasLLM(ttl_segundos=0)
+    # La caché (y su capa SQLite) y las reglas se consultan en el pool de hilos, nunca en el loop
+    hilos = []
+    for nombre in ("obtener", "guardar"):
+        def registrar_hilo(*args, _original=getattr(orquestador.cache_llm, nombre)):
+            hilos.append(threading.current_thread().name)
+            return _original(*args)
+        setattr(orquestador.cache_llm, nombre, registrar_hilo)
+    iniciar_segmento = orquestador._iniciar_segmento
+    orquestador._iniciar_segmento = lambda estados: hilos.append(threading.current_thread().name) or iniciar_segmento(estados)
+
+    async def escenario():
+        pausas = []
+
+        async def latido():
+            while True:
+                inicio = time.perf_counter()
+                await asyncio.sleep(0.005)
+                pausas.append(time.perf_counter() - inicio)
+
+        tarea = asyncio.create_task(latido())
+        lote = await orquestador.ejecutar_lote_async(clientes)
+        uno = await orquestador.ejecutar_async(clientes[1])
+        tarea.cancel()
+        return lote, uno, max(pausas)
+
+    # Que una recolección completa pendiente de pruebas anteriores no caiga en la medición
+    gc.collect()
+    inicio = time.perf_counter()
+    lote, uno, pausa_maxima = asyncio.run(escenario())
+    # Las llamadas al LLM del lote van en paralelo y el loop sigue atendiendo
+    assert time.perf_counter() - inicio < 0.2 * len(clientes) / 2
+    assert pausa_maxima < 0.1
+    assert orquestador.llm.llamadas == len(clientes) + 1
+    assert hilos and all(nombre.startswith("agente") for nombre in hilos), set(hilos)
+
+    sincronos = [orquestador.ejecutar(c) for c in clientes]
+    assert [_estado_comparable(e) for e in lote] == [_estado_comparable(e) for e in sincronos]
+    assert _estado_comparable(uno) == _estado_comparable(sincronos[1])
+    assert any("GenAI sugirió" in log["mensaje"] for log in uno.logs + lote[0].logs)
+
+
+def test_segmentacion_genai_por_lotes_y_json():
+    """El lote usa llm.batch; en modo JSON agrupa clientes y cae a reglas por cliente"""
+    clientes = cargar_clientes_csv(CSV_EJEMPLO)
+    referencia = OrquestadorAgente(ruta_directa=False)
+    referencia.use_genai, referencia.llm = True, _LLMFalso(latencia=0)
+    referencia.cache_llm = CacheRespuestasLLM(ttl_segundos=0)
+    esperados = [_estado_comparable(referencia.ejecutar(c)) for c in clientes]
+
+    orquestador = OrquestadorAgente(ruta_directa=False)
+    orquestador.use_genai, orquestador.llm = True, _LLMFalso(latencia=0.01)
+    orquestador.cache_llm = CacheRespuestasLLM(ttl_segundos=0)
+    orquestador.max_concurrencia_llm = 3
+    assert [_estado_comparable(e) for e in orquestador.ejecutar_lote(clientes)] == esperados
+    assert orquestador.llm.lotes == [(len(clientes), 3)]
+
+    # Varios clientes por prompt: una respuesta JSON por grupo
+    premium = [c.id_cliente for c in clientes if c.gasto_promedio > 500]
+    orquestador.clientes_por_prompt = 4
+    orquestador.llm = _LLMFalso(latencia=0.01, ids_invalidos=premium[:1])
+    estados = asyncio.run(orquestador.ejecutar_lote_async(clientes))
+    assert orquestador.llm.llamadas == -(-len(clientes) // 4)
+    for estado, esperado in zip(estados, esperados):
+        if estado.cliente.id_cliente == premium[0]:
+            # Respuesta inválida solo para este cliente: fallback a reglas
+            assert any("GenAI no pudo determinar" in log["mensaje"] for log in estado.logs)
+            assert estado.segmento == orquestador.segmentador.segmentar(estado.cliente, estado.perfil_social)
+        else:
+            assert _estado_comparable(estado) == esperado
+
+
+def test_cache_llm_evita_llamadas_repetidas():
+    """La segunda corrida sale de la caché (memoria o disco) y da los mismos estados"""
+    clientes = cargar_clientes_csv(CSV_EJEMPLO)
+    with tempfile.TemporaryDirectory() as tmp:
+        ruta = str(Path(tmp) / "llm.sqlite")
+        ahora = [1000.0]
+        orquestador = OrquestadorAgente(ruta_directa=False)
+        orquestador.use_genai, orquestador.llm = True, _LLMFalso(latencia=0)
+        orquestador.cache_llm = CacheRespuestasLLM(ttl_segundos=60, ruta_sqlite=ruta, reloj=lambda: ahora[0])
+        primera = [_estado_comparable(e) for e in orquestador.ejecutar_lote(clientes)]
+        llamadas = orquestador.llm.llamadas
+        # Solo se guardan las respuestas válidas (premium); el resto se vuelve a consultar
+        validas = sum(c.gasto_promedio > 500 for c in clientes)
+        assert 0 < validas < llamadas == len(clientes)
+
+        assert [_estado_comparable(e) for e in orquestador.ejecutar_lote(clientes)] == primera
+        assert _estado_comparable(orquestador.ejecutar(clientes[0])) == primera[0]
+        assert orquestador.llm.llamadas - llamadas == len(clientes) - validas + (clientes[0].gasto_promedio <= 500)
+        assert orquestador.cache_llm.estadisticas()["hits"] >= validas
+
+        # Otro proceso con la misma base SQLite no vuelve a consultar al LLM
+        otra = CacheRespuestasLLM(ttl_segundos=60, ruta_sqlite=ruta, reloj=lambda: ahora[0])
+        premium = next(c for c in clientes if c.gasto_promedio > 500)
+        clave = clave_llm(premium, orquestador.perfilador.generar_señales(premium), "_LLMFalso")
+        assert otra.obtener(clave) == "premium_alto_engagement"
+        assert otra.estadisticas()["hits_disco"] == 1
+
+        # La clave ignora nombre y diferencias de formato; el modelo y el prompt sí cuentan
+        perfil = orquestador.perfilador.generar_señales(premium)
+        parecido = premium.model_copy(update={"nombre": "Otro", "sector": f" {premium.sector.upper()} "})
+        assert clave_llm(parecido, perfil, "_LLMFalso") == clave
+        assert clave_llm(premium, perfil, "otro-modelo") != clave
+        assert clave_llm(premium, perfil, "_LLMFalso", "segmento-v2") != clave
+
+        # Vencido el TTL se vuelve a consultar
+        ahora[0] += 61
+        orquestador.llm.llamadas = 0
+        orquestador.ejecutar_lote(clientes)
+        assert orquestador.llm.llamadas == len(clientes)
+        orquestador.cache_llm.cerrar()
+        otra.cerrar()
+
+
+def test_planificador_llm_limites_429_y_uso_por_sesion():
+    """RPM/TPM con deadline, reintentos ante 429 y tokens por sesión con el modelo falso"""
+    ahora = [0.0]
+    bucket = BucketMinuto(60, reloj=lambda: ahora[0])
+    assert [bucket.reservar(1, limite=10) for _ in range(60)] == [0.0] * 60
+    assert bucket.reservar(1, limite=10) == 1.0 and bucket.reservar(1, limite=10) == 2.0
+    try:
+        bucket.reservar(1, limite=2)
+        assert False, "Debió rechazar por deadline"
+    except ErrorPlanificador:
+        pass
+    ahora[0] += 3  # Sin la reserva rechazada la cola se vacía en 3 s
+    assert bucket.reservar(1, limite=10) == 0.0
+
+    # Repartido entre 4 workers, cada uno admite la cuarta parte por minuto
+    repartido = PlanificadorLLM(rpm=60, tpm=4000, reloj=lambda: ahora[0])
+    repartido.repartir(4)
+    assert repartido.estadisticas()["rpm"] == 15 and repartido.estadisticas()["tpm"] == 1000
+    assert [repartido.rpm.reservar(1, limite=ahora[0] + 10) for _ in range(15)] == [0.0] * 15
+    assert repartido.rpm.reservar(1, limite=ahora[0] + 10) == 4.0
+
+    clientes = cargar_clientes_csv(CSV_EJEMPLO)
+    modelo = ChatFalso(latencia_segundos=0.01, tasa_error=0.3, semilla=7)
+    planificador = PlanificadorLLM(reintentos=10, backoff_segundos=0.001, deadline_segundos=5)
+    orquestador = OrquestadorAgente(ruta_directa=False)
+    orquestador.use_genai, orquestador.llm = True, LLMPlanificado(modelo, planificador)
+    orquestador.cache_llm = CacheRespuestasLLM(ttl_segundos=0)
+
+    async def sesion(nombre):
+        sesion_llm.set(nombre)
+        return await orquestador.ejecutar_lote_async(clientes)
+
+    estados = asyncio.run(sesion("s1"))
+    orquestador.ejecutar_lote(clientes)  # Fuera de una sesión solo cuenta en el total
+    # Con reintentos suficientes ningún 429 llega al nodo: el modelo falso responde como las reglas
+    assert all(any("GenAI sugirió" in log["mensaje"] for log in e.logs) for e in estados)
+    assert [e.segmento for e in estados] == [e.segmento for e in OrquestadorAgente().ejecutar_lote(clientes)]
+    uso, total = planificador.uso_sesion("s1"), planificador.estadisticas()
+    assert uso["solicitudes"] == len(clientes) and uso["reintentos_429"] > 0
+    assert uso["tokens_total"] == uso["tokens_entrada"] + uso["tokens_salida"] > 0
+    assert total["solicitudes"] == 2 * len(clientes) and total["en_cola"] == 0
+    assert modelo.llamadas == total["solicitudes"] + total["reintentos_429"]
+    assert planificador.uso_sesion("otra")["solicitudes"] == 0
+
+    # Sin reintentos el 429 termina en el fallback a reglas, con el tipo de error en el log
+    planificador.reintentos = 0
+    estados = orquestador.ejecutar_lote(clientes)
+    assert any("ErrorLimiteFalso" in log["mensaje"] for e in estados for log in e.logs)
+    assert planificador.estadisticas()["errores"] > 0
+
+
+def test_segmentacion_especulativa_reglas_primero():
+    """Solo van al LLM los clientes cerca de un umbral; el resto usa las reglas al instante"""
+    clientes = cargar_clientes_csv(CSV_EJEMPLO)
+    perfiles = PerfiladorSocialMock().generar_lote(clientes)
+    segmentador = Segmentador()
+    por_reglas, confianza = segmentador.segmentar_con_confianza(clientes, perfiles)
+    assert por_reglas == segmentador.segmentar_clientes(clientes, perfiles)
+    for cliente, perfil, segmento, distancia in zip(clientes, perfiles, por_reglas, confianza):
+        if cliente.riesgo == "alto":
+            assert np.isinf(distancia)
+        # Mover el gasto menos que la distancia (relativa al menor umbral de gasto, 200) no cambia el segmento
+        paso = distancia * 0.99 * 200 if np.isfinite(distancia) else 10_000
+        for gasto in (cliente.gasto_promedio - paso, cliente.gasto_promedio + paso):
+            movido = cliente.model_copy(update={"gasto_promedio": gasto})
+            assert segmentador.segmentar(movido, perfil) == segmento
+
+    margen = 0.15
+    dudosos = {c.id_cliente for c, d in zip(clientes, confianza) if d < margen}
+    assert 0 < len(dudosos) < len(clientes)
+    orquestador = OrquestadorAgente(ruta_directa=False)
+    orquestador.use_genai, orquestador.llm = True, _LLMFalso(latencia=0.01)
+    orquestador.cache_llm = CacheRespuestasLLM(ttl_segundos=0)
+    orquestador.margen_confianza = margen
+    for estados in (orquestador.ejecutar_lote(clientes), asyncio.run(orquestador.ejecutar_lote_async(clientes))):
+        for estado, segmento in zip(estados, por_reglas):
+            mensajes = " ".join(log["mensaje"] for log in estado.logs)
+            if estado.cliente.id_cliente in dudosos:
+                assert "se omite GenAI" not in mensajes and "GenAI" in mensajes
+            else:
+                assert "se omite GenAI" in mensajes and estado.segmento == segmento
+    assert orquestador.llm.llamadas == 2 * len(dudosos)
+    # Con un solo cliente dudoso se usa la llamada individual
+    assert orquestador.ejecutar(next(c for c in clientes if c.id_cliente in dudosos)).segmento is not None
+    assert orquestador.llm.llamadas == 2 * len(dudosos) + 1
+
+    stats = orquestador.estadisticas_especulacion()
+    assert stats["clientes"] == 2 * len(clientes) + 1 and stats["con_llm"] == 2 * len(dudosos) + 1
+    assert stats["sin_llm"] == 2 * (len(clientes) - len(dudosos))
+    assert stats["latencia_llm_promedio"] >= 0.01 and stats["latencia_ahorrada_segundos"] > 0
+
+
+def test_metricas_latencia_por_nodo():
+    """Percentiles del histograma y registro por nodo, con LLM y fallback por separado"""
+    histograma = HistogramaLatencia()
+    muestras = np.random.default_rng(3).lognormal(mean=-6, sigma=1.5, size=5_000)
+    for segundos in muestras:
+        histograma.registrar(float(segundos))
+    for p in (50, 95, 99):
+        # Cubetas geométricas de factor 1.15: error relativo acotado
+        assert abs(histograma.percentil(p) / np.percentile(muestras, p) - 1) < 0.15
+    assert histograma.resumen()["clientes"] == len(muestras)
+
+    clientes = cargar_clientes_csv(CSV_EJEMPLO)
+    orquestador = OrquestadorAgente(ruta_directa=False)
+    orquestador.metricas = MetricasNodos()
+    orquestador.ejecutar_lote(clientes)
+    orquestador.ejecutar(clientes[0])
+    resumen = orquestador.metricas.resumen()
+    assert list(resumen) == list(NODOS)
+    for nodo in ("INGESTA", "PERFIL", "SEGMENTO", "CAMPAÑA", "SALIDA"):
+        assert resumen[nodo]["clientes"] == len(clientes) + 1 and resumen[nodo]["p99_ms"] > 0
+    assert resumen["SEGMENTO_LLM"]["clientes"] == resumen["SEGMENTO_FALLBACK"]["clientes"] == 0
+
+    # Con GenAI: la espera del LLM y el fallback a reglas (respuestas inválidas) se miden aparte
+    orquestador.metricas.reiniciar()
+    orquestador.use_genai, orquestador.llm = True, _LLMFalso(latencia=0.02)
+    orquestador.cache_llm = CacheRespuestasLLM(ttl_segundos=0)
+    asyncio.run(orquestador.ejecutar_lote_async(clientes))
+    resumen = orquestador.metricas.resumen()
+    assert resumen["SEGMENTO"]["clientes"] == resumen["SEGMENTO_LLM"]["clientes"] == len(clientes)
+    assert resumen["SEGMENTO_FALLBACK"]["clientes"] == sum(c.gasto_promedio <= 500 for c in clientes)
+    assert resumen["SEGMENTO_LLM"]["p50_ms"] >= 20 * 0.9
+    assert resumen["SEGMENTO"]["p50_ms"] >= resumen["SEGMENTO_LLM"]["p50_ms"] * 0.9
+
+
+def test_bitacora_eventos_formateo_diferido():
+    """Los eventos se guardan crudos y al leerlos dan los mismos logs que antes"""
+    bitacora = BitacoraEventos(capacidad=2)
+    bitacora.registrar(Estado.INGESTA, Plantilla.PROCESANDO_CLIENTE, "C001")
+    bitacora.registrar(Estado.SEGMENTO, Plantilla.GENAI_OMITIDO_MARGEN, 0.254)
+    bitacora.append({"estado": "ERROR", "mensaje": "externo", "timestamp": "2024-01-01T00:00:00", "data": {"x": 1}})
+    assert len(bitacora) == 3 and not isinstance(next(bitacora.eventos())[3][0], dict)
+    assert [log["mensaje"] for log in bitacora] == [
+        "Procesando cliente: C001", "Reglas a 25% del umbral más cercano, se omite GenAI", "externo"
+    ]
+    assert bitacora[0]["estado"] == "INGESTA" and bitacora[-1]["data"] == {"x": 1}
+    assert bitacora[-2:] == bitacora.como_logs()[-2:] and bitacora[::2] == bitacora.como_logs()[::2]
+    assert bitacora[5:] == []
+    assert abs(datetime.fromisoformat(bitacora[0]["timestamp"]).timestamp() - time.time()) < 5
+    # Una bitácora que viaja entre procesos conserva su propio desfase de reloj
+    assert pickle.loads(pickle.dumps(bitacora)).como_logs() == bitacora.como_logs()
+
+    clientes = cargar_clientes_csv(CSV_EJEMPLO)
+    orquestador = OrquestadorAgente(use_genai=False)
+    estado = orquestador.ejecutar(clientes[0])
+    assert isinstance(estado.logs, BitacoraEventos)
+    assert [log["mensaje"] for log in estado.logs][-1] == "Resultado generado exitosamente"
+    assert EstadoAgente.model_validate(estado.model_dump()).logs.como_logs() == estado.model_dump()["logs"]
+
+    # La API de resultados y el stream SSE reciben LogEntry ya formateados; el estado no cambia
+    resultado = estado_to_agent_result(estado, "s1", orquestador.decisor.obtener_mensaje_base(estado.segmento))
+    logs_api = json.loads(resultado.model_dump_json())["logs"]
+    assert logs_api[-1]["state"] == "FIN" and len(logs_api) == len(estado.logs) + 1
+    assert set(logs_api[0]) == {"state", "timestamp", "message", "data"}
+    esquema = AgentResult.model_json_schema(mode="serialization")
+    assert esquema["properties"]["logs"]["items"] == {"$ref": "#/$defs/LogEntry"}
+    sesiones = SessionManager()
+    sesion = sesiones.create_session([clientes[0].id_cliente])
+    sesiones.add_bitacora(sesion, estado.logs)
+    assert sesiones.get_logs(sesion) == logs_api[:-1]
+
+
+def test_errores_saltan_al_nodo_de_error():
+    """Un cliente que falla deja de recorrer nodos, igual en grafo, ruta directa y lotes"""
+    clientes = cargar_clientes_csv(CSV_EJEMPLO)
+    orquestadores = [OrquestadorAgente(), OrquestadorAgente(ruta_directa=False)]
+    for orquestador in orquestadores:
+        orquestador.metricas = MetricasNodos()
+        seleccionar = orquestador.decisor.seleccionar_campaña
+
+        def falla_en_premium(segmento, seleccionar=seleccionar):
+            if segmento == Segmento.PREMIUM_ALTO_ENGAGEMENT:
+                raise RuntimeError("plantilla rota")
+            return seleccionar(segmento)
+        orquestador.decisor.seleccionar_campaña = falla_en_premium
+
+    directo, grafo = orquestadores
+    entrada = clientes + [None]
+    lote = directo.ejecutar_lote(entrada)
+    uno_a_uno = [grafo.ejecutar(cliente) for cliente in entrada]
+    assert [_estado_comparable(e) for e in lote] == [_estado_comparable(e) for e in uno_a_uno]
+
+    fallidos = [e for e in lote if e.estado_actual == Estado.ERROR]
+    assert len(fallidos) == 1 + sum(e.segmento == Segmento.PREMIUM_ALTO_ENGAGEMENT for e in fallidos) > 1
+    for estado in fallidos:
+        estados_log = [log["estado"] for log in estado.logs]
+        assert estados_log[-1] == "ERROR" and estados_log.count("ERROR") == 1 and "SALIDA" not in estados_log
+        assert estado.resultado is None and estado.logs[-1]["mensaje"] == f"Error: {estado.error}"
+        assert estado.nodo_error == (Estado.INGESTA if estado.cliente is None else Estado.CAMPAÑA)
+
+    for orquestador in orquestadores:
+        errores = orquestador.metricas.resumen_errores()
+        campaña = len(fallidos) - 1
+        assert errores["por_nodo"] == {"INGESTA": 1, "CAMPAÑA": campaña}
+        assert errores["nodos_omitidos"] == 4 + campaña
+        assert errores["nodos_desperdiciados"] == 1 + 4 * campaña
+        resumen = orquestador.metricas.resumen()
+        assert resumen["CAMPAÑA"]["errores"] == campaña
+        assert resumen["SALIDA"]["clientes"] == len(clientes) - campaña
+
+    # El lote async con LLM sigue el mismo corte
+    directo.use_genai, directo.llm = True, _LLMFalso(latencia=0)
+    directo.cache_llm = CacheRespuestasLLM(ttl_segundos=0)
+    asincrono = asyncio.run(directo.ejecutar_lote_async(entrada))
+    assert [(e.estado_actual, e.nodo_error) for e in asincrono] == [(e.estado_actual, e.nodo_error) for e in lote]
+
+    # cerrar() detiene los hilos que dejó la API asíncrona
+    hilos = list(directo._hilos._threads)
+    assert hilos and all(h.is_alive() for h in hilos)
+    directo.cerrar()
+    assert not any(h.is_alive() for h in hilos)
+
+
+def test_checkpoints_de_sesion_por_lotes_y_reanudacion():
+    """El progreso se escribe por lotes y sobrevive a un reinicio: solo quedan pendientes los que faltan"""
+    clientes = cargar_clientes_csv(CSV_EJEMPLO)
+    orquestador = OrquestadorAgente()
+    estados = orquestador.ejecutar_lote(clientes)
+    resultados = [
+        estado_to_agent_result(estado, "s1", orquestador.decisor.obtener_mensaje_base(estado.segmento))
+        for estado in estados
+    ]
+    ids = [c.id_cliente for c in clientes] + ["NO_EXISTE"]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        ruta = str(Path(tmp) / "sesiones.db")
+        ahora = [0.0]
+        almacen = AlmacenCheckpoints(ruta, lote_escritura=3, intervalo_segundos=10, reloj=lambda: ahora[0])
+        almacen.crear_sesion("s1", ids)
+        almacen.registrar("s1", ids[0], resultados[0])
+        almacen.registrar("s1", ids[1], resultados[1])
+        assert not almacen.debe_vaciar()
+        ahora[0] = 11
+        assert almacen.debe_vaciar()
+        almacen.registrar("s1", "NO_EXISTE", None)
+        almacen.vaciar()
+        # Sin vaciar, lo último registrado se pierde con el proceso y se vuelve a procesar
+        almacen.registrar("s1", ids[2], resultados[2])
+        assert almacen.estadisticas()["escrituras"] == 1 and almacen.estadisticas()["filas_escritas"] == 3
+
+        reiniciado = AlmacenCheckpoints(ruta)
+        assert reiniciado.sesiones_incompletas() == ["s1"]
+        checkpoint = reiniciado.cargar("s1")
+        assert checkpoint["client_ids"] == ids and checkpoint["terminados"] == 3
+        assert checkpoint["pendientes"] == ids[2:-1]
+        assert [r.model_dump() for r in checkpoint["resultados"]] == [r.model_dump() for r in resultados[:2]]
+
+        for client_id, resultado in zip(ids[2:], resultados[2:]):
+            reiniciado.registrar("s1", client_id, resultado)
+        reiniciado.completar("s1")
+        assert reiniciado.sesiones_incompletas() == [] and reiniciado.cargar("s1")["pendientes"] == []
+        assert len(reiniciado.cargar("s1")["resultados"]) == len(clientes)
+
+        # Mientras un vaciar serializa y escribe, registrar no queda bloqueado
+        serializando, seguir = threading.Event(), threading.Event()
+
+        class ResultadoLento:
+            def model_dump_json(self):
+                serializando.set()
+                seguir.wait(5)
+                return resultados[0].model_dump_json()
+
+        reiniciado.registrar("s3", ids[0], ResultadoLento())
+        escritor = threading.Thread(target=reiniciado.vaciar)
+        escritor.start()
+        assert serializando.wait(5)
+        inicio = time.perf_counter()
+        reiniciado.registrar("s3", ids[1], resultados[1])
+        assert time.perf_counter() - inicio < 0.5 and reiniciado.estadisticas()["pendientes"] == 1
+        seguir.set()
+        escritor.join()
+        almacen.cerrar()
+        reiniciado.cerrar()
+
+    # Sin SESIONES_SQLITE todo es un no-op
+    desactivado = AlmacenCheckpoints()
+    desactivado.crear_sesion("s2", ids)
+    desactivado.registrar("s2", ids[0], resultados[0])
+    assert not desactivado.debe_vaciar() and desactivado.cargar("s2") is None
+
+
+def test_perfiles_de_la_sesion_se_piden_por_lote():
+    """Cada lote espera solo sus perfiles; los del siguiente se piden mientras se procesa el actual"""
+    from app import main as servidor
+
+    clientes = cargar_clientes_csv(CSV_EJEMPLO)
+    eventos = []
+
+    async def obtener_perfiles_async(lote):
+        eventos.append(("pide", [c.id_cliente for c in lote]))
+        await asyncio.sleep(0.001)
+        return {p.id_cliente: p for p in PerfiladorSocialMock().generar_lote(lote)}
+
+    async def recorrer():
+        lotes = [clientes[i:i + 4] for i in range(0, len(clientes), 4)]
+        async for lote, perfiles in servidor.lotes_con_perfiles(lotes, lambda lote: lote):
+            assert list(perfiles) == [c.id_cliente for c in lote]
+            eventos.append(("procesa", [c.id_cliente for c in lote]))
+            await asyncio.sleep(0.01)
+            eventos.append(("listo", [c.id_cliente for c in lote]))
+
+    anterior = servidor.obtener_perfiles_async
+    servidor.obtener_perfiles_async = obtener_perfiles_async
+    try:
+        asyncio.run(recorrer())
+    finally:
+        servidor.obtener_perfiles_async = anterior
+    ids = [c.id_cliente for c in clientes]
+    lotes = [ids[i:i + 4] for i in range(0, len(ids), 4)]
+    # Los perfiles de cada lote se piden mientras se procesa el anterior, nunca todos al principio
+    assert eventos == [
+        ("pide", lotes[0]), ("procesa", lotes[0]), ("pide", lotes[1]), ("listo", lotes[0]),
+        ("procesa", lotes[1]), ("pide", lotes[2]), ("listo", lotes[1]),
+        ("procesa", lotes[2]), ("listo", lotes[2])
+    ]
+
+
+def test_endpoint_reanudar_sesion_no_duplica_trabajo():
+    """Dos reanudaciones simultáneas de la misma sesión: una la retoma y la otra recibe 409"""
+    from app import main as servidor
+
+    clientes = cargar_clientes_csv(CSV_EJEMPLO)
+    ids = [c.id_cliente for c in clientes]
+
+    class AlmacenLento(AlmacenCheckpoints):
+        def cargar(self, session_id):
+            time.sleep(0.2)  # Deja a la otra solicitud entrar mientras se lee el checkpoint
+            return super().cargar(session_id)
+
+    async def reanudar_dos_veces():
+        transporte = httpx.ASGITransport(app=servidor.app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://test") as cliente:
+            respuestas = await asyncio.gather(
+                cliente.post("/api/agente/reanudar/s1"), cliente.post("/api/agente/reanudar/s1")
+            )
+            no_existe = await cliente.post("/api/agente/reanudar/otra")
+            for _ in range(200):
+                if servidor.session_manager.get_session("s1")["status"] == "completed":
+                    break
+                await asyncio.sleep(0.05)
+        return respuestas, no_existe
+
+    anterior = servidor.almacen_checkpoints, servidor.proveedor_perfiles
+    with tempfile.TemporaryDirectory() as tmp:
+        almacen = AlmacenLento(str(Path(tmp) / "sesiones.db"))
+        almacen.crear_sesion("s1", ids)
+        servidor.almacen_checkpoints = almacen
+        servidor.proveedor_perfiles = ProveedorMockAsync()
+        servidor.clientes_store.reemplazar(clientes)
+        try:
+            respuestas, no_existe = asyncio.run(reanudar_dos_veces())
+            assert sorted(r.status_code for r in respuestas) == [200, 409] and no_existe.status_code == 404
+            assert servidor.session_manager.get_session("s1")["status"] == "completed"
+            # Cada cliente se procesó una sola vez
+            assert sorted(r.cliente.id_cliente for r in servidor.session_manager.get_results("s1")) == sorted(ids)
+            assert almacen.sesiones_incompletas() == [] and almacen.cargar("s1")["pendientes"] == []
+            assert not servidor.sesiones_reanudando
+        finally:
+            servidor.almacen_checkpoints, servidor.proveedor_perfiles = anterior
+            almacen.cerrar()
+
+
+def main():
+    pruebas = [(nombre, funcion) for nombre, funcion in globals().items() if nombre.startswith("test_")]
+    fallidas = 0
+    for nombre, funcion in pruebas:
+        try:
+            funcion()
+            print(f"✅ {nombre}")
+        except Exception as e:
+            fallidas += 1
+            print(f"❌ {nombre}: {e!r}")
+    print(f"\n{len(pruebas) - fallidas}/{len(pruebas)} pruebas correctas")
+    return 1 if fallidas else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())